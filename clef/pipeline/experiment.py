@@ -64,6 +64,7 @@ root_path = '../../' # path to github repository root level (where setup.py is l
 json_data_filepath = os.path.join(root_path, 'clef2024-checkthat-lab', 'task5', 'data', 'English_dev.json')
 
 golden_labels_file = os.path.join(root_path, 'clef2024-checkthat-lab', 'task5', 'data', 'dev_qrels.txt')
+dataset_cache_dir = './data-out/dataset-cache' # see AuredDataset(cache_dir=...)
 
 configs_retrieval = []
 configs_judge = []
@@ -108,13 +109,16 @@ for norm in [True, False]:
 
 if __name__ == '__main__':
 
+    # build all formatting variants of the dataset in one pass, the retrievers only read from them
+    datasets = AuredDataset.build_variants(json_data_filepath, [(c['preprocess'], c['add_author_name'], c['add_author_bio']) for c in configs_retrieval], blind_run=False)
+
     for config in configs_retrieval:
         with open(os.path.join(config['out_dir'], 'config.json'), 'w') as f:
             f.write(json.dumps(config, indent=4))
 
         setup_logging(config['out_dir'])
             
-        ds = AuredDataset(json_data_filepath, **config)
+        ds = datasets[(config['preprocess'], config['add_author_name'], config['add_author_bio'])]
 
         step_retrieval(ds=ds, config=config, golden_labels_file=golden_labels_file)
     
@@ -144,7 +148,7 @@ if __name__ == '__main__':
                 from clef.verification.models.open_ai import OpenaiVerifier
                 verifier = OpenaiVerifier()
             
-            ds = AuredDataset(json_data_filepath, **best_config)
+            ds = AuredDataset(json_data_filepath, cache_dir=dataset_cache_dir, **best_config)
 
             trec_filepath = f'{best_config["out_dir"]}/{best_config["retriever_label"]}-{best_config["split"]}.trec.txt'
             ds.add_trec_file_judgements(trec_filepath, sep=' ', normalize_scores=False) # scores are not used at this point
@@ -157,7 +161,7 @@ if __name__ == '__main__':
                     **c,
                 }
 
-                ds = AuredDataset(json_data_filepath, **config_jdg)
+                ds = AuredDataset(json_data_filepath, cache_dir=dataset_cache_dir, **config_jdg)
 
                 trec_filepath = f'{config_jdg["out_dir"]}/{config_jdg["retriever_label"]}-{config_jdg["split"]}.trec.txt'
                 ds.add_trec_file_judgements(trec_filepath, sep=' ', normalize_scores=config_jdg['normalize_scores'])
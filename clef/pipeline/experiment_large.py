@@ -52,6 +52,7 @@ split = 'dev'
 experiment_base_path = f'./experiments-data-temp/split-{split}' 
 json_data_filepath = os.path.join(root_path, 'clef2024-checkthat-lab', 'task5', 'data', f'English_{split}.json')
 golden_labels_file = os.path.join(root_path, 'clef2024-checkthat-lab', 'task5', 'data', f'{split}_qrels.txt')
+dataset_cache_dir = f'{experiment_base_path}/dataset-cache' # see AuredDataset(cache_dir=...)
 
 # Create retrieval configurations
 configs_retrieval = []
@@ -119,13 +120,16 @@ if __name__ == '__main__':
     
     skip_retrieval = False # set to True to skip retrieval steps
     if not skip_retrieval:
+        # Build every formatting variant of the dataset in a single pass, the retrievers only read from them
+        datasets = AuredDataset.build_variants(json_data_filepath, [(c['preprocess'], c['add_author_name'], c['add_author_bio']) for c in configs_retrieval], blind_run=False)
+
         # Execute retrieval steps
         for config in configs_retrieval:
             with open(os.path.join(config['out_dir'], 'config.json'), 'w') as f:
                 f.write(json.dumps(config, indent=4))
 
             setup_logging(config['out_dir'])
-            ds = AuredDataset(json_data_filepath, **config)
+            ds = datasets[(config['preprocess'], config['add_author_name'], config['add_author_bio'])]
             step_retrieval(ds=ds, config=config, golden_labels_file=golden_labels_file)
     
     skip_verification = True
@@ -171,7 +175,7 @@ if __name__ == '__main__':
 
             # create the dataset, add the judgements, and run the verification with the chosen verifier
             # only do this once since we can reuse the predictions as we only want to test the judge later
-            ds = AuredDataset(json_data_filepath, **verifier_config)
+            ds = AuredDataset(json_data_filepath, cache_dir=dataset_cache_dir, **verifier_config)
             
             ds.add_trec_file_judgements(trec_filepath, sep=' ', normalize_scores=False) # normalizing scores has no influence here, as its only later used in judge...
             verification_decisions = predict_evidence(ds, verifier)
@@ -183,7 +187,7 @@ if __name__ == '__main__':
 
                 # need to recreate the data set since we are testing the normalization of retriever scores, ...
                 # ...which is added when trec file is added to the dataset
-                ds = AuredDataset(json_data_filepath, **verification_config)
+                ds = AuredDataset(json_data_filepath, cache_dir=dataset_cache_dir, **verification_config)
                 ds.add_trec_file_judgements(trec_filepath, sep=' ', normalize_scores=verification_config['normalize_scores'])
 
                 solomon = Judge(scale=verification_config['scale'], ignore_nei=verification_config['ignore_nei'])
@@ -9,11 +9,67 @@ from typing import Optional
 from clef.utils.data_loading import AuredDataset, write_jsonlines_from_dicts
 from clef.utils.data_loading import write_trec_format_output
 from clef.utils.scoring import eval_run_custom
+from clef.retrieval.retrieve import EvidenceRetriever
 from clef.verification.verify import Judge, run_verifier_on_dataset
 
 import logging
 logger = logging.getLogger(__name__)
 
+def build_retriever(label: str, config) -> Optional[EvidenceRetriever]:
+    """
+    retriever for label (LUCENE, OPENAI, SBERT, TFIDF, NATIVE, TERRIER or HYBRID) configured from the retriever_* settings of config, None if the label is unknown
+    """
+    # optional: one index over all unique timeline posts instead of one per rumor (lexical retrievers only)
+    global_index = config.get('retriever_global_index', False)
+    index_dir = config.get('retriever_index_dir', None)
+    # optional: persistent embedding store shared by the dense retrievers, the oldest embeddings are evicted beyond max_bytes
+    embedding_store_dir = config.get('retriever_embedding_store_dir', None)
+    embedding_store_max_bytes = config.get('retriever_embedding_store_max_bytes', None)
+    # optional: approximate (IVF) search for the dense retrievers, nprobe trades recall for latency
+    dense_options = dict(ann=config.get('retriever_ann', False), ann_nlist=config.get('retriever_ann_nlist', None), ann_nprobe=config.get('retriever_ann_nprobe', 8), index_dir=index_dir)
+    # optional: reduced precision embeddings (float16/int8) and a binary hamming prefilter for the dense retrievers
+    dense_options.update(precision=config.get('retriever_precision', 'float32'), binary_prefilter=config.get('retriever_binary_prefilter', False))
+
+    if 'HYBRID' in label.upper():
+        # lexical and dense component, e.g. NATIVE (with retriever_global_index) and SBERT
+        from clef.retrieval.models.hybrid import HybridRetriever
+        lexical = build_retriever(config.get('retriever_hybrid_lexical', 'NATIVE'), config)
+        dense = build_retriever(config.get('retriever_hybrid_dense', 'SBERT'), config)
+        if lexical is None or dense is None:
+            return None
+        return HybridRetriever(
+            config['retriever_k'], lexical, dense,
+            fusion=config.get('retriever_fusion', 'rrf'), candidate_k=config.get('retriever_fusion_candidates', 100),
+            weights=config.get('retriever_fusion_weights', (1.0, 1.0)),
+        )
+
+    elif 'LUCENE' in  label.upper():
+        from clef.retrieval.models.pyserini import LuceneRetriever
+        return LuceneRetriever(config['retriever_k'], global_index=global_index, index_dir=index_dir)
+
+    elif 'OPENAI' in label.upper():
+        from clef.retrieval.models.open_ai import OpenAIRetriever
+        return OpenAIRetriever(config['retriever_k'], embedding_store_dir=embedding_store_dir, embedding_store_max_bytes=embedding_store_max_bytes, max_concurrency=config.get('retriever_max_concurrency', 1), rpm=config.get('retriever_rpm', None), tpm=config.get('retriever_tpm', None), **dense_options)
+
+    elif 'SBERT' in label.upper():
+        from clef.retrieval.models.sentence_transformers import SBERTRetriever
+        return SBERTRetriever(config['retriever_k'], batch_size=config.get('retriever_batch_size', 128), num_processes=config.get('retriever_num_processes', 0), embedding_store_dir=embedding_store_dir, embedding_store_max_bytes=embedding_store_max_bytes, **dense_options)
+
+    elif 'TFIDF' in label.upper():
+        from clef.retrieval.models.tfidf import TFIDFRetriever
+        return TFIDFRetriever(config['retriever_k'], global_index=global_index, index_dir=index_dir)
+
+    elif 'NATIVE' in label.upper():
+        from clef.retrieval.models.native import NativeRetriever
+        return NativeRetriever(config['retriever_k'], global_index=global_index)
+
+    elif 'TERRIER' in label.upper():
+        from clef.retrieval.models.terrier import TerrierRetriever
+        return TerrierRetriever(config['retriever_k'], global_index=global_index, index_dir=index_dir)
+
+    return None
+
+
 def step_retrieval(ds: AuredDataset, config, golden_labels_file):
     """
     step 1 output format:
@@ -41,35 +97,27 @@ def step_retrieval(ds: AuredDataset, config, golden_labels_file):
     Other evaluation measures to be considered are Recall@5.
     """
 
-    if 'LUCENE' in  config['retriever_label'].upper():
-        from clef.retrieval.models.pyserini import LuceneRetriever
-        retriever = LuceneRetriever(config['retriever_k'])
-
-    elif 'OPENAI' in config['retriever_label'].upper():
-        from clef.retrieval.models.open_ai import OpenAIRetriever
-        retriever = OpenAIRetriever(config['retriever_k'])
-
-    elif 'SBERT' in config['retriever_label'].upper():
-        from clef.retrieval.models.sentence_transformers import SBERTRetriever
-        retriever = SBERTRetriever(config['retriever_k'])
-
-    elif 'TFIDF' in config['retriever_label'].upper():
-        from clef.retrieval.models.tfidf import TFIDFRetriever
-        retriever = TFIDFRetriever(config['retriever_k'])
-
-    elif 'TERRIER' in config['retriever_label'].upper():
-        from clef.retrieval.models.terrier import TerrierRetriever
-        retriever = TerrierRetriever(config['retriever_k'])
-
-    else:
+    retriever = build_retriever(config['retriever_label'], config)
+    if retriever is None:
         logger.error(f"retriever type {config['retriever_label']} not valid!")
         quit()
 
+    # optional: rerank the top retriever_rerank_candidates posts of the retriever with a local cross-encoder
+    if config.get('retriever_rerank', False):
+        from clef.retrieval.models.cascade import CascadeRetriever
+        rerank_model = config['retriever_rerank'] if isinstance(config['retriever_rerank'], str) else "cross-encoder/ms-marco-MiniLM-L-6-v2"
+        retriever = CascadeRetriever(
+            config['retriever_k'], retriever, model=rerank_model,
+            candidate_k=config.get('retriever_rerank_candidates', 20), batch_size=config.get('retriever_rerank_batch_size', 32),
+            score_cache_dir=config.get('retriever_embedding_store_dir', None), score_cache_max_bytes=config.get('retriever_embedding_store_max_bytes', None),
+        )
+
     from clef.retrieval.retrieve import retrieve_evidence
-    data = retrieve_evidence(ds, retriever)
+    # retrievers without a batched retrieve_many can fan rumors out over a thread or process pool
+    data = retrieve_evidence(ds, retriever, num_workers=config.get('retriever_num_workers', 1), executor=config.get('retriever_executor', 'thread'))
 
     trec_filepath = f'{config["out_dir"]}/{config["retriever_label"]}-{config["split"]}.trec.txt'
-    write_trec_format_output(trec_filepath, data, config['retriever_label'])
+    write_trec_format_output(trec_filepath, data, config['retriever_label'], sidecar=True)
 
     if config["blind_run"]:
         # running blind
@@ -0,0 +1,279 @@
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+import hashlib
+import json
+import math
+import os
+import re
+import time
+
+import numpy as np
+
+from clef.retrieval.dense import top_k
+
+import logging
+logger = logging.getLogger(__name__)
+
+# approximate nearest neighbour search for the dense retrievers: an IVF-flat index in numpy. vectors are clustered
+# with spherical k-means, a query only scans the nprobe lists whose centroids are closest to it. nprobe is the
+# recall/latency knob, nprobe = nlist is exact search.
+
+KMEANS_SAMPLE_PER_LIST = 64
+
+
+class RecallPoint(NamedTuple):
+    """recall@k of one nprobe setting against exact search"""
+    nprobe: int
+    recall: float           # mean recall@k over the queries
+    latency_ms: float       # mean search time per query
+    exact_latency_ms: float # mean exact search time per query, same queries
+
+
+class IVFFlatIndex(object):
+    """
+    inverted file index over normalized vectors with exact (flat) scoring inside the probed lists
+
+    Parameters:
+        - vectors: (n x dim) normalized float32 vectors, kept by reference (can be a memory map)
+        - centroids: (nlist x dim) normalized cluster centroids
+        - list_rows: rows of vectors grouped by list
+        - list_offsets: list i holds list_rows[list_offsets[i]:list_offsets[i+1]]
+    """
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, list_rows: np.ndarray, list_offsets: np.ndarray) -> None:
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+        # list of each row, built on the first filtered search
+        self._row_lists: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def row_lists(self) -> np.ndarray:
+        """list of each row, the inverse of list_rows/list_offsets"""
+        if self._row_lists is None:
+            row_lists = np.empty(len(self.list_rows), dtype=np.int32 if self.nlist < 2**31 else np.int64)
+            row_lists[self.list_rows] = np.repeat(np.arange(self.nlist), np.diff(self.list_offsets))
+            self._row_lists = row_lists
+        return self._row_lists
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: Optional[int] = None, niter: int = 10, seed: int = 0) -> 'IVFFlatIndex':
+        """
+        cluster vectors with spherical k-means (trained on a sample) and assign every vector to its closest centroid
+
+        Parameters:
+            - vectors: (n x dim) normalized vectors
+            - nlist: number of lists, default 4 * sqrt(n)
+            - niter: k-means iterations
+            - seed: random seed of the centroid initialisation and sample
+        """
+        n = len(vectors)
+        if n == 0:
+            # e.g. an empty timeline corpus, searches return nothing
+            dim = vectors.shape[1] if np.ndim(vectors) == 2 else 0
+            return cls(vectors, np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+
+        nlist = max(1, min(n, nlist or int(4 * math.sqrt(n))))
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST)
+        sample = np.asarray(vectors[np.sort(rng.choice(n, size=sample_size, replace=False))], dtype=np.float32)
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        start = time.monotonic()
+        for _ in range(niter):
+            assignment = _assign(sample, centroids)
+            counts = np.bincount(assignment, minlength=nlist)
+            order = np.argsort(assignment, kind='stable')
+            sums = np.zeros_like(centroids)
+            filled = np.flatnonzero(counts)
+            sums[filled] = np.add.reduceat(sample[order], (np.cumsum(counts) - counts)[filled], axis=0)
+            # re-seed empty lists with random sample vectors
+            empty = np.flatnonzero(counts == 0)
+            sums[empty] = sample[rng.choice(sample_size, size=len(empty))]
+            centroids = _normalize(sums)
+
+        assignment = _assign(vectors, centroids)
+        list_rows = np.argsort(assignment, kind='stable').astype(np.int64)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))]).astype(np.int64)
+        logger.info(f'built IVF index over {n} vectors with {nlist} lists in {time.monotonic() - start:.2f}s')
+        return cls(vectors, centroids, list_rows, list_offsets)
+
+    def save(self, path: Union[str, os.PathLike]) -> None:
+        """write the index to directory path, vectors.npy can later be memory-mapped by load"""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'vectors.npy'), np.asarray(self.vectors))
+        np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+        np.save(os.path.join(path, 'list_rows.npy'), self.list_rows)
+        np.save(os.path.join(path, 'list_offsets.npy'), self.list_offsets)
+        with open(os.path.join(path, 'meta.json'), 'w') as file:
+            json.dump({'size': len(self), 'nlist': self.nlist, 'dim': int(self.centroids.shape[1])}, file)
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike], mmap: bool = True) -> 'IVFFlatIndex':
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            np.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'centroids.npy')),
+            np.load(os.path.join(path, 'list_rows.npy')),
+            np.load(os.path.join(path, 'list_offsets.npy')),
+        )
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = 8, allowed: Optional[Sequence[Sequence[int]]] = None, exact_threshold: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        """
+        approximate top-k rows of each query by cosine similarity
+
+        Parameters:
+            - queries: (queries x dim) normalized query vectors
+            - k: number of results per query
+            - nprobe: number of lists scanned per query, higher is slower with better recall. if they hold fewer
+              than k rows, more lists are scanned (nprobe at a time) until k rows are found. with an allowlist only
+              the lists holding allowed rows count
+            - allowed: per query, the only rows it may return (e.g. its timeline or authority set)
+            - exact_threshold: allowlists up to this size are scored exactly instead of probing,
+              default the expected number of vectors in nprobe lists (probing would scan as many)
+
+        Returns:
+        per query, a list of (row, score) ordered by rank
+        """
+        if len(self) == 0:
+            return [[] for _ in queries]
+        nprobe = max(1, min(nprobe, self.nlist))
+        if exact_threshold is None:
+            exact_threshold = int(nprobe * len(self) / self.nlist)
+
+        centroid_scores = queries @ self.centroids.T
+
+        results = []
+        for i, query in enumerate(queries):
+            if allowed is not None and len(allowed[i]) <= exact_threshold:
+                candidates = np.unique(np.asarray(allowed[i], dtype=np.int64))
+            elif nprobe == self.nlist and allowed is None:
+                candidates = None
+            else:
+                candidates = self._probe(centroid_scores[i], k, nprobe) if allowed is None else self._probe_allowed(centroid_scores[i], k, nprobe, np.asarray(allowed[i], dtype=np.int64))
+
+            if candidates is None:
+                # the whole index is one product, without gathering rows first
+                candidates = np.arange(len(self))
+                scores = np.asarray(self.vectors) @ query
+            elif len(candidates) == 0:
+                results.append([])
+                continue
+            else:
+                scores = np.asarray(self.vectors[candidates]) @ query
+            results.append([(int(candidates[j]), score) for j, score in top_k(scores[None, :], k)[0]])
+        return results
+
+    def _probe(self, centroid_scores: np.ndarray, k: int, nprobe: int) -> np.ndarray:
+        # scan the lists closest to the query, nprobe at a time, until k rows are found
+        order = np.argsort(-centroid_scores)
+
+        parts = []
+        found = 0
+        for start in range(0, len(order), nprobe):
+            rows = np.concatenate([self.list_rows[self.list_offsets[c]:self.list_offsets[c+1]] for c in order[start:start+nprobe]])
+            parts.append(rows)
+            found += len(rows)
+            if found >= k:
+                break
+        return np.concatenate(parts)
+
+    def _probe_allowed(self, centroid_scores: np.ndarray, k: int, nprobe: int, allowed: np.ndarray) -> np.ndarray:
+        # look up the list of each allowed row, then take the lists closest to the query, nprobe at a time, until
+        # k rows are found. only the allowed rows are touched, lists without any are never ranked or scanned
+        allowed = np.sort(allowed)
+        allowed = allowed[np.concatenate([[True], allowed[1:] != allowed[:-1]])] if len(allowed) else allowed
+        if len(allowed) == 0:
+            return allowed
+        lists = self.row_lists[allowed]
+        counts = np.bincount(lists, minlength=self.nlist)
+
+        probed = np.flatnonzero(counts)
+        ranked = probed[np.argsort(-centroid_scores[probed], kind='stable')]
+        found = np.cumsum(counts[ranked])
+        # whole blocks of nprobe lists, up to the first block that reaches k rows
+        num_lists = len(ranked) if found[-1] < k else min(len(ranked), (int(np.searchsorted(found, k)) // nprobe + 1) * nprobe)
+
+        selected = np.zeros(self.nlist, dtype=bool)
+        selected[ranked[:num_lists]] = True
+        return allowed[selected[lists]]
+
+    def exact_search(self, queries: np.ndarray, k: int, allowed: Optional[Sequence[Sequence[int]]] = None) -> List[List[Tuple[int, float]]]:
+        """exhaustive top-k over all (or the allowed) rows, the reference of evaluate_recall"""
+        return self.search(queries, k, nprobe=self.nlist, allowed=allowed, exact_threshold=len(self) if allowed is not None else None)
+
+    def evaluate_recall(self, queries: np.ndarray, k: int, nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32), allowed: Optional[Sequence[Sequence[int]]] = None) -> List[RecallPoint]:
+        """
+        recall@k and latency of the given nprobe settings against exact search, logged and returned
+
+        allowlists are applied to both searches but never scored exactly in the approximate one,
+        so the numbers show the probing itself
+        """
+        start = time.monotonic()
+        exact = self.exact_search(queries, k, allowed)
+        exact_latency = (time.monotonic() - start) * 1000 / max(len(queries), 1)
+
+        points = []
+        for nprobe in nprobes:
+            start = time.monotonic()
+            approx = self.search(queries, k, nprobe=nprobe, allowed=allowed, exact_threshold=0)
+            latency = (time.monotonic() - start) * 1000 / max(len(queries), 1)
+
+            recalls = [
+                len({row for row, _ in found} & {row for row, _ in truth}) / len(truth)
+                for found, truth in zip(approx, exact) if truth
+            ]
+            point = RecallPoint(min(nprobe, self.nlist), float(np.mean(recalls)) if recalls else 1.0, latency, exact_latency)
+            logger.info(f'IVF nprobe={point.nprobe}/{self.nlist}: recall@{k}={point.recall:.4f}, {point.latency_ms:.3f}ms/query (exact {point.exact_latency_ms:.3f}ms/query)')
+            points.append(point)
+        return points
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+    # closest centroid of each vector, in chunks to bound the (chunk x nlist) score matrix
+    return np.concatenate([
+        np.argmax(np.asarray(vectors[start:start+chunk_size]) @ centroids.T, axis=1)
+        for start in range(0, len(vectors), chunk_size)
+    ]) if len(vectors) else np.empty(0, dtype=np.int64)
+
+
+def vectors_fingerprint(vectors: np.ndarray) -> str:
+    return hashlib.sha256(np.ascontiguousarray(vectors).tobytes()).hexdigest()
+
+
+def build_or_load_ivf(vectors: np.ndarray, index_dir: Optional[Union[str, os.PathLike]] = None, name: str = 'ivf', nlist: Optional[int] = None, seed: int = 0) -> IVFFlatIndex:
+    """
+    IVF index over vectors, persisted under index_dir (if given) and reused as long as the vectors are the same
+
+    Parameters:
+        - vectors: (n x dim) normalized vectors
+        - index_dir: directory of persistent indexes, the index is built in memory only if None
+        - name: prefix of the index directory, e.g. the retriever and model
+        - nlist, seed: see IVFFlatIndex.build
+    """
+    if index_dir is None:
+        return IVFFlatIndex.build(vectors, nlist=nlist, seed=seed)
+
+    name = re.sub(r'[^A-Za-z0-9._-]+', '_', name)
+    path = os.path.join(os.fspath(index_dir), f'{name}-{nlist or "auto"}-{vectors_fingerprint(vectors)[:16]}')
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        logger.info(f'loading IVF index from {path}')
+        return IVFFlatIndex.load(path)
+
+    index = IVFFlatIndex.build(vectors, nlist=nlist, seed=seed)
+    index.save(path)
+    logger.info(f'saved IVF index to {path}')
+    return index
@@ -0,0 +1,232 @@
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple, Union
+from abc import abstractmethod
+
+import numpy as np
+
+from clef.retrieval.retrieve import EvidenceRetriever, dataset_rumors
+
+if TYPE_CHECKING:
+    from clef.retrieval.ann import IVFFlatIndex
+    from clef.retrieval.quantization import QuantizedIndex
+
+import logging
+logger = logging.getLogger(__name__)
+
+# dense retrieval kernel shared by the embedding retrievers: vectors are L2-normalized once, so cosine similarity
+# is a plain dot product, and all claims are scored against all unique texts with one matrix product
+
+SCORE_CHUNK_SIZE = 1024
+
+
+def normalize_rows(embeddings) -> np.ndarray:
+    """float32 copy of embeddings with unit length rows (all-zero rows stay zero)"""
+    vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def top_k(scores: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+    """
+    row-wise top-k of a (queries x candidates) score matrix with argpartition, -inf entries are never returned
+
+    Returns:
+    per row, a list of (column, score) by descending score, ties in column order
+    """
+    width = scores.shape[1]
+    kk = min(k, width)
+    if kk <= 0:
+        return [[] for _ in range(len(scores))]
+
+    columns = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+
+    # argpartition keeps an arbitrary subset of the entries tied with the k-th score, take those in column order instead
+    kth = np.take_along_axis(scores, columns, axis=1).min(axis=1, keepdims=True)
+    above = (scores > kth).sum(axis=1)
+    tied = (scores == kth).sum(axis=1)
+    for row in np.flatnonzero(above + tied > kk):
+        columns[row] = np.concatenate([np.flatnonzero(scores[row] > kth[row]), np.flatnonzero(scores[row] == kth[row])[:kk - above[row]]])
+
+    values = np.take_along_axis(scores, columns, axis=1)
+    order = np.lexsort((columns, -values), axis=1)
+    columns = np.take_along_axis(columns, order, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+
+    return [
+        [(int(c), float(v)) for c, v in zip(row_columns, row_values) if v != -np.inf]
+        for row_columns, row_values in zip(columns, values)
+    ]
+
+
+def rank_timelines(queries: np.ndarray, vectors: np.ndarray, timelines: Sequence[Sequence[int]], k: int, chunk_size: int = SCORE_CHUNK_SIZE) -> List[List[Tuple[int, float]]]:
+    """
+    top-k timeline entries of each query by cosine similarity
+
+    scores of a chunk of queries against all vectors are one matrix product, each row is then masked to the
+    query's timeline by gathering its entries into a -inf padded (queries x longest timeline) matrix
+
+    Parameters:
+        - queries: (queries x dim) normalized query vectors
+        - vectors: (texts x dim) normalized text vectors
+        - timelines: per query, the rows in vectors of its timeline entries in timeline order (may repeat)
+        - k: number of results per query
+        - chunk_size: number of queries scored per matrix product, bounds the memory to chunk_size x texts scores
+
+    Returns:
+    per query, a list of (timeline position, score) ordered by rank
+    """
+    results: List[List[Tuple[int, float]]] = []
+    for start in range(0, len(queries), chunk_size):
+        chunk = timelines[start:start+chunk_size]
+        scores = queries[start:start+chunk_size] @ vectors.T
+
+        lengths = np.array([len(timeline) for timeline in chunk], dtype=np.int64)
+        masked = np.full((len(chunk), lengths.max(initial=0)), -np.inf, dtype=scores.dtype)
+        query_rows = np.repeat(np.arange(len(chunk)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        text_rows = np.concatenate([np.asarray(timeline, dtype=np.int64) for timeline in chunk]) if len(query_rows) else np.empty(0, dtype=np.int64)
+        masked[query_rows, positions] = scores[query_rows, text_rows]
+
+        results.extend(top_k(masked, k))
+    return results
+
+
+def retrieve_dense(rumors: Sequence[Tuple[str, str, List]], vectors: np.ndarray, text_rows: Dict[str, int], k: int, ann=None, nprobe: int = 8) -> List:
+    """
+    retrieve evidence for many (rumor_id, claim, timeline) from precomputed, normalized embeddings
+
+    Parameters:
+        - rumors: (rumor_id, claim, timeline) of each rumor
+        - vectors: normalized embeddings of all claims and post texts, or a QuantizedIndex of them
+        - text_rows: row in vectors of each text
+        - k: number of posts per rumor
+        - ann: approximate index over vectors (see clef.retrieval.ann.IVFFlatIndex), exact scoring if None
+        - nprobe: number of lists the approximate index scans per rumor
+
+    Returns:
+    [rumor_id, post_id, rank, score] rows of all rumors, in input order
+    """
+    queries = vectors[[text_rows[claim] for _, claim, _ in rumors]]
+    timelines = [[text_rows[post[2]] for post in timeline] for _, _, timeline in rumors]
+    if ann is not None:
+        found = ann.search(queries, k, nprobe=nprobe, allowed=timelines)
+    elif isinstance(vectors, np.ndarray):
+        found = None
+    else:
+        # quantized vectors (see clef.retrieval.quantization.QuantizedIndex) bring their own search
+        found = vectors.search(queries, k, allowed=timelines)
+
+    if found is None:
+        ranked = rank_timelines(queries, vectors, timelines, k)
+    else:
+        ranked = [_timeline_positions(timeline, results, k) for timeline, results in zip(timelines, found)]
+
+    data = []
+    for (rumor_id, _, timeline), results in zip(rumors, ranked):
+        data.extend([rumor_id, timeline[position][1], i+1, score] for i, (position, score) in enumerate(results))
+    return data
+
+
+def _timeline_positions(timeline: Sequence[int], results: List[Tuple[int, float]], k: int) -> List[Tuple[int, float]]:
+    # rows found by an index back to timeline positions, a text posted more than once fills more than one position
+    positions: Dict[int, List[int]] = {}
+    for position, row in enumerate(timeline):
+        positions.setdefault(row, []).append(position)
+    return [(position, score) for row, score in results for position in positions[row]][:k]
+
+
+class DenseRetriever(EvidenceRetriever):
+    """
+    base of the embedding retrievers, subclasses only implement embed
+
+    prepare(dataset) embeds the claims and unique post texts of all rumors once, retrieve_many then scores all rumors
+    with retrieve_dense. rumors with texts that were not prepared are embedded on the fly, one rumor at a time.
+    """
+    def __init__(self, k, name: str, precompute: bool = True, ann: bool = False, ann_nlist: Optional[int] = None, ann_nprobe: int = 8, index_dir: Optional[str] = None,
+                 precision: str = 'float32', binary_prefilter: bool = False, rescore_factor: int = 10):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - name: embedding model, names the persisted IVF index
+            - precompute: embed all unique posts and claims of the dataset up front (see prepare), instead of per rumor
+            - ann: search an IVF index over the precomputed embeddings instead of scoring all timeline posts (see clef.retrieval.ann)
+            - ann_nlist: number of IVF lists (default 4 * sqrt(texts))
+            - ann_nprobe: number of IVF lists scanned per rumor, trades recall for latency
+            - index_dir: persist the IVF index there and reuse it while the embeddings are the same
+            - precision: keep the precomputed embeddings in float32, float16 or int8 (see clef.retrieval.quantization)
+            - binary_prefilter: also keep 1-bit sign codes and rescore only the rescore_factor * k posts closest in hamming distance
+            - rescore_factor: shortlist size of the binary prefilter, in multiples of k
+        """
+        if ann and (precision != 'float32' or binary_prefilter):
+            raise ValueError('the IVF index keeps float32 vectors, it can not be combined with quantized embeddings')
+        super().__init__(k)
+        self.name = name
+        self.precompute = precompute
+        # precomputed embeddings, one row per unique text
+        self.text_rows: Dict[str, int] = {}
+        self.embeddings: Optional[Union[np.ndarray, 'QuantizedIndex']] = None
+        self.ann = ann
+        self.ann_nlist = ann_nlist
+        self.ann_nprobe = ann_nprobe
+        self.index_dir = index_dir
+        self.ann_index: Optional['IVFFlatIndex'] = None
+        self.precision = precision
+        self.binary_prefilter = binary_prefilter
+        self.rescore_factor = rescore_factor
+
+    @abstractmethod
+    def embed(self, texts: List[str]):
+        """embeddings of texts, one row per text in input order"""
+        pass
+
+    def prepare(self, dataset):
+        if not self.precompute:
+            return
+
+        # claims and unique post texts of all rumors, so a post shared by many rumors is only embedded once
+        texts = list(dict.fromkeys(
+            text for item in dataset for text in [item['rumor']] + [post[2] for post in item['timeline']]
+        ))
+        # unit length float32 rows, cosine similarity is then a dot product
+        self.embeddings = normalize_rows(self.embed(texts))
+        self.text_rows = {text: row for row, text in enumerate(texts)}
+        if self.ann:
+            from clef.retrieval.ann import build_or_load_ivf
+            self.ann_index = build_or_load_ivf(self.embeddings, self.index_dir, name=f'ivf-{self.name}', nlist=self.ann_nlist)
+        elif self.precision != 'float32' or self.binary_prefilter:
+            # only the quantized copy is kept, claims are dequantized when used as queries
+            from clef.retrieval.quantization import QuantizedIndex
+            self.embeddings = QuantizedIndex(self.embeddings, self.precision, self.binary_prefilter, self.rescore_factor)
+            logger.info(f"quantized {len(texts)} embeddings to {self.precision}{' with binary codes' if self.binary_prefilter else ''}, {self.embeddings.nbytes / 2**20:.1f}MiB")
+
+    def is_prepared(self, claim: str, timeline: List) -> bool:
+        return self.embeddings is not None and claim in self.text_rows and all(post[2] in self.text_rows for post in timeline)
+
+    def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs) -> List:
+        if self.is_prepared(claim, timeline):
+            # only lookups into the precomputed matrix
+            return self.retrieve_batch([(rumor_id, claim, timeline)])
+
+        vectors = normalize_rows(self.embed([claim] + [post[2] for post in timeline]))
+        ranked = rank_timelines(vectors[:1], vectors, [range(1, len(vectors))], self.k)[0]
+
+        return [[rumor_id, timeline[position][1], i+1, score] for i, (position, score) in enumerate(ranked)]
+
+    def retrieve_many(self, dataset, **kwargs) -> List:
+        rumors = dataset_rumors(dataset)
+        if all(self.is_prepared(claim, timeline) for _, claim, timeline in rumors):
+            return self.retrieve_batch(rumors)
+        return super().retrieve_many(dataset, **kwargs)
+
+    def retrieve_batch(self, rumors: List[Tuple[str, str, List]]) -> List:
+        """
+        retrieve evidence for many (rumor_id, claim, timeline) at once from the embeddings of prepare(dataset),
+        see retrieve_dense
+
+        Returns:
+        [rumor_id, post_id, rank, score] rows of all rumors, in input order
+        """
+        if self.embeddings is None:
+            raise RuntimeError("no precomputed embeddings, call prepare(dataset) first")
+        return retrieve_dense(rumors, self.embeddings, self.text_rows, self.k, ann=self.ann_index, nprobe=self.ann_nprobe)
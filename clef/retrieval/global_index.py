@@ -0,0 +1,104 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+from abc import abstractmethod
+import hashlib
+import os
+
+from clef.retrieval.retrieve import EvidenceRetriever, dataset_rumors, order_by_rumors
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TimelineCorpus(NamedTuple):
+    """unique timeline posts of a whole dataset, the document collection of a global index"""
+    docnos: List[str]       # post ids, one per document
+    texts: List[str]        # (formatted) post texts, same order
+    fingerprint: str        # hash of docnos+texts, identifies a built index across runs
+
+    def rows(self) -> Dict[str, int]:
+        return {docno: row for row, docno in enumerate(self.docnos)}
+
+
+def collect_timeline_corpus(dataset: Iterable) -> TimelineCorpus:
+    """
+    collect the unique posts of all rumor timelines, in order of first appearance
+
+    posts are keyed by post id (the docno of the TREC runs), if a post id shows up with different texts the first one wins
+    """
+    texts_by_id: Dict[str, str] = {}
+    for item in dataset:
+        for post in item['timeline']:
+            post_id, text = post[1], post[2]
+            if post_id not in texts_by_id:
+                texts_by_id[post_id] = text
+            elif texts_by_id[post_id] != text:
+                logger.debug(f'post {post_id} appears with different texts, indexing the first one')
+
+    docnos = list(texts_by_id)
+    texts = list(texts_by_id.values())
+    return TimelineCorpus(docnos, texts, corpus_fingerprint(docnos, texts))
+
+
+def corpus_fingerprint(docnos: List[str], texts: List[str]) -> str:
+    sha = hashlib.sha256()
+    for docno, text in zip(docnos, texts):
+        sha.update(docno.encode('utf-8'))
+        sha.update(b'\t')
+        sha.update(text.encode('utf-8'))
+        sha.update(b'\n')
+    return sha.hexdigest()
+
+
+def global_index_path(index_dir: Union[str, os.PathLike], name: str, corpus: TimelineCorpus) -> str:
+    """directory of the persistent index called name over corpus, reused as long as the corpus is the same"""
+    return os.path.join(os.fspath(index_dir), f'{name}-{corpus.fingerprint[:16]}')
+
+
+def timeline_rows(timeline: List, rows: Dict[str, int]) -> Tuple[List[int], List[str]]:
+    """
+    allowlist of a rumor: rows in the global index of its timeline posts (and their post ids), skipping duplicates
+
+    Returns:
+    tuple of (rows, post ids)
+    """
+    allowed_rows: List[int] = []
+    allowed_ids: List[str] = []
+    seen = set()
+    for post in timeline:
+        post_id = post[1]
+        row: Optional[int] = rows.get(post_id)
+        if row is None:
+            logger.warning(f'post {post_id} is not in the global index, was the index built for another dataset?')
+            continue
+        if row not in seen:
+            seen.add(row)
+            allowed_rows.append(row)
+            allowed_ids.append(post_id)
+    return allowed_rows, allowed_ids
+
+
+class GlobalIndexRetriever(EvidenceRetriever):
+    """
+    base of the retrievers with an optional global index: with global_index, prepare(dataset) indexes all unique
+    timeline posts once (doc_rows maps their post ids to rows) and retrieve_batch scores many rumors against it,
+    each restricted to the rows of its timeline
+    """
+    def __init__(self, k, global_index: bool = False):
+        super().__init__(k)
+        self.global_index = global_index
+        self.doc_rows: Dict[str, int] = {}
+
+    @abstractmethod
+    def retrieve_batch(self, rumors: List[Tuple[str, str, List]]) -> List:
+        """[rumor_id, post_id, rank, score] rows of many (rumor_id, claim, timeline) from the global index, grouped by rumor"""
+        pass
+
+    def allowlists(self, rumors: List[Tuple[str, str, List]]) -> List[Tuple[List[int], List[str]]]:
+        """(rows, post ids) of the timeline of each rumor in the global index, see timeline_rows"""
+        return [timeline_rows(timeline, self.doc_rows) for _, _, timeline in rumors]
+
+    def retrieve_many(self, dataset, **kwargs) -> List:
+        if not self.global_index:
+            return super().retrieve_many(dataset, **kwargs)
+        rumors = dataset_rumors(dataset)
+        return order_by_rumors(rumors, self.retrieve_batch(rumors))
@@ -0,0 +1,211 @@
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter
+from functools import lru_cache
+import math
+import re
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from clef.utils.stemming import porter_stem
+
+import logging
+logger = logging.getLogger(__name__)
+
+# native versions of Terrier's BM25 and PL2 weighting models (org.terrier.matching.models), so the
+# TERRIER pipeline can run without a JVM. logs are base 2, as in Terrier's WeightingModelLibrary.
+
+ANALYZE_CACHE_SIZE = 2**17
+
+# Terrier's EnglishTokeniser: runs of ascii letters/digits, lowercased. tokens longer than 20 chars,
+# with more than 4 digits or with more than 3 identical consecutive chars are dropped
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9]+')
+MAX_TERM_LENGTH = 20
+
+REC_LOG_2_OF_E = 1.0 / math.log(2)
+
+
+def _keep_token(token: str) -> bool:
+    if len(token) > MAX_TERM_LENGTH:
+        return False
+    digits = 0
+    run = 0
+    prev = ''
+    for ch in token:
+        if ch.isdigit():
+            digits += 1
+        run = run + 1 if ch == prev else 1
+        prev = ch
+        if run > 3 or digits > 4:
+            return False
+    return True
+
+
+@lru_cache(maxsize=ANALYZE_CACHE_SIZE)
+def _analyze(text: str, stopwords: FrozenSet[str]) -> Tuple[str, ...]:
+    return tuple(
+        porter_stem(token)
+        for token in (match.lower() for match in TOKEN_PATTERN.findall(text))
+        if token not in stopwords and _keep_token(token)
+    )
+
+
+def analyze(text: str, stopwords: Optional[FrozenSet[str]] = None) -> Tuple[str, ...]:
+    """
+    tokenize, remove stopwords and porter-stem a text, like Terrier's "Stopwords,PorterStemmer" term pipeline
+
+    the default stopwords are scikit-learn's english list, which differs from Terrier's stopword-list.txt, so rankings
+    only match Terrier's when its list is passed as stopwords (see tests/test_lexical.py)
+    """
+    return _analyze(text, ENGLISH_STOP_WORDS if stopwords is None else stopwords)
+
+
+class LexicalIndex(object):
+    """
+    sparse document-term matrix with the collection statistics for BM25 and PL2
+
+    both weighting models are precomputed per (document, term) posting from the same counts, so scoring a batch
+    of queries is one sparse product per model: (queries x terms) @ (terms x documents).
+    """
+    def __init__(self, docs: Sequence[Tuple[str, ...]], k_1: float = 1.2, b: float = 0.75, k_3: float = 8.0, c: float = 1.0) -> None:
+        """
+        Parameters:
+            - docs: analyzed documents (see analyze)
+            - k_1, b, k_3: BM25 parameters (Terrier defaults)
+            - c: PL2 term frequency normalisation parameter (Terrier default)
+        """
+        self.k_1 = k_1
+        self.b = b
+        self.k_3 = k_3
+        self.c = c
+
+        self.vocab: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        for doc in docs:
+            for term, count in Counter(doc).items():
+                indices.append(self.vocab.setdefault(term, len(self.vocab)))
+                counts.append(count)
+            indptr.append(len(indices))
+
+        self.tf = sparse.csr_matrix(
+            (np.array(counts, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(docs), len(self.vocab)),
+        )
+
+        self.num_docs = len(docs)
+        self.doc_lengths = np.asarray(self.tf.sum(axis=1)).ravel()
+        self.avg_doc_length = self.doc_lengths.mean() if self.num_docs else 0.0
+        self.doc_freqs = np.bincount(self.tf.indices, minlength=len(self.vocab)).astype(np.float64)
+        self.term_freqs = np.asarray(self.tf.sum(axis=0)).ravel()
+
+        self.bm25 = self._posting_weights(self._bm25_weights)
+        self.pl2 = self._posting_weights(self._pl2_weights)
+        self.matches = self._posting_weights(lambda tf, dl, terms: np.ones_like(tf))
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def _posting_weights(self, weight_fn) -> sparse.csr_matrix:
+        # one weight per non-zero (document, term) entry, same sparsity as the tf matrix
+        doc_of_entry = np.repeat(np.arange(self.num_docs), np.diff(self.tf.indptr))
+        data = weight_fn(self.tf.data, self.doc_lengths[doc_of_entry], self.tf.indices)
+        return sparse.csr_matrix((data, self.tf.indices, self.tf.indptr), shape=self.tf.shape)
+
+    def _bm25_weights(self, tf: np.ndarray, doc_length: np.ndarray, terms: np.ndarray) -> np.ndarray:
+        K = self.k_1 * ((1 - self.b) + self.b * doc_length / self.avg_doc_length)
+        df = self.doc_freqs[terms]
+        idf = np.log2((self.num_docs - df + 0.5) / (df + 0.5))
+        return idf * ((self.k_1 + 1) * tf / (K + tf))
+
+    def _pl2_weights(self, tf: np.ndarray, doc_length: np.ndarray, terms: np.ndarray) -> np.ndarray:
+        TF = tf * np.log2(1.0 + (self.c * self.avg_doc_length) / doc_length)
+        NORM = 1.0 / (TF + 1.0)
+        f = self.term_freqs[terms] / self.num_docs
+        return NORM * (
+            TF * np.log2(1.0 / f)
+            + f * REC_LOG_2_OF_E
+            + 0.5 * np.log2(2 * math.pi * TF)
+            + TF * (np.log2(TF) - REC_LOG_2_OF_E)
+        )
+
+    def query_matrix(self, queries: Sequence[Tuple[str, ...]]) -> sparse.csr_matrix:
+        """(queries x terms) matrix of query term frequencies, terms that are not in the index are dropped"""
+        indptr = [0]
+        indices: List[int] = []
+        counts: List[int] = []
+        for query in queries:
+            for term, count in Counter(query).items():
+                col = self.vocab.get(term)
+                if col is not None:
+                    indices.append(col)
+                    counts.append(count)
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.array(counts, dtype=np.float64), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(queries), len(self.vocab)),
+        )
+
+    def score(self, queries: Sequence[Tuple[str, ...]]) -> Tuple[sparse.csr_matrix, sparse.csr_matrix, sparse.csr_matrix]:
+        """
+        score all queries against all documents in one sparse product per weighting model
+
+        Returns:
+        tuple of (queries x documents) matrices: BM25 scores, PL2 scores, number of matching query terms
+        """
+        qtf = self.query_matrix(queries)
+        # BM25 weighs query term frequencies with k_3, PL2 uses them as is
+        bm25_qtf = qtf.copy()
+        bm25_qtf.data = (self.k_3 + 1) * bm25_qtf.data / (self.k_3 + bm25_qtf.data)
+        matched = qtf.copy()
+        matched.data = np.ones_like(matched.data)
+
+        return (
+            (bm25_qtf @ self.bm25.T).tocsr(),
+            (qtf @ self.pl2.T).tocsr(),
+            (matched @ self.matches.T).tocsr(),
+        )
+
+
+def rank_bm25_pl2(index: LexicalIndex, queries: Sequence[Tuple[str, ...]], allowed: Optional[Sequence[Iterable[int]]] = None, first_stage_k: int = 10, k: int = 5) -> List[List[Tuple[int, float]]]:
+    """
+    native version of Terrier's (BM25 % first_stage_k) >> (PL2 % k) pipeline for a batch of queries
+
+    Parameters:
+        - index: index of the documents
+        - queries: analyzed queries
+        - allowed: per query, the document rows it may retrieve (all documents if None)
+        - first_stage_k: number of BM25 results that are re-ranked with PL2
+        - k: number of results per query
+
+    Returns:
+    per query, a list of (document row, PL2 score) ordered by rank
+    """
+    bm25, pl2, matched = index.score(queries)
+
+    results = []
+    for i in range(len(queries)):
+        # documents have to match at least one query term to be retrieved
+        start, end = matched.indptr[i], matched.indptr[i+1]
+        candidates = matched.indices[start:end]
+        if allowed is not None:
+            candidates = np.intersect1d(candidates, np.fromiter(allowed[i], dtype=np.int64))
+        if len(candidates) == 0:
+            results.append([])
+            continue
+
+        candidates = _top_k(candidates, bm25[i, candidates].toarray().ravel(), first_stage_k)
+        reranked = _top_k(candidates, pl2[i, candidates].toarray().ravel(), k, with_scores=True)
+        results.append(reranked)
+
+    return results
+
+
+def _top_k(rows: np.ndarray, scores: np.ndarray, k: int, with_scores: bool = False):
+    # highest scores first, ties in document order (as in Terrier's result sets)
+    order = np.lexsort((rows, -scores))[:k]
+    if with_scores:
+        return [(int(rows[j]), float(scores[j])) for j in order]
+    return rows[order]
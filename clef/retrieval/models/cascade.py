@@ -0,0 +1,125 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import time
+
+import numpy as np
+
+from clef.retrieval.retrieve import EvidenceRetriever, dataset_rumors, group_by_rumor, with_k
+from clef.utils.data_loading import AuredDataset
+from clef.utils.embedding_store import get_embedding_store
+
+import logging
+logger = logging.getLogger(__name__)
+
+# separates claim and post text in the keys of the pair score cache
+PAIR_SEPARATOR = '\x1f'
+
+
+class CascadeRetriever(EvidenceRetriever):
+    """
+    two-stage retrieval: any retriever proposes candidate_k posts per rumor, a local cross-encoder reranks them to k
+
+    prepare(dataset) runs the first stage for all rumors (with its retrieve_many) and scores all (claim, post) pairs in one pass, in batches
+    of similar token length. pair scores are cached in memory, and in a persistent store if score_cache_dir is set,
+    so pairs shared by runs with other first stages or cutoffs are only scored once.
+
+    with candidate_k < k only the candidate_k reranked posts are returned per rumor.
+    """
+    def __init__(self, k, first_stage: EvidenceRetriever, model: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", candidate_k: int = 20,
+                 batch_size: int = 32, bucket_batches: int = 8, max_length: int = 512, score_cache_dir: Optional[str] = None, score_cache_max_bytes: Optional[int] = None,
+                 scorer: Optional[Callable[[List[Tuple[str, str]]], np.ndarray]] = None):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor (after reranking)
+            - first_stage: retriever that proposes the candidates, a copy of it retrieves candidate_k posts (first_stage itself is not changed)
+            - model: sentence-transformers cross-encoder, run on CPU
+            - candidate_k: number of first stage candidates reranked per rumor, trades latency for MAP
+            - batch_size: cross-encoder batch size
+            - bucket_batches: number of batches per length bucket
+            - max_length: maximum number of tokens of a (claim, post) pair
+            - score_cache_dir: keep pair scores in a persistent store there
+            - score_cache_max_bytes: evict the oldest pair scores of the store once it outgrows this (no limit if None)
+            - scorer: scores a list of (claim, post text) pairs instead of the cross-encoder, e.g. another reranker
+        """
+        super().__init__(k)
+        self.first_stage = with_k(first_stage, candidate_k)
+        self.model_name = model
+        self.scorer = scorer
+        self.model = None
+        if scorer is None:
+            from sentence_transformers import CrossEncoder
+            self.model = CrossEncoder(model, max_length=max_length, device='cpu')
+        self.candidate_k = candidate_k
+        self.batch_size = batch_size
+        self.bucket_batches = bucket_batches
+        self.store = get_embedding_store(score_cache_dir, f'{model}-pairs', 1, max_bytes=score_cache_max_bytes) if score_cache_dir else None
+        self.pair_scores: Dict[str, float] = {}
+        # first stage candidates of the prepared rumors, by (stripped rumor id, claim)
+        self.candidates: Dict[Tuple[str, str], List] = {}
+
+    def prepare(self, dataset: AuredDataset):
+        # candidates of an earlier dataset would be reranked for rumors that reuse its ids
+        self.candidates = {}
+        self.first_stage.prepare(dataset)
+
+        start = time.monotonic()
+        retrieved = group_by_rumor(self.first_stage.retrieve_many(dataset))
+        pairs = []
+        for rumor_id, claim, timeline in dataset_rumors(dataset):
+            self.candidates[(rumor_id.strip(), claim)] = retrieved.get(rumor_id.strip(), [])
+            pairs.extend(self._pairs(claim, timeline, self.candidates[(rumor_id.strip(), claim)]))
+        first_stage_time = time.monotonic() - start
+
+        start = time.monotonic()
+        self.score_pairs(pairs)
+        logger.info(f'first stage: {len(self.candidates)} rumors in {first_stage_time:.2f}s, reranking: {len(pairs)} pairs in {time.monotonic() - start:.2f}s')
+
+    def _pairs(self, claim: str, timeline: List, rows: List) -> List[Tuple[str, str]]:
+        texts = {post[1].strip(): post[2] for post in timeline}
+        return [(claim, texts[str(row[1]).strip()]) for row in rows]
+
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """cross-encoder scores of (claim, post text) pairs, only pairs that are not cached yet are scored"""
+        keys = [f'{claim}{PAIR_SEPARATOR}{text}' for claim, text in pairs]
+        missing = list(dict.fromkeys(key for key in keys if key not in self.pair_scores))
+        if missing:
+            if self.store is not None:
+                scores = self.store.get_or_compute(missing, self._predict_keys).ravel()
+            else:
+                scores = self._predict_keys(missing).ravel()
+            self.pair_scores.update(zip(missing, scores.tolist()))
+        return np.array([self.pair_scores[key] for key in keys], dtype=np.float32)
+
+    def _predict_keys(self, keys: List[str]) -> np.ndarray:
+        pairs = [key.split(PAIR_SEPARATOR, 1) for key in keys]
+        if not pairs:
+            return np.empty((0, 1), dtype=np.float32)
+        if self.scorer is not None:
+            return np.asarray(self.scorer([(claim, text) for claim, text in pairs]), dtype=np.float32).reshape(-1, 1)
+
+        # sort by token length so each batch is padded to similar lengths, then restore the input order
+        lengths = [len(ids) for ids in self.model.tokenizer([claim for claim, _ in pairs], [text for _, text in pairs], truncation=True, max_length=self.model.max_length)['input_ids']]
+        order = np.argsort(lengths, kind='stable')
+        sorted_pairs = [pairs[i] for i in order]
+
+        bucket_size = self.batch_size * self.bucket_batches
+        sorted_scores = np.concatenate([
+            np.asarray(self.model.predict(sorted_pairs[start:start+bucket_size], batch_size=self.batch_size, show_progress_bar=False), dtype=np.float32).reshape(-1)
+            for start in range(0, len(sorted_pairs), bucket_size)
+        ])
+
+        scores = np.empty_like(sorted_scores)
+        scores[order] = sorted_scores
+        logger.info(f'scored {len(pairs)} pairs with {self.model_name} (max {max(lengths)} tokens) with batch size {self.batch_size}')
+        return scores.reshape(-1, 1)
+
+    def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs) -> List:
+        rows = self.candidates.get((rumor_id.strip(), claim))
+        if rows is None:
+            rows = self.first_stage.retrieve(rumor_id, claim, timeline, **kwargs)
+        if not rows:
+            return []
+
+        scores = self.score_pairs(self._pairs(claim, timeline, rows))
+        # highest cross-encoder score first, ties in first stage order
+        order = np.lexsort((np.arange(len(rows)), -scores))[:self.k]
+        return [[rows[j][0], rows[j][1], i+1, float(scores[j])] for i, j in enumerate(order)]
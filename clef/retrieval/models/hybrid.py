@@ -0,0 +1,111 @@
+from typing import Dict, List, Sequence
+
+from clef.retrieval.retrieve import EvidenceRetriever, dataset_rumors, group_by_rumor, with_k
+from clef.utils.data_loading import AuredDataset
+
+import logging
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ('rrf', 'score')
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[str]], weights: Sequence[float], rrf_k: float = 60.0) -> Dict[str, float]:
+    """
+    fused score of every post: sum over the rankings of weight / (rrf_k + rank), rank starting at 1
+
+    Parameters:
+        - rankings: post ids of each component, best first
+        - weights: weight of each component
+        - rrf_k: smoothing constant, higher values flatten the contribution of the top ranks
+    """
+    fused: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, post_id in enumerate(ranking, start=1):
+            fused[post_id] = fused.get(post_id, 0.0) + weight / (rrf_k + rank)
+    return fused
+
+
+def score_fusion(scores: Sequence[Dict[str, float]], weights: Sequence[float]) -> Dict[str, float]:
+    """
+    fused score of every post: weighted sum of its min-max normalized component scores (0 where a component did not retrieve it)
+
+    Parameters:
+        - scores: score of each post retrieved by each component
+        - weights: weight of each component
+    """
+    fused: Dict[str, float] = {}
+    for component_scores, weight in zip(scores, weights):
+        if not component_scores:
+            continue
+        low, high = min(component_scores.values()), max(component_scores.values())
+        span = high - low
+        for post_id, score in component_scores.items():
+            normalized = (score - low) / span if span > 0 else 1.0
+            fused[post_id] = fused.get(post_id, 0.0) + weight * normalized
+    return fused
+
+
+class HybridRetriever(EvidenceRetriever):
+    """
+    lexical + dense retrieval fused in one retrieve call
+
+    prepare(dataset) prepares each component on its own (e.g. the lexical global index and the dense embeddings),
+    nothing is shared between them. per rumor, each component retrieves its top candidate_k posts, which are
+    fused with reciprocal rank fusion or normalized score fusion and cut to k.
+    """
+    def __init__(self, k, lexical: EvidenceRetriever, dense: EvidenceRetriever, fusion: str = 'rrf', candidate_k: int = 100, weights: Sequence[float] = (1.0, 1.0), rrf_k: float = 60.0):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - lexical: lexical retriever, e.g. NativeRetriever or TFIDFRetriever with a global index
+            - dense: dense retriever, e.g. SBERTRetriever or OpenAIRetriever
+            - fusion: 'rrf' (reciprocal rank fusion) or 'score' (weighted sum of min-max normalized scores)
+            - candidate_k: number of posts each component retrieves for the fusion, the components are copied with this k
+              (the caller's retrievers keep theirs). NativeRetriever returns at most its first_stage_k posts, and
+              TerrierRetriever ignores it, its pipeline always returns 5
+            - weights: weight of the lexical and the dense component
+            - rrf_k: smoothing constant of reciprocal rank fusion
+        """
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f'unknown fusion {fusion}, expected one of {FUSION_METHODS}')
+        super().__init__(k)
+        # the components retrieve the candidates, the hybrid cuts the fused list to k
+        self.components = [with_k(lexical, candidate_k), with_k(dense, candidate_k)]
+        self.fusion = fusion
+        self.candidate_k = candidate_k
+        self.weights = list(weights)
+        self.rrf_k = rrf_k
+
+    def prepare(self, dataset: AuredDataset):
+        for component in self.components:
+            component.prepare(dataset)
+
+    def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs) -> List:
+        return self.fuse(rumor_id, [component.retrieve(rumor_id, claim, timeline, **kwargs) for component in self.components])
+
+    def retrieve_many(self, dataset: AuredDataset, **kwargs) -> List:
+        # each component retrieves all rumors its own (batched) way, then the candidates are fused per rumor
+        candidates = [group_by_rumor(component.retrieve_many(dataset, **kwargs)) for component in self.components]
+
+        data = []
+        for rumor_id, _, _ in dataset_rumors(dataset):
+            data.extend(self.fuse(rumor_id, [rows.get(rumor_id.strip(), []) for rows in candidates]))
+        return data
+
+    def fuse(self, rumor_id: str, component_rows: List[List]) -> List:
+        """fuse the [rumor_id, post_id, rank, score] rows each component retrieved for a rumor into the top k rows"""
+        rankings: List[List[str]] = []
+        scores: List[Dict[str, float]] = []
+        for rows in component_rows:
+            # rank by list order, components do not agree on whether ranks start at 0 or 1
+            rankings.append([str(row[1]).strip() for row in rows])
+            scores.append({str(row[1]).strip(): float(row[3]) for row in rows})
+
+        if self.fusion == 'rrf':
+            fused = reciprocal_rank_fusion(rankings, self.weights, self.rrf_k)
+        else:
+            fused = score_fusion(scores, self.weights)
+
+        # highest fused score first, ties in order of first retrieval
+        ranked = sorted(fused.items(), key=lambda item: -item[1])[:self.k]
+        return [[rumor_id.strip(), post_id, i+1, score] for i, (post_id, score) in enumerate(ranked)]
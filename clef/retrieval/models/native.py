@@ -0,0 +1,77 @@
+from typing import FrozenSet, List, Optional, Tuple
+
+from clef.retrieval.global_index import GlobalIndexRetriever, collect_timeline_corpus
+from clef.retrieval.lexical import LexicalIndex, analyze, rank_bm25_pl2
+from clef.utils.data_loading import AuredDataset
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def clean_query(claim: str) -> str:
+    # same cleaning as TerrierRetriever, keep only alphanumeric chars
+    return "".join([c if c.isalnum() else " " for c in claim]).strip()
+
+
+class NativeRetriever(GlobalIndexRetriever):
+    """
+    TerrierRetriever's (BM25 % 10) >> (PL2 % k) pipeline in numpy/scipy, without pyterrier or a JVM
+
+    by default every rumor gets its own index over its timeline, as with TerrierRetriever. with global_index=True
+    prepare(dataset) indexes all unique timeline posts once, and retrieve_batch scores all rumors in one sparse product.
+    """
+    def __init__(self, k, first_stage_k: int = 10, global_index: bool = False, stopwords: Optional[FrozenSet[str]] = None, **model_params):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor (cutoff after PL2)
+            - first_stage_k: number of BM25 results re-ranked with PL2
+            - global_index: use one index over the whole dataset (see prepare) instead of one per rumor
+            - stopwords: stopword list (see clef.retrieval.lexical.analyze)
+            - model_params: k_1, b, k_3 (BM25) and c (PL2), Terrier defaults if not given
+        """
+        super().__init__(k, global_index)
+        self.first_stage_k = first_stage_k
+        self.stopwords = stopwords
+        self.model_params = model_params
+        self.index: Optional[LexicalIndex] = None
+        self.docnos: List[str] = []
+
+    def prepare(self, dataset: AuredDataset):
+        if not self.global_index:
+            return
+
+        corpus = collect_timeline_corpus(dataset)
+        self.index = LexicalIndex([analyze(text.strip(), self.stopwords) for text in corpus.texts], **self.model_params)
+        self.docnos = [docno.strip() for docno in corpus.docnos]
+        self.doc_rows = corpus.rows()
+        logger.info(f"built global native index over {len(self.index)} posts with {len(self.index.vocab)} terms")
+
+    def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs) -> List:
+        if self.global_index:
+            return self.retrieve_batch([(rumor_id, claim, timeline)])
+
+        # index over this rumor's timeline only, like the per-rumor DFIndexer in TerrierRetriever
+        index = LexicalIndex([analyze(post[2].strip(), self.stopwords) for post in timeline], **self.model_params)
+        ranked = rank_bm25_pl2(index, [analyze(clean_query(claim), self.stopwords)], first_stage_k=self.first_stage_k, k=self.k)[0]
+
+        return [[rumor_id.strip(), timeline[row][1].strip(), i+1, score] for i, (row, score) in enumerate(ranked)]
+
+    def retrieve_batch(self, rumors: List[Tuple[str, str, List]]) -> List:
+        """
+        retrieve evidence for many (rumor_id, claim, timeline) at once against the global index: BM25 and PL2 of all
+        claims are two sparse products with the precomputed posting weights, then each claim is ranked within its timeline
+
+        Returns:
+        [rumor_id, post_id, rank, score] rows of all rumors, in input order
+        """
+        if self.index is None:
+            raise RuntimeError("global index not built, call prepare(dataset) first")
+
+        queries = [analyze(clean_query(claim), self.stopwords) for _, claim, _ in rumors]
+        allowed = [rows for rows, _ in self.allowlists(rumors)]
+        ranked = rank_bm25_pl2(self.index, queries, allowed, first_stage_k=self.first_stage_k, k=self.k)
+
+        data = []
+        for (rumor_id, _, _), results in zip(rumors, ranked):
+            data.extend([rumor_id.strip(), self.docnos[row], i+1, score] for i, (row, score) in enumerate(results))
+        return data
@@ -1,9 +1,12 @@
+from typing import List
 import os
 import numpy as np
 from openai import OpenAI
 
-from clef.retrieval.retrieve import EvidenceRetriever
-from clef.utils.embedding import cosine_similarity
+from clef.retrieval.dense import DenseRetriever
+from clef.utils.embedding import OPENAI_EMBEDDING_DIMENSIONS, cosine_similarity, get_embeddings_packed
+from clef.utils.embedding_client import AsyncEmbeddingClient
+from clef.utils.embedding_store import get_embedding_store
 
 import logging
 logger = logging.getLogger(__name__)
@@ -55,49 +58,61 @@ def get_embedding_multiple(texts):
     return [r.embedding for r in response.data]
 
 
-class OpenAIRetriever(EvidenceRetriever):
-    def __init__(self, k, api_key=None):
-        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
+class OpenAIRetriever(DenseRetriever):
+    def __init__(self, k, api_key=None, model="text-embedding-3-small", embedding_store_dir=None, embedding_store_max_bytes=None, precompute=True, max_concurrency=1, rpm=None, tpm=None, base_url=None, ann=False, ann_nlist=None, ann_nprobe=8, index_dir=None, precision='float32', binary_prefilter=False, rescore_factor=10):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - api_key: OpenAI API key (OPENAI_API_KEY from the environment if None)
+            - model: embedding model
+            - embedding_store_dir: keep embeddings in a persistent store there, so identical texts are only embedded once across runs
+            - embedding_store_max_bytes: evict the oldest embeddings of the store once its vectors outgrow this (no limit if None)
+            - max_concurrency: if > 1, texts are embedded with concurrent packed requests by an AsyncEmbeddingClient
+            - rpm, tpm: requests/tokens per minute the concurrent requests have to stay under
+            - base_url: OpenAI-compatible endpoint (default OpenAI)
+            - precompute, ann, ann_nlist, ann_nprobe, index_dir, precision, binary_prefilter, rescore_factor: see DenseRetriever
+        """
+        super().__init__(k, model, precompute=precompute, ann=ann, ann_nlist=ann_nlist, ann_nprobe=ann_nprobe, index_dir=index_dir,
+                         precision=precision, binary_prefilter=binary_prefilter, rescore_factor=rescore_factor)
+        self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"), base_url=base_url)
         logger.info(f'OpenAI client initialized with {"API key from .env" if api_key else "provided API key"}')
-        super().__init__(k)
+        self.model = model
+        self.store = get_embedding_store(embedding_store_dir, model, OPENAI_EMBEDDING_DIMENSIONS[model], max_bytes=embedding_store_max_bytes) if embedding_store_dir else None
+        self.async_client = AsyncEmbeddingClient(
+            model=model, max_concurrency=max_concurrency, rpm=rpm, tpm=tpm, api_key=api_key or os.environ.get("OPENAI_API_KEY"), base_url=base_url
+        ) if max_concurrency > 1 else None
+        self.num_requests = 0
+
+    def embed(self, texts: List[str]):
+        # de-duplicated and packed into as few requests as the API limits allow
+        if self.async_client is not None:
+            embed_all = self.async_client.embed
+            embeddings = self.store.get_or_compute(texts, embed_all).tolist() if self.store is not None else embed_all(texts)
+            logger.info(f"embedded {len(texts)} texts, {self.async_client.num_requests} concurrent requests so far")
+        else:
+            requests_before = self.num_requests
+            embeddings = get_embeddings_packed(texts, model=self.model, store=self.store, embed_fn=self._embed)
+            logger.info(f"embedded {len(texts)} texts with {self.num_requests - requests_before} requests")
+        return embeddings
 
     def get_embedding(self, text):
+        if self.store is not None:
+            return self.store.get_or_compute([text], self._embed).tolist()[0]
+
         response = self.client.embeddings.create(
-            input=text, model="text-embedding-3-small"
+            input=text, model=self.model
         )
         return response.data[0].embedding
 
     def get_embedding_multiple(self, texts):
-        response = self.client.embeddings.create(
-            input=texts, model="text-embedding-3-small"
-        )
-        return [r.embedding for r in response.data]
-
-    def retrieve(self, rumor_id, claim, timeline, **kwargs):
-        logger.info(f"retrieving documents for rumor_id: {rumor_id}")
+        if self.store is not None:
+            return self.store.get_or_compute(texts, self._embed).tolist()
 
-        # Generate embedding for the claim
-        claim_embedding = self.get_embedding(claim)
+        return self._embed(texts)
 
-        # Generate embeddings for each entry in the timeline
-        timeline_embeddings = self.get_embedding_multiple(
-            [tweet[2] for tweet in timeline]
+    def _embed(self, texts):
+        self.num_requests += 1
+        response = self.client.embeddings.create(
+            input=texts, model=self.model
         )
-
-        # Compute similarities
-        similarities = [
-            cosine_similarity(claim_embedding, tweet_embedding)
-            for tweet_embedding in timeline_embeddings
-        ]
-
-        # Select the top k most relevant tweets based on similarities
-        most_relevant_tweet_indices = np.argsort(similarities)[-self.k:][::-1]
-
-        scores = [similarities[i] for i in most_relevant_tweet_indices]
-        relevant_tweets = [timeline[i] for i in most_relevant_tweet_indices]
-
-        ranked_results = []
-        for i, (cos_sim, tweet) in enumerate(zip(scores, relevant_tweets)):
-            ranked_results.append([rumor_id, tweet[1], i + 1, cos_sim])
-
-        return ranked_results
\ No newline at end of file
+        return [r.embedding for r in response.data]
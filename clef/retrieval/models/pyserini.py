@@ -1,8 +1,17 @@
-from pyserini.search.lucene import LuceneSearcher
+from typing import List, Optional
+import atexit
 import os
-import json
 import shutil
-import subprocess
+import tempfile
+import threading
+from pyserini.index.lucene import LuceneIndexer
+from pyserini.search.lucene import LuceneSearcher
+
+from clef.retrieval.retrieve import EvidenceRetriever
+from clef.retrieval.global_index import collect_timeline_corpus, global_index_path, timeline_rows
+
+import logging
+logger = logging.getLogger(__name__)
 
 def searchPyserini(rumor_id: str,
                    query: str,
@@ -14,83 +23,148 @@ def searchPyserini(rumor_id: str,
     
     # if you get the error "NameError: name '_C' is not defined" --> restart the Jupyter Kernel
     # if you get the error "...Java VM is already running..."    --> restart the Jupyter Kernel
-    
-    # ensure "working directory" exists (where we store intermediate data like the dynamic index that will be quered later)
-    if not os.path.exists(temp_dir_path):
-        os.mkdir(temp_dir_path)
 
-    # set up "dynamic" (= temporary) index file using timeline data
-    dynamic_index_filename = 'dynamic-index.jsonl'
-    with open(os.path.join(temp_dir_path, dynamic_index_filename), mode='w', encoding='utf8') as file:
-        for tweet in timeline:
-            id = tweet[1]
-            text = tweet[2]
-            file.write(json.dumps({'id': id, 'contents': text}) + '\n')
-    
-    # ensure index directory exists and is empty
-    if os.path.exists(index_path):
-        for filename in os.listdir(index_path):
-            if os.path.isfile(os.path.join(index_path, filename)):
-                os.remove(os.path.join(index_path, filename))
-    else:
-        os.mkdir(index_path)
-
-    # set up pyserini command since python embeddable is not released yet
-    nthreads = 1
-    command = f'python -m pyserini.index.lucene ' \
-    f'-input {temp_dir_path} ' \
-    f'-collection JsonCollection ' \
-    f'-generator DefaultLuceneDocumentGenerator ' \
-    f'-index {index_path} ' \
-    f'-threads {nthreads} ' \
-    f'-storePositions ' \
-    f'-storeDocvectors ' \
-    f'-storeRaw ' \
-    f'-language en'
-
-    result = subprocess.run(command, capture_output=True)
-
-    # intialize searcher using index directoy
-    searcher = LuceneSearcher(index_path)
-    hits = searcher.search(query)
-
-    ranked = []
-
-    for i, hit in enumerate(hits[:k]):
-        ranked += [[rumor_id, hit.docid, i+1, hit.score]]
-
-        # print debugging data
-        # doc = searcher.doc(hit.docid)
-        # json_doc = json.loads(doc.raw())
-        # wrap(f'{i+1:2} {hit.docid:4} {hit.score:.5f}\n{json_doc["contents"]}')
-
-    if cleanup_temp_dir:
-        shutil.rmtree('temp/')
-
-    return ranked
-
-from typing import List
-import json
-import os
-import shutil
-import subprocess
-from pyserini.search.lucene import LuceneSearcher
+    # kept for retrieve_evidence_old, indexes in-process like LuceneRetriever (index_path is no longer used)
+    retriever = LuceneRetriever(k, temp_dir_path=temp_dir_path, cleanup_temp_dir=cleanup_temp_dir)
+    try:
+        return retriever.retrieve(rumor_id, query, timeline)
+    finally:
+        if cleanup_temp_dir:
+            retriever.close()
 
-from clef.retrieval.retrieve import EvidenceRetriever
 class LuceneRetriever(EvidenceRetriever):
+    """
+    BM25 over a small Lucene index of each rumor's timeline
+
+    the index is built with pyserini's LuceneIndexer inside the already running JVM (no subprocess per rumor),
+    in a fresh directory per call under a scratch directory that belongs to this retriever and process. so several
+    retrievers, worker processes or threads of retrieve_many can run at the same time without overwriting each other's index.
+
+    with global_index=True, prepare(dataset) builds one index over all unique timeline posts instead, and each
+    rumor's query is filtered to the post ids of its timeline. collection statistics then come from the whole dataset.
+    """
     def __init__(self, k, 
-                 temp_dir_path: str = './temp',
-                 index_path: str = './temp/index',
+                 temp_dir_path: Optional[str] = None,
                  cleanup_temp_dir: bool = True,
-                 nthreads: int = 1
+                 nthreads: int = 1,
+                 language: str = 'en',
+                 global_index: bool = False,
+                 index_dir: Optional[str] = None,
                  ):
-        
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - temp_dir_path: parent directory of the scratch directory (system temp directory if None)
+            - cleanup_temp_dir: remove the scratch directory at close() or interpreter exit
+            - nthreads: indexing threads
+            - language: analyzer language of the index
+            - global_index: use one index over the whole dataset (see prepare) instead of one per rumor
+            - index_dir: directory to persist the global index in, so it is only built once per dataset (scratch directory if None)
+        """
         self.temp_dir_path = temp_dir_path
-        self.index_path = index_path
         self.cleanup_temp_dir = cleanup_temp_dir
         self.nthreads = nthreads
+        self.language = language
+        self._scratch_dir: Optional[str] = None
+        self._scratch_pid: Optional[int] = None
+        self._scratch_lock = threading.Lock()
+        self.global_index = global_index
+        self.index_dir = index_dir
+        self.global_searcher: Optional[LuceneSearcher] = None
+        self.doc_rows = {}
         super().__init__(k)
 
+    @property
+    def scratch_dir(self) -> str:
+        # one directory per process, a forked worker must not reuse the parent's index
+        with self._scratch_lock:
+            if self._scratch_dir is None or self._scratch_pid != os.getpid():
+                if self.temp_dir_path:
+                    os.makedirs(self.temp_dir_path, exist_ok=True)
+                self._scratch_dir = tempfile.mkdtemp(prefix=f'lucene-{os.getpid()}-', dir=self.temp_dir_path)
+                self._scratch_pid = os.getpid()
+                if self.cleanup_temp_dir:
+                    atexit.register(self.close)
+                logger.debug(f'using scratch directory {self._scratch_dir} for rumor indexes')
+            return self._scratch_dir
+
+    def build_index(self, timeline: List, index_path: Optional[str] = None) -> str:
+        """index the timeline posts ([url, post_id, text]) in a fresh directory (a new one under the scratch directory if index_path is None) and return its path"""
+        if index_path is None:
+            # unique per call, so concurrent rumors never delete or search each other's index
+            index_path = tempfile.mkdtemp(prefix='index-', dir=self.scratch_dir)
+        elif os.path.exists(index_path):
+            shutil.rmtree(index_path)
+
+        indexer = LuceneIndexer(index_path, args=[
+            '-index', index_path,
+            '-storePositions',
+            '-storeDocvectors',
+            '-storeRaw',
+            '-language', self.language,
+        ], threads=self.nthreads)
+        for tweet in timeline:
+            indexer.add_doc_dict({'id': tweet[1], 'contents': tweet[2]})
+        indexer.close()
+
+        return index_path
+
+    def prepare(self, dataset):
+        if not self.global_index:
+            return
+
+        corpus = collect_timeline_corpus(dataset)
+        index_path = global_index_path(self.index_dir or self.scratch_dir, 'lucene', corpus)
+
+        if not os.path.exists(index_path):
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            # build next to the final location and swap, so concurrent runs never open a half-built index
+            tmp_path = self.build_index([(None, docno, text) for docno, text in zip(corpus.docnos, corpus.texts)], f'{index_path}.{os.getpid()}.tmp')
+            try:
+                os.rename(tmp_path, index_path)
+            except OSError:
+                # another run finished the same index first
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            logger.info(f'built global lucene index over {len(corpus.docnos)} posts in {index_path}')
+        else:
+            logger.info(f'using global lucene index {index_path}')
+
+        if self.global_searcher is not None:
+            self.global_searcher.close()
+        self.global_searcher = LuceneSearcher(index_path)
+        self.doc_rows = corpus.rows()
+
+        from pyserini.analysis import get_lucene_analyzer
+        from pyserini.pyclass import autoclass
+        self._analyzer = get_lucene_analyzer(language=self.language)
+        self._query_generator = autoclass('io.anserini.search.query.BagOfWordsQueryGenerator')()
+        self._JTermInSetQuery = autoclass('org.apache.lucene.search.TermInSetQuery')
+        self._JBytesRef = autoclass('org.apache.lucene.util.BytesRef')
+        self._JArrayList = autoclass('java.util.ArrayList')
+
+    def retrieve_global(self, rumor_id: str, claim: str, timeline: List):
+        if self.global_searcher is None:
+            raise RuntimeError('global index not built, call prepare(dataset) first')
+
+        from pyserini.search.lucene.querybuilder import JBooleanClauseOccur, get_boolean_query_builder
+
+        _, allowed_ids = timeline_rows(timeline, self.doc_rows)
+        if not allowed_ids:
+            return []
+
+        # bag-of-words query (as LuceneSearcher builds it from a string), filtered to the timeline's post ids
+        ids = self._JArrayList()
+        for post_id in allowed_ids:
+            ids.add(self._JBytesRef(post_id))
+
+        builder = get_boolean_query_builder()
+        builder.add(self._query_generator.buildQuery('contents', self._analyzer, claim), JBooleanClauseOccur.must.value)
+        builder.add(self._JTermInSetQuery('id', ids), JBooleanClauseOccur.filter.value)
+
+        hits = self.global_searcher.search(builder.build())
+
+        return [[rumor_id, hit.docid, i+1, hit.score] for i, hit in enumerate(hits[:self.k])]
+
     def retrieve(self, 
                  rumor_id: str, 
                  claim: str, 
@@ -100,45 +174,23 @@ class LuceneRetriever(EvidenceRetriever):
         # if running in Jupyter:
         # if you get the error "NameError: name '_C' is not defined" --> restart the Jupyter Kernel
         # if you get the error "...Java VM is already running..."    --> restart the Jupyter Kernel
-        
-        # ensure "working directory" exists (where we store intermediate data like the dynamic index that will be quered later)
-        if not os.path.exists(self.temp_dir_path):
-            os.mkdir(self.temp_dir_path)
-
-        # set up "dynamic" (= temporary) index file using timeline data
-        dynamic_index_filename = 'dynamic-index.jsonl'
-        with open(os.path.join(self.temp_dir_path, dynamic_index_filename), mode='w', encoding='utf8') as file:
-            for tweet in timeline:
-                id = tweet[1]
-                text = tweet[2]
-                file.write(json.dumps({'id': id, 'contents': text}) + '\n')
-        
-        # ensure index directory exists and is empty
-        if os.path.exists(self.index_path):
-            for filename in os.listdir(self.index_path):
-                if os.path.isfile(os.path.join(self.index_path, filename)):
-                    os.remove(os.path.join(self.index_path, filename))
-        else:
-            os.mkdir(self.index_path)
 
-        # set up pyserini command since python embeddable is not released yet
-        
-        command = f'python -m pyserini.index.lucene ' \
-        f'-input {self.temp_dir_path} ' \
-        f'-collection JsonCollection ' \
-        f'-generator DefaultLuceneDocumentGenerator ' \
-        f'-index {self.index_path} ' \
-        f'-threads {self.nthreads} ' \
-        f'-storePositions ' \
-        f'-storeDocvectors ' \
-        f'-storeRaw ' \
-        f'-language en'
-
-        result = subprocess.run(command, capture_output=True)
-
-        # intialize searcher using index directoy
-        searcher = LuceneSearcher(self.index_path)
-        hits = searcher.search(claim)
+        if self.global_index:
+            return self.retrieve_global(rumor_id, claim, timeline)
+
+        if not timeline:
+            return []
+
+        # intialize searcher using index directoy, removed again once the rumor is done
+        index_path = self.build_index(timeline)
+        try:
+            searcher = LuceneSearcher(index_path)
+            try:
+                hits = searcher.search(claim)
+            finally:
+                searcher.close()
+        finally:
+            shutil.rmtree(index_path, ignore_errors=True)
 
         ranked = []
 
@@ -150,7 +202,14 @@ class LuceneRetriever(EvidenceRetriever):
             # json_doc = json.loads(doc.raw())
             # wrap(f'{i+1:2} {hit.docid:4} {hit.score:.5f}\n{json_doc["contents"]}')
 
-        if self.cleanup_temp_dir:
-            shutil.rmtree('./temp')
-
         return ranked
+
+    def close(self) -> None:
+        """remove the scratch directory of this process"""
+        if self.global_searcher is not None:
+            self.global_searcher.close()
+            self.global_searcher = None
+        if self._scratch_dir is not None and self._scratch_pid == os.getpid():
+            shutil.rmtree(self._scratch_dir, ignore_errors=True)
+            self._scratch_dir = None
+            atexit.unregister(self.close)
@@ -1,8 +1,13 @@
-from typing import List
+from typing import List, Optional
 from sentence_transformers import SentenceTransformer, util
+import numpy as np
 import torch
 
-from clef.retrieval.retrieve import EvidenceRetriever
+from clef.retrieval.dense import DenseRetriever
+from clef.utils.embedding_store import get_embedding_store
+
+import logging
+logger = logging.getLogger(__name__)
 
 embedder = SentenceTransformer("all-MiniLM-L6-v2")
 
@@ -43,45 +48,66 @@ def retrieve_relevant_documents_sbert(rumor_id, query, timeline, k=5):
     
     return docs
 
-class SBERTRetriever(EvidenceRetriever):
-    def __init__(self, k, embedding_model="all-MiniLM-L6-v2"):
+class SBERTRetriever(DenseRetriever):
+    def __init__(self, k, embedding_model="all-MiniLM-L6-v2", batch_size: int = 128, num_processes: int = 0, precompute: bool = True, embedding_store_dir: Optional[str] = None, embedding_store_max_bytes: Optional[int] = None, ann: bool = False, ann_nlist: Optional[int] = None, ann_nprobe: int = 8, index_dir: Optional[str] = None, precision: str = 'float32', binary_prefilter: bool = False, rescore_factor: int = 10):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - embedding_model: sentence-transformers model name
+            - batch_size: encoding batch size
+            - num_processes: encode with a pool of this many CPU processes (single process if < 2)
+            - embedding_store_dir: keep embeddings in a persistent store there, so identical texts are only encoded once across runs
+            - embedding_store_max_bytes: evict the oldest embeddings of the store once its vectors outgrow this (no limit if None)
+            - precompute, ann, ann_nlist, ann_nprobe, index_dir, precision, binary_prefilter, rescore_factor: see DenseRetriever
+        """
+        super().__init__(k, embedding_model, precompute=precompute, ann=ann, ann_nlist=ann_nlist, ann_nprobe=ann_nprobe, index_dir=index_dir,
+                         precision=precision, binary_prefilter=binary_prefilter, rescore_factor=rescore_factor)
+        self.embedding_model = embedding_model
         self.embedder = SentenceTransformer(embedding_model)
-        super().__init__(k)
-
-    def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs):
-    
-        corpus = [t[2] for t in timeline]
-        corpus_embeddings = self.embedder.encode(corpus, convert_to_tensor=True)
-
-        top_k = min(self.k, len(corpus))
-        query_embedding = self.embedder.encode(claim, convert_to_tensor=True)
-
-        # We use cosine-similarity and torch.topk to find the highest 5 scores
-        cos_scores = util.cos_sim(query_embedding, corpus_embeddings)[0] # type: ignore
-        top_results = torch.topk(cos_scores, k=top_k)
-
-        # if debug:
-        #     print("\n\n======================\n\n")
-        #     print("Query:", query)
-        #     evidence_ids = [e[1] for e in evidence]
-
-        found = []
-        data = []
-
-        for i, (score, idx) in enumerate(zip(top_results[0], top_results[1])):
-                id = timeline[idx][1]
-
-                # if debug:
-                #     is_evidence = id in evidence_ids
-                #     star = "(*)" if is_evidence else "\t"
-                #     print(star, '\t', "(Rank: {:.0f})".format(i+1), "(Score: {:.4f})".format(score), corpus[idx])
-                #     if is_evidence: found += [id]
-
-                data.append([rumor_id, id, i+1, score.item()])
-
-        # if debug:    
-        #     for _, ev_id, ev_text in evidence:
-        #         if ev_id not in found:
-        #                 print('(!) ', ev_text)
-        
-        return data
\ No newline at end of file
+        self.store = get_embedding_store(embedding_store_dir, embedding_model, self.embedder.get_sentence_embedding_dimension(), max_bytes=embedding_store_max_bytes) if embedding_store_dir else None
+        self.batch_size = batch_size
+        self.num_processes = num_processes
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.encode(texts)
+
+    def encode(self, texts: List[str], bucket_batches: int = 8) -> np.ndarray:
+        """
+        encode texts in buckets of similar token length, to keep padding low, and return them in input order
+
+        with an embedding store, only texts that are not in the store are encoded
+
+        Parameters:
+            - texts: texts to encode
+            - bucket_batches: number of batches per length bucket (single-process encoding only)
+        """
+        if self.store is not None:
+            return self.store.get_or_compute(texts, lambda missing: self._encode_bucketed(missing, bucket_batches))
+        return self._encode_bucketed(texts, bucket_batches)
+
+    def _encode_bucketed(self, texts: List[str], bucket_batches: int) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.embedder.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        lengths = [len(ids) for ids in self.embedder.tokenizer(texts, add_special_tokens=False)['input_ids']]
+        order = np.argsort(lengths, kind='stable')
+        sorted_texts = [texts[i] for i in order]
+
+        if self.num_processes > 1:
+            # the pool hands out consecutive chunks of the sorted texts, so each worker still gets similar lengths
+            pool = self.embedder.start_multi_process_pool(target_devices=['cpu'] * self.num_processes)
+            try:
+                sorted_embeddings = self.embedder.encode_multi_process(sorted_texts, pool, batch_size=self.batch_size)
+            finally:
+                self.embedder.stop_multi_process_pool(pool)
+        else:
+            bucket_size = self.batch_size * bucket_batches
+            sorted_embeddings = np.concatenate([
+                self.embedder.encode(sorted_texts[start:start+bucket_size], batch_size=self.batch_size, convert_to_numpy=True)
+                for start in range(0, len(sorted_texts), bucket_size)
+            ])
+
+        embeddings = np.empty_like(sorted_embeddings)
+        embeddings[order] = sorted_embeddings
+        logger.info(f"encoded {len(texts)} texts (max {max(lengths)} tokens) with batch size {self.batch_size}")
+        return embeddings
@@ -1,7 +1,8 @@
-from typing import List
+from typing import List, Optional, Tuple
+import os
 import pandas as pd
 
-from clef.retrieval.retrieve import EvidenceRetriever
+from clef.retrieval.global_index import GlobalIndexRetriever, TimelineCorpus, collect_timeline_corpus, global_index_path
 from clef.utils.data_loading import AuredDataset, AuthorityPost
 
 from pyterrier.batchretrieve import BatchRetrieve
@@ -14,16 +15,99 @@ from ir_measures import R,P,MAP
 import logging
 logger = logging.getLogger(__name__)
 
-class TerrierRetriever(EvidenceRetriever):
-    def __init__(self, k, filename=""):
-        super().__init__(k)
+class TerrierRetriever(GlobalIndexRetriever):
+    def __init__(self, k, filename="", global_index: bool = False, index_dir: Optional[str] = None):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - global_index: index all unique timeline posts of the dataset once (see prepare) and restrict each rumor to its timeline, instead of one index per rumor
+            - index_dir: directory to persist the global index in, so it is only built once per dataset (in-memory if None)
+        """
+        super().__init__(k, global_index)
+        self.index_dir = index_dir
+        self.global_bm25 = None
+        self.global_pl2 = None
+        self.global_pipeline = None
+        # fingerprint of the corpus the global index was built over
+        self.global_fingerprint = None
         # init pyterrier
         import pyterrier as pt
         if not pt.started():
             pt.init(boot_packages=["com.github.terrierteam:terrier-prf:-SNAPSHOT"])
 
+    def prepare(self, dataset: AuredDataset):
+        if self.global_index:
+            self.build_global_index(dataset)
+
+    def build_global_index(self, dataset: AuredDataset, corpus: Optional[TimelineCorpus] = None):
+        """index all unique timeline posts of the dataset once (on disk under index_dir, or in memory)"""
+        import pyterrier as pt
+
+        corpus = corpus or collect_timeline_corpus(dataset)
+        df = pd.DataFrame({"docno": [docno.strip() for docno in corpus.docnos], "text": [text.strip() for text in corpus.texts]})
+
+        if self.index_dir:
+            index_path = global_index_path(self.index_dir, "terrier", corpus)
+            if os.path.exists(os.path.join(index_path, "data.properties")):
+                logger.info(f"using global terrier index {index_path}")
+                indexref = pt.IndexRef.of(os.path.join(index_path, "data.properties"))
+            else:
+                indexref = DFIndexer(index_path, overwrite=True).index(df["text"], df)
+                logger.info(f"built global terrier index over {len(df)} posts in {index_path}")
+        else:
+            indexref = DFIndexer(index_path="", type=IndexingType.MEMORY).index(df["text"], df)
+            logger.info(f"built global in-memory terrier index over {len(df)} posts")
+
+        # same pipeline as retrieve(), the input rows (one per timeline post) restrict scoring to the rumor's timeline
+        bm25 = BatchRetrieve(indexref, wmodel="BM25", controls={"termpipelines": "Stopwords,PorterStemmer"}, metadata=["docno", "text"])
+        pl2 = BatchRetrieve(indexref, wmodel="PL2", controls={"termpipelines": "Stopwords,PorterStemmer"}, metadata=["docno", "text"])
+        self.global_bm25, self.global_pl2 = bm25, pl2
+        self.global_pipeline = (bm25 % 10) >> (pl2 % 5)
+        self.doc_rows = corpus.rows()
+        self.global_fingerprint = corpus.fingerprint
+
+    def batch_topics(self, rumors: List[Tuple[str, str, List[AuthorityPost]]]) -> pd.DataFrame:
+        """
+        one topics dataframe for many (rumor_id, claim, timeline), with a row per timeline post
+
+        the docno column makes BatchRetrieve score only the given posts, so each rumor stays scoped to its timeline
+        """
+        qids, queries, docnos = [], [], []
+        for (rumor_id, claim, _), (_, allowed_ids) in zip(rumors, self.allowlists(rumors)):
+            # clean claim, keep only alphanumeric chars
+            query = "".join([c if c.isalnum() else " " for c in claim]).strip()
+            qids.extend([rumor_id.strip()] * len(allowed_ids))
+            queries.extend([query] * len(allowed_ids))
+            docnos.extend(post_id.strip() for post_id in allowed_ids)
+        return pd.DataFrame({"qid": qids, "query": queries, "docno": docnos})
+
+    def retrieve_batch(self, rumors: List[Tuple[str, str, List[AuthorityPost]]], pipeline=None) -> List:
+        """
+        retrieve evidence for many (rumor_id, claim, timeline) with one transform over the global index, the results
+        come back grouped by qid
+
+        Returns:
+        [rumor_id, post_id, rank, score] rows of all rumors
+        """
+        if self.global_pipeline is None:
+            raise RuntimeError("global index not built, call prepare(dataset) first")
+
+        topics = self.batch_topics(rumors)
+        if topics.empty:
+            return []
+
+        rtr_df = (pipeline or self.global_pipeline)(topics)
+
+        return [[row.qid, row.docno, int(row.rank)+1, row.score] for row in rtr_df.itertuples()]
+
+    def retrieve_global(self, rumor_id: str, claim: str, timeline: List[AuthorityPost]) -> List:
+        return self.retrieve_batch([(rumor_id, claim, timeline)])
+
     def retrieve(self, rumor_id: str, claim: str, timeline: List[AuthorityPost], **kwargs) -> List:
         logger.info(f"retrieving documents for rumor_id: {rumor_id}")
+
+        if self.global_index:
+            return self.retrieve_global(rumor_id, claim, timeline)
         
         # do retrieval "on-the-fly"
         data = []
@@ -64,11 +148,13 @@ class TerrierRetriever(EvidenceRetriever):
 
 
     def retrieve_ds(self, dataset: AuredDataset, filename: str):
-        # clear output file since we only append later
         if not filename.endswith(".trec.txt"):
             raise ValueError("filename does not end with .trec.txt")
+
+        if self.global_index:
+            return self.retrieve_ds_batched(dataset, filename)
         
-        with open(filename, "w"): pass
+        results = []
 
         for i, entry in enumerate(dataset[:]):
             data = []
@@ -94,5 +180,32 @@ class TerrierRetriever(EvidenceRetriever):
             pl2 = BatchRetrieve(indexref, wmodel="PL2", controls={"termpipelines": "Stopwords,PorterStemmer"}, metadata=["docno", "text"])
             pipeline = (bm25) >> (pl2 % 5)
             
-            rtr = pipeline(data)
-            write_results(rtr, filename, "trec", append=True)
+            results.append(pipeline(data))
+
+        # write the whole run at once instead of re-opening the file in append mode for every rumor
+        if results:
+            write_results(pd.concat(results, ignore_index=True), filename, "trec")
+        else:
+            with open(filename, "w"): pass
+
+    def retrieve_ds_batched(self, dataset: AuredDataset, filename: str):
+        """
+        retrieve_ds with the index built once for the whole dataset and all rumors submitted as one topics dataframe
+
+        the global index of an earlier prepare/retrieve_ds call is reused as long as the dataset has the same timeline posts
+        """
+        corpus = collect_timeline_corpus(dataset)
+        if self.global_bm25 is None or self.global_fingerprint != corpus.fingerprint:
+            self.build_global_index(dataset, corpus)
+        else:
+            logger.info(f"reusing global terrier index over {len(corpus.docnos)} posts")
+
+        topics = self.batch_topics([(entry['id'], entry['rumor'], entry['timeline']) for entry in dataset])
+        logger.info(f"retrieving for {topics['qid'].nunique()} rumors ({len(topics)} timeline posts) in one batch")
+
+        if topics.empty:
+            with open(filename, "w"): pass
+            return
+
+        pipeline = self.global_bm25 >> (self.global_pl2 % 5)
+        write_results(pipeline(topics), filename, "trec")
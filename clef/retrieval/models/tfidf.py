@@ -1,8 +1,15 @@
-from typing import List
+from typing import List, Optional, Tuple
+import os
+import pickle
+import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
-from clef.retrieval.retrieve import EvidenceRetriever
+from clef.retrieval.dense import top_k
+from clef.retrieval.global_index import GlobalIndexRetriever, collect_timeline_corpus, global_index_path
+
+import logging
+logger = logging.getLogger(__name__)
 
 def retrieve_relevant_documents_tfidf(rumor_id, query, timeline, k=5):
     # Get only doc texts
@@ -38,11 +45,54 @@ def retrieve_relevant_documents_tfidf(rumor_id, query, timeline, k=5):
     
     # return ranked_tuples
 
-class TFIDFRetriever(EvidenceRetriever):
-    def __init__(self, k):
-        super().__init__(k)
+class TFIDFRetriever(GlobalIndexRetriever):
+    def __init__(self, k, global_index: bool = False, index_dir: Optional[str] = None):
+        """
+        Parameters:
+            - k: number of posts to retrieve per rumor
+            - global_index: fit one vectorizer over all unique timeline posts of the dataset (see prepare) and score claims in batches,
+              instead of fitting one per rumor (idf over the rumor's claim and timeline, kept for parity with earlier runs)
+            - index_dir: directory to persist the global index in, so it is only built once per dataset
+        """
+        super().__init__(k, global_index)
+        self.index_dir = index_dir
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self.doc_matrix = None
+        self.claim_matrix = None
+        self.claim_rows = {}
+
+    def prepare(self, dataset):
+        if not self.global_index:
+            return
+
+        corpus = collect_timeline_corpus(dataset)
+        index_file = f'{global_index_path(self.index_dir, "tfidf", corpus)}.pkl' if self.index_dir else None
+
+        if index_file and os.path.exists(index_file):
+            with open(index_file, 'rb') as file:
+                self.vectorizer, self.doc_matrix = pickle.load(file)
+            logger.info(f'loaded global tf-idf index over {len(corpus.docnos)} posts from {index_file}')
+        else:
+            self.vectorizer = TfidfVectorizer()
+            self.doc_matrix = self.vectorizer.fit_transform(corpus.texts).tocsr()
+            logger.info(f'built global tf-idf index over {len(corpus.docnos)} posts')
+            if index_file:
+                os.makedirs(self.index_dir, exist_ok=True) # type: ignore
+                with open(f'{index_file}.tmp', 'wb') as file:
+                    pickle.dump((self.vectorizer, self.doc_matrix), file, protocol=5)
+                os.replace(f'{index_file}.tmp', index_file)
+
+        self.doc_rows = corpus.rows()
+
+        # all claims of the dataset in one transform call
+        claims = list(dict.fromkeys(item['rumor'] for item in dataset))
+        self.claim_matrix = self.vectorizer.transform(claims).tocsr()
+        self.claim_rows = {claim: row for row, claim in enumerate(claims)}
 
     def retrieve(self, rumor_id: str, claim: str, timeline: List, **kwargs):
+        if self.global_index:
+            return self.retrieve_batch([(rumor_id, claim, timeline)])
+
         # Get only doc texts
         documents = [tweet[2] for tweet in timeline]
         tweet_ids = [tweet[1] for tweet in timeline]
@@ -50,7 +100,7 @@ class TFIDFRetriever(EvidenceRetriever):
         # Combine query and documents for TF-IDF vectorization
         combined_texts = [claim] + documents
 
-        # Generate TF-IDF vectors
+        # Generate TF-IDF vectors, idf of this rumor's timeline only
         vectorizer = TfidfVectorizer()
         tfidf_matrix = vectorizer.fit_transform(combined_texts)
 
@@ -64,4 +114,45 @@ class TFIDFRetriever(EvidenceRetriever):
         for i, idx in enumerate(ranked_doc_indices[:self.k]):
             ranked.append([rumor_id, tweet_ids[idx], i, similarity_scores[0][idx]])
 
-        return ranked
\ No newline at end of file
+        return ranked
+
+    def retrieve_batch(self, rumors: List[Tuple[str, str, List]]) -> List:
+        """
+        retrieve evidence for many (rumor_id, claim, timeline) at once against the global index: all claims are
+        transformed in one call (claims of the prepared dataset are cached) and each claim is scored against the
+        rows of its timeline only, all (claim, post) pairs in one sparse elementwise product
+
+        ties are ranked like a stable argsort()[::-1] over the timeline: the later timeline post first
+
+        Returns:
+        [rumor_id, post_id, rank, score] rows of all rumors, in input order
+        """
+        if self.vectorizer is None:
+            raise RuntimeError('global index not built, call prepare(dataset) first')
+
+        claims = [claim for _, claim, _ in rumors]
+        if all(claim in self.claim_rows for claim in claims):
+            queries = self.claim_matrix[[self.claim_rows[claim] for claim in claims]]
+        else:
+            queries = self.vectorizer.transform(claims)
+
+        # one (claim, post) pair per timeline row, grouped by rumor in timeline order
+        timelines = self.allowlists(rumors)
+        lengths = np.array([len(rows) for rows, _ in timelines], dtype=np.int64)
+        query_rows = np.repeat(np.arange(len(rumors)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        doc_rows = np.fromiter((row for rows, _ in timelines for row in rows), dtype=np.int64, count=lengths.sum())
+
+        # tf-idf rows are l2-normalized, so the dot product of a pair is its cosine similarity
+        pair_scores = np.asarray(queries[query_rows].multiply(self.doc_matrix[doc_rows]).sum(axis=1)).ravel() # type: ignore
+
+        # padded with -inf to the longest timeline, columns reversed so ties go to the later post
+        width = lengths.max(initial=0)
+        masked = np.full((len(rumors), width), -np.inf)
+        masked[query_rows, width - 1 - positions] = pair_scores
+
+        ranked = []
+        for (rumor_id, _, _), (_, tweet_ids), results in zip(rumors, timelines, top_k(masked, self.k)):
+            ranked.extend([rumor_id, tweet_ids[width - 1 - idx], i, score] for i, (idx, score) in enumerate(results))
+
+        return ranked
@@ -0,0 +1,163 @@
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+import time
+
+import numpy as np
+
+from clef.retrieval.dense import top_k
+
+import logging
+logger = logging.getLogger(__name__)
+
+# reduced precision storage for the dense retrievers: float16, int8 (symmetric, one scale per dimension) and
+# 1-bit sign codes. with the binary prefilter a query ranks its candidates by hamming distance of the sign codes,
+# only a shortlist of rescore_factor * k candidates is rescored with the stored vectors.
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class QuantizationReport(NamedTuple):
+    """memory and recall@k of a quantized index against exact float32 search"""
+    precision: str
+    binary_prefilter: bool
+    nbytes: int             # bytes of the codes and vectors of the index
+    float32_nbytes: int     # bytes of the same vectors in float32
+    recall: float           # mean recall@k against exact float32 search
+    latency_ms: float       # mean search time per query
+    exact_latency_ms: float # mean exact float32 search time per query
+
+
+def binary_codes(vectors: np.ndarray) -> np.ndarray:
+    """1-bit sign codes of vectors, packed 8 dimensions per byte"""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def hamming_distances(codes: np.ndarray, code: np.ndarray) -> np.ndarray:
+    """hamming distance of each row of codes to code"""
+    if codes.shape[1] % 8 == 0 and hasattr(np, 'bitwise_count'):
+        # numpy >= 2.0: popcount 64 bits at a time
+        codes, code = codes.view(np.uint64), np.ascontiguousarray(code).view(np.uint64)
+        return np.bitwise_count(np.bitwise_xor(codes, code)).sum(axis=1, dtype=np.int64)
+    return POPCOUNT[np.bitwise_xor(codes, code)].sum(axis=1, dtype=np.int64)
+
+
+class QuantizedIndex(object):
+    """
+    normalized vectors stored in float16 or int8, optionally with binary codes for a hamming prefilter
+
+    indexing with rows (index[rows]) returns the dequantized float32 vectors, e.g. for the claims used as queries
+    """
+    def __init__(self, vectors: np.ndarray, precision: str = 'int8', binary_prefilter: bool = True, rescore_factor: int = 10) -> None:
+        """
+        Parameters:
+            - vectors: (n x dim) normalized float vectors
+            - precision: storage precision of the vectors used for scoring, one of PRECISIONS
+            - binary_prefilter: keep 1-bit sign codes and only rescore the candidates closest in hamming distance
+            - rescore_factor: the prefilter keeps rescore_factor * k candidates per query
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f'unknown precision {precision}, expected one of {PRECISIONS}')
+        self.precision = precision
+        self.binary_prefilter = binary_prefilter
+        self.rescore_factor = rescore_factor
+        self.dim = vectors.shape[1]
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.scale: Optional[np.ndarray] = None
+        if precision == 'int8':
+            # symmetric quantization with one scale per dimension, so rare large components are not clipped
+            self.scale = np.abs(vectors).max(axis=0) / 127.0
+            self.scale[self.scale == 0] = 1.0
+            self.vectors = np.round(vectors / self.scale).astype(np.int8)
+        else:
+            self.vectors = vectors.astype(precision)
+        self.codes = binary_codes(vectors) if binary_prefilter else None
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        vectors = self.vectors[rows].astype(np.float32)
+        return vectors * self.scale if self.scale is not None else vectors
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.codes.nbytes if self.codes is not None else 0) + (self.scale.nbytes if self.scale is not None else 0)
+
+    def _scores(self, rows: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        # for int8 the scale is folded into the query, the codes are only widened to float32
+        vectors = (self.vectors if rows is None else self.vectors[rows]).astype(np.float32, copy=False)
+        return vectors @ (query * self.scale) if self.scale is not None else vectors @ query
+
+    def search(self, queries: np.ndarray, k: int, allowed: Optional[Sequence[Sequence[int]]] = None) -> List[List[Tuple[int, float]]]:
+        """
+        top-k rows of each query, prefiltered by hamming distance if the index has binary codes
+
+        Parameters:
+            - queries: (queries x dim) normalized float32 query vectors
+            - k: number of results per query
+            - allowed: per query, the only rows it may return (e.g. its timeline)
+
+        Returns:
+        per query, a list of (row, score) ordered by rank
+        """
+        query_codes = binary_codes(queries) if self.codes is not None else None
+
+        results = []
+        for i, query in enumerate(queries):
+            rows = np.unique(np.asarray(allowed[i], dtype=np.int64)) if allowed is not None else None
+            shortlist = self.rescore_factor * k
+            if query_codes is not None and (len(rows) if rows is not None else len(self)) > shortlist:
+                distances = hamming_distances(self.codes if rows is None else self.codes[rows], query_codes[i])
+                closest = np.argpartition(distances, shortlist - 1)[:shortlist]
+                rows = closest if rows is None else rows[closest]
+            if rows is not None and len(rows) == 0:
+                results.append([])
+                continue
+            # without an allowlist or prefilter all rows are scored in place, without gathering them first
+            scores = self._scores(rows, query)
+            results.append([(int(rows[j]) if rows is not None else j, score) for j, score in top_k(scores[None, :], k)[0]])
+        return results
+
+    def evaluate(self, queries: np.ndarray, vectors: np.ndarray, k: int, allowed: Optional[Sequence[Sequence[int]]] = None) -> QuantizationReport:
+        """
+        memory saved and recall@k lost against exact search over the float32 vectors the index was built from, logged and returned
+
+        Parameters:
+            - queries: (queries x dim) normalized float32 query vectors
+            - vectors: the normalized float32 vectors of the index
+            - k: number of results per query
+            - allowed: per query, the only rows it may return
+        """
+        start = time.monotonic()
+        exact = []
+        for i, query in enumerate(queries):
+            rows = np.unique(np.asarray(allowed[i], dtype=np.int64)) if allowed is not None else np.arange(len(vectors))
+            exact.append({int(rows[j]) for j, _ in top_k((np.asarray(vectors[rows]) @ query)[None, :], k)[0]})
+        exact_latency = (time.monotonic() - start) * 1000 / max(len(queries), 1)
+
+        start = time.monotonic()
+        found = self.search(queries, k, allowed)
+        latency = (time.monotonic() - start) * 1000 / max(len(queries), 1)
+
+        recalls = [len({row for row, _ in results} & truth) / len(truth) for results, truth in zip(found, exact) if truth]
+        report = QuantizationReport(
+            self.precision, self.binary_prefilter, self.nbytes, len(vectors) * self.dim * 4,
+            float(np.mean(recalls)) if recalls else 1.0, latency, exact_latency,
+        )
+        logger.info(
+            f'{report.precision}{" + binary prefilter" if report.binary_prefilter else ""}: {report.nbytes / 2**20:.1f}MiB '
+            f'({report.float32_nbytes / max(report.nbytes, 1):.1f}x smaller than float32), recall@{k}={report.recall:.4f}, '
+            f'{report.latency_ms:.3f}ms/query (exact {report.exact_latency_ms:.3f}ms/query)'
+        )
+        return report
+
+
+def compare_precisions(vectors: np.ndarray, queries: np.ndarray, k: int, allowed: Optional[Sequence[Sequence[int]]] = None, rescore_factor: int = 10) -> List[QuantizationReport]:
+    """memory/recall report of every precision, with and without the binary prefilter"""
+    return [
+        QuantizedIndex(vectors, precision, binary_prefilter, rescore_factor).evaluate(queries, vectors, k, allowed)
+        for precision in PRECISIONS for binary_prefilter in (False, True)
+    ]
@@ -31,13 +31,63 @@ def retrieve_evidence_old(dataset: List, method: str, kwargs: Dict = {}):
 
     return data
 
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Tuple
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
+import time
 from clef.utils.data_loading import AuredDataset
 
 import logging
 logger = logging.getLogger(__name__)
 
+
+def dataset_rumors(dataset: Iterable) -> List[Tuple[str, str, List]]:
+    """(rumor_id, claim, timeline) of every rumor of the dataset, in dataset order"""
+    return [(item["id"], item["rumor"], item["timeline"]) for item in dataset]
+
+
+def order_by_rumors(rumors: List[Tuple[str, str, List]], data: List) -> List:
+    """sort [rumor_id, post_id, rank, score] rows into the order of rumors, keeping the order within each rumor"""
+    positions = {rumor_id.strip(): i for i, (rumor_id, _, _) in enumerate(rumors)}
+    return sorted(data, key=lambda row: positions.get(str(row[0]).strip(), len(positions)))
+
+
+def group_by_rumor(data: List) -> Dict[str, List]:
+    """[rumor_id, post_id, rank, score] rows grouped by (stripped) rumor id, keeping their order"""
+    groups: Dict[str, List] = {}
+    for row in data:
+        groups.setdefault(str(row[0]).strip(), []).append(row)
+    return groups
+
+
+def with_k(retriever: "EvidenceRetriever", k: int) -> "EvidenceRetriever":
+    """shallow copy of retriever that retrieves k posts per rumor, the caller's retriever keeps its own k"""
+    component = copy.copy(retriever)
+    component.k = k
+    return component
+
+
+def _timed_retrieve(retriever: "EvidenceRetriever", rumor: Tuple[str, str, List], kwargs: Dict) -> Tuple[List, float]:
+    start = time.monotonic()
+    rows = retriever.retrieve(*rumor, **kwargs)
+    return rows, time.monotonic() - start
+
+
+# retriever of a process pool worker, sent once per worker by the pool initializer instead of pickled with every rumor
+_worker_retriever: Optional["EvidenceRetriever"] = None
+
+
+def _init_worker(retriever: "EvidenceRetriever") -> None:
+    global _worker_retriever
+    _worker_retriever = retriever
+
+
+def _worker_retrieve(rumor: Tuple[str, str, List], kwargs: Dict) -> Tuple[List, float]:
+    # module level, so process pools can pickle it
+    return _timed_retrieve(_worker_retriever, rumor, kwargs)
+
+
 # Base class for retrieval
 class EvidenceRetriever(ABC):
     def __init__(self, k):
@@ -48,19 +98,68 @@ class EvidenceRetriever(ABC):
         """Retrieve documents based on the input parameters."""
         pass
 
+    def prepare(self, dataset: AuredDataset) -> None:
+        """Called once with the whole dataset before retrieval, e.g. to build a global index. Does nothing by default."""
+        pass
+
+    def retrieve_many(self, dataset: AuredDataset, num_workers: int = 1, executor: str = "thread", **kwargs) -> List:
+        """
+        retrieve evidence for all rumors of the dataset, backends override this to score all rumors at once
+
+        by default rumors go through retrieve one at a time, or fanned out over a pool of num_workers. results keep
+        the dataset order either way.
+
+        Parameters:
+            - dataset: rumors to retrieve evidence for, prepare(dataset) has to be called first
+            - num_workers: number of rumors retrieved concurrently (sequential if < 2)
+            - executor: "thread" or "process" pool, process pools need a picklable retriever (not the JVM based ones)
+            - kwargs: passed to retrieve
+
+        Returns:
+        [rumor_id, post_id, rank, score] rows of all rumors, in dataset order
+        """
+        rumors = dataset_rumors(dataset)
+
+        if num_workers > 1 and executor == "process":
+            # the retriever is pickled once per worker, rumors are sent in chunks
+            chunksize = max(1, len(rumors) // (num_workers * 4))
+            with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+                # map returns results in input order, whichever worker finishes first
+                return self._collect(rumors, pool.map(_worker_retrieve, rumors, [kwargs] * len(rumors), chunksize=chunksize))
+        if num_workers > 1:
+            if executor != "thread":
+                raise ValueError(f'unknown executor {executor}, expected "thread" or "process"')
+            with ThreadPoolExecutor(max_workers=num_workers) as pool:
+                # threads share this retriever, retrieve has to be safe to call concurrently
+                return self._collect(rumors, pool.map(_timed_retrieve, [self] * len(rumors), rumors, [kwargs] * len(rumors)))
+
+        return self._collect(rumors, (_timed_retrieve(self, rumor, kwargs) for rumor in rumors))
+
+    def _collect(self, rumors: List[Tuple[str, str, List]], results: Iterable[Tuple[List, float]]) -> List:
+        data = []
+        for i, ((rumor_id, _, _), (retrieved_data, seconds)) in enumerate(zip(rumors, results)):
+            logger.info(f"({i+1}/{len(rumors)}) retrieved {len(retrieved_data)} posts for rumor_id {rumor_id} in {seconds:.3f}s using {self.__class__.__name__}")
+            logger.debug(f"retrieved data: {retrieved_data}")
+            data.extend(retrieved_data)
+        return data
+
 
 # Specific retriever subclasses
-def retrieve_evidence(dataset: AuredDataset, retriever: EvidenceRetriever, kwargs: Dict = {}):
-    data = []
+def retrieve_evidence(dataset: AuredDataset, retriever: EvidenceRetriever, kwargs: Dict = {}, num_workers: int = 1, executor: str = "thread"):
+    """
+    prepare the retriever on the dataset and retrieve evidence for all rumors with retriever.retrieve_many
 
-    for i, item in enumerate(dataset):
-        rumor_id = item["id"]
-        claim = item["rumor"]
-        timeline = item["timeline"]
-        logger.info(f"({i+1}/{len(dataset)}) Retrieving data for rumor_id {rumor_id} using {retriever.__class__}")
+    Parameters:
+        - dataset: rumors to retrieve evidence for
+        - retriever: retriever to use
+        - kwargs: passed to retrieve
+        - num_workers, executor: pool used by the default retrieve_many (see EvidenceRetriever.retrieve_many)
+    """
+    start = time.monotonic()
+    retriever.prepare(dataset)
+    prepared = time.monotonic()
 
-        retrieved_data = retriever.retrieve(rumor_id, claim, timeline, **kwargs)
-        data.extend(retrieved_data)
-        logger.debug(f"retrieved data: {retrieved_data}")
+    data = retriever.retrieve_many(dataset, num_workers=num_workers, executor=executor, **kwargs)
+    logger.info(f"retrieved {len(data)} rows for {len(dataset)} rumors with {retriever.__class__.__name__} in {time.monotonic() - start:.2f}s (prepare {prepared - start:.2f}s)")
 
     return data
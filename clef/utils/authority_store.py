@@ -0,0 +1,172 @@
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class AuthorityInfo(NamedTuple):
+    name: str
+    bio: str
+
+
+def normalize_account_url(url: str) -> str:
+    """
+    normalize an authority account url so 'twitter.com/x', ' https://twitter.com/x/' etc. map to the same key
+    """
+    account = url.strip().rstrip('/')
+    if not account.startswith('https://'):
+        account = f'https://{account}'
+    return account
+
+
+class AuthorityStore(ABC):
+    """
+    lookup of translated name and bio per authority account, keyed by normalized account url
+
+    use get_authority_store() to get a store that is loaded once per process and shared between datasets
+    """
+    @abstractmethod
+    def get(self, account: str) -> Optional[AuthorityInfo]:
+        """info of the account, None if it is not in the store"""
+        pass
+
+    def __getitem__(self, account: str) -> AuthorityInfo:
+        info = self.get(account)
+        if info is None:
+            raise KeyError(account)
+        return info
+
+    def __contains__(self, account: str) -> bool:
+        return self.get(account) is not None
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class InMemoryAuthorityStore(AuthorityStore):
+    def __init__(self, filepath: Union[str, os.PathLike]) -> None:
+        self.filepath = os.fspath(filepath)
+        with open(self.filepath, 'r') as file:
+            author_info = json.load(file)
+
+        self.authorities: Dict[str, AuthorityInfo] = {
+            normalize_account_url(account): AuthorityInfo(info["translated_name"], info["translated_bio"])
+            for account, info in author_info.items()
+        }
+        logger.info(f'loaded {len(self.authorities)} authorities from {self.filepath}')
+
+    def get(self, account: str) -> Optional[AuthorityInfo]:
+        return self.authorities.get(normalize_account_url(account))
+
+    def __len__(self) -> int:
+        return len(self.authorities)
+
+
+class SQLiteAuthorityStore(AuthorityStore):
+    """
+    authority store backed by an SQLite sidecar file (built once from the json file, rebuilt if the json changes)
+
+    the database is opened read-only and memory-mapped, so worker processes share the OS page cache
+    instead of each holding their own parsed copy of the json.
+    """
+    def __init__(self, filepath: Union[str, os.PathLike], db_path: Optional[Union[str, os.PathLike]] = None, mmap_size: int = 256 * 1024 * 1024) -> None:
+        self.filepath = os.fspath(filepath)
+        self.db_path = os.fspath(db_path) if db_path else f'{self.filepath}.authority.sqlite'
+        self.mmap_size = mmap_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+        if self.is_stale():
+            self.build()
+
+    def _source_fingerprint(self) -> str:
+        stat = os.stat(self.filepath)
+        return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+    def is_stale(self) -> bool:
+        if not os.path.exists(self.db_path):
+            return True
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        except sqlite3.DatabaseError:
+            return True
+        return row is None or row[0] != self._source_fingerprint()
+
+    def build(self) -> None:
+        with open(self.filepath, 'r') as file:
+            author_info = json.load(file)
+
+        tmp_path = f'{self.db_path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("CREATE TABLE authorities (account TEXT PRIMARY KEY, name TEXT, bio TEXT) WITHOUT ROWID")
+            conn.executemany(
+                "INSERT OR REPLACE INTO authorities VALUES (?, ?, ?)",
+                ((normalize_account_url(account), info["translated_name"], info["translated_bio"]) for account, info in author_info.items()),
+            )
+            conn.execute("INSERT INTO meta VALUES ('source', ?)", (self._source_fingerprint(),))
+        conn.close()
+
+        # atomic swap, so concurrent readers never see a half-written database
+        os.replace(tmp_path, self.db_path)
+        logger.info(f'built authority store {self.db_path} with {len(author_info)} authorities from {self.filepath}')
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # connections must not be shared across fork(), open one per process
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+            self._conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, account: str) -> Optional[AuthorityInfo]:
+        row = self.conn.execute(
+            "SELECT name, bio FROM authorities WHERE account = ?", (normalize_account_url(account),)
+        ).fetchone()
+        return AuthorityInfo(*row) if row else None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM authorities").fetchone()[0]
+
+    def __getstate__(self):
+        # don't pickle the connection, workers reconnect lazily
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_conn_pid'] = None
+        return state
+
+
+# process-wide cache, keyed by (absolute path, backend, source mtime)
+_stores: Dict[Tuple[str, str, int], AuthorityStore] = {}
+
+def get_authority_store(filepath: Union[str, os.PathLike], backend: str = 'memory') -> AuthorityStore:
+    """
+    return the authority store for filepath, loading it only on first use in this process
+
+    Parameters:
+        - filepath: path to the author info json, mapping account url -> {"translated_name": ..., "translated_bio": ...}
+        - backend: 'memory' (dict in this process) or 'sqlite' (memory-mapped sidecar database)
+    """
+    path = os.path.abspath(os.fspath(filepath))
+    key = (path, backend, os.stat(path).st_mtime_ns)
+
+    if key not in _stores:
+        if backend == 'memory':
+            _stores[key] = InMemoryAuthorityStore(path)
+        elif backend == 'sqlite':
+            _stores[key] = SQLiteAuthorityStore(path)
+        else:
+            raise ValueError(f'unknown authority store backend "{backend}"')
+
+    return _stores[key]
@@ -1,8 +1,16 @@
-from typing import Generator, List, Tuple, Dict, TypedDict, Union, Optional, NamedTuple
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Iterable, List, Tuple, Dict, TypedDict, Union, Optional, NamedTuple
 import json
 import os
 import re
-from clef.utils.preprocessing import clean_text_custom
+import numpy as np
+from clef.utils.preprocessing import clean_text_custom, clean_many
+from clef.utils.authority_store import AuthorityStore, get_authority_store
+from clef.utils.dataset_cache import dataset_cache_key, load_prepared_dataset, save_prepared_dataset
+from clef.utils.post_store import PostStore
+from clef.utils.streaming import JsonlOffsetIndex, iter_jsonl_lines
+from clef.utils.trec import TrecRun, read_trec_run, run_from_rows, write_trec_run
 
 import logging
 logger = logging.getLogger(__name__)
@@ -22,10 +30,21 @@ class RumorWithEvidence(TypedDict):
     timeline: List[AuthorityPost]
     evidence: Optional[List[AuthorityPost]] # not required
     retrieved_evidence: Optional[List[AuthorityPost]] # not required
+    timeline_rows: Optional[array] # not required, rows of the timeline posts in AuredDataset.post_store
+    evidence_rows: Optional[array] # not required, rows of the evidence posts in AuredDataset.post_store
+
+
+class DatasetDelta(NamedTuple):
+    added: List[str]    # ids of rumors that were not in the dataset before
+    updated: List[str]  # ids of existing rumors that got new timeline or evidence posts
+
+    @property
+    def changed(self) -> List[str]:
+        return self.added + self.updated
 
 
 class AuredDataset(object):
-    def __init__(self, filepath, preprocess, add_author_name, add_author_bio, blind_run, author_info_filepath='../../clef/data/combined-author-data-translated.json', **kwargs) -> None:
+    def __init__(self, filepath, preprocess, add_author_name, add_author_bio, blind_run, author_info_filepath='../../clef/data/combined-author-data-translated.json', authority_store_backend='memory', streaming=False, offset_index_path=None, cache_dir=None, num_workers=1, load_data=True, **kwargs) -> None:
         self.filepath: Union[str, os.PathLike] = filepath
         self.rumors: List[RumorWithEvidence] = []
 
@@ -39,107 +58,359 @@ class AuredDataset(object):
             ...
         }
         ds = AuredDataset(filepath, **config)
+
+        with streaming=True, rumors are not loaded up front but parsed and formatted on demand when iterating or
+        indexing, using a persistent line-offset index (see clef.utils.streaming) for random access.
+        .gz and .zst compressed input files are supported in both modes.
+
+        author info is looked up in a process-wide AuthorityStore (see clef.utils.authority_store), use
+        authority_store_backend='sqlite' to share a memory-mapped database between worker processes.
+
+        with cache_dir set, the prepared rumors are cached there (see clef.utils.dataset_cache), keyed by the
+        hash of the input file and the options that affect formatting; a second construction just loads them.
+
+        with num_workers > 1 (None = one per cpu), rumors are prepared in a process pool. the output is the same as
+        in serial mode and in the same order; files with fewer than PARALLEL_MIN_RUMORS entries are prepared serially.
+
+        posts are deduplicated across rumors in self.post_store (see clef.utils.post_store): each unique post is
+        formatted once, rumors share the same AuthorityPost objects and reference them by row in timeline_rows and
+        evidence_rows. streaming datasets don't keep a post store, to keep memory independent of the dataset size.
+
+        to get several formatting variants of the same file, use AuredDataset.build_variants, which parses and
+        formats everything in one pass. with load_data=False, the dataset is created empty.
         """
         self.preprocess: bool = preprocess
         self.add_author_name: bool = add_author_name
         self.add_author_bio: bool = add_author_bio
         self.blind_run: bool = blind_run
         self.author_info_filepath: str = author_info_filepath
+        self.streaming: bool = streaming
+        self.cache_dir: Optional[str] = cache_dir
+        self.num_workers: int = num_workers or os.cpu_count() or 1
+        self.post_store: Optional[PostStore] = None if streaming else PostStore()
 
-        self.load_rumor_data()
+        self.authority_store: Optional[AuthorityStore] = None
+        if self.add_author_bio or self.add_author_name:
+            self.authority_store = get_authority_store(self.author_info_filepath, authority_store_backend)
+
+        # retrieval runs by name (see add_run), and the lookups of the run that backs retrieved_evidence.
+        # the lookup is kept around so it can be attached lazily in streaming mode
+        self.runs: Dict[str, TrecRun] = {}
+        self.run_norm_scores: Dict[str, np.ndarray] = {}
+        self.run_lookups: Dict[str, Dict[str, Dict[str, Tuple[int, float, float]]]] = {}
+        self.active_run: Optional[str] = None
+        self.trec_by_id: Dict[str, Dict[str, Tuple[int, float, float]]] = {}
+        self.trec_min_score: float = 0
+        self.trec_max_score: float = 0
+        self.trec_normalize_scores: bool = True
+
+        self.offset_index: Optional[JsonlOffsetIndex] = None
+        if self.streaming:
+            self.offset_index = JsonlOffsetIndex(self.filepath, offset_index_path)
+            logger.info(f'streaming {len(self.offset_index)} json entries from {self.filepath}')
+        elif load_data:
+            self.load_rumor_data()
 
 
     def __str__(self) -> str:
-        return json.dumps(self.rumors, indent=2)
+        return json.dumps(list(self), indent=2, default=list)
     
     def __iter__(self) -> Generator[RumorWithEvidence,None,None]:
-        for rumor_item in self.rumors:
-            yield rumor_item
+        if self.streaming:
+            for line in iter_jsonl_lines(self.filepath):
+                yield self.prepare_rumor(json.loads(line))
+        else:
+            for rumor_item in self.rumors:
+                yield rumor_item
     
     def __getitem__(self, idx):
+        if self.streaming:
+            if isinstance(idx, slice):
+                return [self[i] for i in range(*idx.indices(len(self)))]
+            return self.prepare_rumor(json.loads(self.offset_index.read_line(idx))) # type: ignore
         return self.rumors[idx]
 
     def __setitem__(self, idx, val):
+        if self.streaming:
+            raise TypeError('item assignment is not supported for a streaming AuredDataset')
         self.rumors[idx] = val
     
     def __len__(self) -> int:
+        if self.streaming:
+            return len(self.offset_index) # type: ignore
         return len(self.rumors)
     
     def load_rumor_data(self):
-        jsons = self.load_rumors_from_jsonl()
+        cache_key = None
+        if self.cache_dir:
+            cache_key = dataset_cache_key(self.filepath, self.preprocess, self.add_author_name, self.add_author_bio, self.blind_run, self.author_info_filepath)
+            cached = load_prepared_dataset(self.cache_dir, cache_key)
+            if cached is not None:
+                self.rumors = cached['rumors']
+                self.post_store = cached['post_store']
+                return
 
-        for item in jsons:
-            entry = RumorWithEvidence(item)
-            entry['timeline'] = [AuthorityPost(*post, None, None) for post in entry['timeline']] # type: ignore
-            if not self.blind_run:
-                entry['evidence'] = [AuthorityPost(*post, None, None) for post in entry['evidence']] # type: ignore
-            entry['retrieved_evidence'] = None
-            self.rumors.append(entry)
+        lines = list(iter_jsonl_lines(self.filepath))
 
-        logger.info(f'loaded {len(jsons)} json entries from {self.filepath}')
+        if self.num_workers > 1 and len(lines) >= PARALLEL_MIN_RUMORS:
+            self.rumors = self.prepare_rumors_parallel(lines)
+        else:
+            for line in lines:
+                self.rumors.append(self.prepare_rumor(json.loads(line)))
 
-        for item in self.rumors:
-            item['timeline'] = self.format_posts(item['timeline'])
-            if not self.blind_run and item['evidence']:
-                item['evidence'] = self.format_posts(item['evidence'])
-            if self.preprocess:
-                item['rumor'] = clean_text_custom(item['rumor'])
+        logger.info(f'loaded {len(lines)} json entries from {self.filepath}')
+
+        if cache_key:
+            save_prepared_dataset(self.cache_dir, cache_key, self.rumors, self.post_store) # type: ignore
+
+    def prepare_rumors_parallel(self, lines: List[bytes]) -> List[RumorWithEvidence]:
+        """
+        json decode and prepare the raw dataset lines in a process pool, returns the rumors in input order
+        """
+        # a few chunks per worker, so a chunk with unusually long timelines doesn't leave the other workers idle
+        chunksize = max(1, -(-len(lines) // (self.num_workers * 4)))
+        chunks = [lines[i:i+chunksize] for i in range(0, len(lines), chunksize)]
+        logger.info(f'preparing {len(lines)} json entries in {len(chunks)} chunks using {self.num_workers} worker processes')
+
+        rumors: List[RumorWithEvidence] = []
+        with ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_prepare_worker, initargs=(self,)) as executor:
+            # map() yields results in submission order, which keeps the output deterministic
+            for prepared, chunk_store in executor.map(_prepare_lines, chunks):
+                # workers return rows into their own post store, move them to rows of ours and share our post objects
+                mapping = self.post_store.merge(chunk_store) # type: ignore
+                for entry in prepared:
+                    for key in ('timeline', 'evidence'):
+                        rows = entry.get(f'{key}_rows')
+                        if rows is not None:
+                            entry[f'{key}_rows'] = array('l', [mapping[row] for row in rows])
+                            entry[key] = self.post_store.lookup(entry[f'{key}_rows']) # type: ignore
+                rumors.extend(prepared)
+        return rumors
+
+    def prepare_rumor(self, item: Dict) -> RumorWithEvidence:
+        """
+        turn a single json entry from the dataset file into a RumorWithEvidence, with formatted (and optionally preprocessed) posts
+        """
+        entry = RumorWithEvidence(item) # type: ignore
+        entry['timeline_rows'], entry['timeline'] = self.prepare_posts(entry['timeline'])
+        if not self.blind_run:
+            entry['evidence_rows'], entry['evidence'] = self.prepare_posts(entry['evidence']) # type: ignore
+        entry['retrieved_evidence'] = None
+        if self.preprocess:
+            entry['rumor'] = clean_text_custom(entry['rumor'])
+        if entry['id'] in self.trec_by_id:
+            # rumors ingested after loading the judgements have none yet, their retrieved_evidence stays None
+            self.add_retrieved_evidence(entry)
+        return entry
     
+    def prepare_posts(self, raw_posts: List) -> Tuple[Optional[array], List[AuthorityPost]]:
+        """
+        format a list of raw [url, post_id, text] posts, going through the post store if there is one
+
+        Returns:
+        tuple of (rows in the post store or None, formatted posts)
+        """
+        if self.post_store is None:
+            return None, self.format_raw_posts(raw_posts)
+        rows = self.post_store.intern_posts(raw_posts, self.format_raw_posts)
+        return rows, self.post_store.lookup(rows)
+
+    def format_raw_posts(self, raw_posts: List) -> List[AuthorityPost]:
+        return self.format_posts([AuthorityPost(*post, None, None) for post in raw_posts])
+
+    def add_rumors(self, items: Iterable[Dict]) -> DatasetDelta:
+        """
+        ingest new rumors (json-like dicts in the dataset file format) into the loaded dataset
+
+        rumors are prepared with the same formatting options as the rest of the dataset. if a rumor id already
+        exists, its timeline and evidence posts that are not in the dataset yet are appended instead.
+
+        Returns:
+        DatasetDelta with the ids of the added and updated rumors, e.g. to re-run retrieval only on ds.get_rumors(delta.changed)
+        """
+        if self.streaming:
+            raise TypeError('ingesting rumors is not supported for a streaming AuredDataset')
+
+        positions = {item['id']: i for i, item in enumerate(self.rumors)}
+        added, updated = [], []
+
+        for item in items:
+            if item['id'] in positions:
+                evidence = None if self.blind_run else item.get('evidence')
+                if self._append_posts(self.rumors[positions[item['id']]], item['timeline'], evidence):
+                    updated.append(item['id'])
+            else:
+                positions[item['id']] = len(self.rumors)
+                self.rumors.append(self.prepare_rumor(dict(item)))
+                added.append(item['id'])
+
+        logger.info(f'ingested {len(added)} new rumors, updated {len(updated)} existing rumors')
+        return DatasetDelta(added, list(dict.fromkeys(updated)))
+
+    def add_rumors_from_jsonl(self, filepath: Union[str, os.PathLike]) -> DatasetDelta:
+        """ingest the rumors of another (possibly compressed) jsonl file, see add_rumors"""
+        return self.add_rumors(json.loads(line) for line in iter_jsonl_lines(filepath))
+
+    def add_timeline_posts(self, posts_by_rumor: Dict[str, List]) -> DatasetDelta:
+        """
+        append new raw [url, post_id, text] posts to the timelines of existing rumors, posts already in a timeline are skipped
+
+        Returns:
+        DatasetDelta with the ids of the rumors whose timeline changed
+        """
+        if self.streaming:
+            raise TypeError('ingesting posts is not supported for a streaming AuredDataset')
+
+        positions = {item['id']: i for i, item in enumerate(self.rumors)}
+        updated = []
+
+        for rumor_id, raw_posts in posts_by_rumor.items():
+            if rumor_id not in positions:
+                raise KeyError(f'rumor_id {rumor_id} is not in the dataset, use add_rumors to add new rumors')
+            if self._append_posts(self.rumors[positions[rumor_id]], raw_posts, None):
+                updated.append(rumor_id)
+
+        logger.info(f'added timeline posts to {len(updated)} rumors')
+        return DatasetDelta([], updated)
+
+    def _append_posts(self, entry: RumorWithEvidence, raw_timeline: List, raw_evidence: Optional[List]) -> bool:
+        """append the raw posts that entry doesn't contain yet, returns True if entry changed"""
+        changed = False
+        for key, raw_posts in (('timeline', raw_timeline), ('evidence', raw_evidence)):
+            if not raw_posts:
+                continue
+            known = set(post.post_id for post in (entry.get(key) or []))
+            new_posts = [post for post in raw_posts if post[1] not in known]
+            if not new_posts:
+                continue
+
+            rows, posts = self.prepare_posts(list({post[1]: post for post in new_posts}.values()))
+            entry[key] = (entry.get(key) or []) + posts # type: ignore
+            if rows is not None:
+                entry[f'{key}_rows'] = (entry.get(f'{key}_rows') or array('l')) + rows # type: ignore
+            changed = True
+        return changed
+
+    def get_rumors(self, rumor_ids: Iterable[str]) -> List[RumorWithEvidence]:
+        """return the rumors with the given ids, in the order of the ids"""
+        grouped = self.get_grouped_rumors()
+        return [grouped[rumor_id] for rumor_id in rumor_ids]
+
     def get_grouped_rumors(self):
         """
         returns a dict with mapping {rumor_id: RumorWithEvidence}
         """
         grouped = {} 
-        for item in self.rumors:
+        for item in self:
             grouped[item['id']] = item # add to grouped dict 
         return grouped
 
     def load_rumors_from_jsonl(self) -> List[RumorWithEvidence]:
         jsons = []
-        with open(self.filepath, encoding='utf-8') as file:
-            for line in file:
-                jsons += [json.loads(line)]
+        for line in iter_jsonl_lines(self.filepath):
+            jsons += [json.loads(line)]
         return jsons
     
+    @classmethod
+    def build_variants(cls, filepath, variants: Iterable[Tuple[bool, bool, bool]], blind_run, **kwargs) -> Dict[Tuple[bool, bool, bool], 'AuredDataset']:
+        """
+        load several formatting variants of the same dataset file in a single pass
+
+        the file is parsed and its posts are deduplicated once, each unique post is formatted once per
+        (add_author_name, add_author_bio) combination and cleaned once per preprocessed variant. the variants share
+        the rumor ids, labels and row arrays, only the formatted posts and claims differ.
+
+        Parameters:
+            - filepath: dataset jsonl file
+            - variants: (preprocess, add_author_name, add_author_bio) tuples
+            - blind_run, kwargs: passed to every AuredDataset (author_info_filepath, authority_store_backend, ...)
+
+        Returns:
+        dict mapping each (preprocess, add_author_name, add_author_bio) tuple to its AuredDataset,
+        with the same content as AuredDataset(filepath, preprocess, add_author_name, add_author_bio, blind_run, **kwargs)
+        """
+        variants = list(dict.fromkeys(tuple(bool(flag) for flag in variant) for variant in variants))
+
+        items = [json.loads(line) for line in iter_jsonl_lines(filepath)]
+        logger.info(f'loaded {len(items)} json entries from {filepath}, building {len(variants)} variants')
+
+        # intern the raw posts once for all variants
+        base_store = PostStore()
+        item_rows = []
+        for item in items:
+            timeline_rows = array('l', [base_store.intern(*post) for post in item['timeline']])
+            evidence_rows = None if blind_run else array('l', [base_store.intern(*post) for post in item['evidence']])
+            item_rows.append((timeline_rows, evidence_rows))
+        raw_posts = [AuthorityPost(*key, None, None) for key in base_store.keys]
+
+        post_texts: Dict[Tuple[bool, bool], List[str]] = {}  # formatted post texts per (add_author_name, add_author_bio)
+        cleaned_post_texts: Dict[Tuple[bool, bool], List[str]] = {}
+        cleaned_claims: Optional[List[str]] = None
+
+        datasets = {}
+        for preprocess, add_author_name, add_author_bio in variants:
+            ds = cls(filepath, preprocess, add_author_name, add_author_bio, blind_run, load_data=False, **kwargs)
+
+            author_options = (add_author_name, add_author_bio)
+            if author_options not in post_texts:
+                post_texts[author_options] = [ds.format_post_text(post) for post in raw_posts]
+            texts = post_texts[author_options]
+            if preprocess:
+                if author_options not in cleaned_post_texts:
+                    cleaned_post_texts[author_options] = clean_many(texts)
+                texts = cleaned_post_texts[author_options]
+                if cleaned_claims is None:
+                    cleaned_claims = clean_many(item['rumor'] for item in items)
+
+            ds.post_store = base_store.with_posts([AuthorityPost(post.url, post.post_id, text, None, None) for post, text in zip(raw_posts, texts)])
+
+            for i, (item, (timeline_rows, evidence_rows)) in enumerate(zip(items, item_rows)):
+                entry = RumorWithEvidence(item) # type: ignore
+                entry['timeline_rows'], entry['timeline'] = timeline_rows, ds.post_store.lookup(timeline_rows)
+                if not blind_run:
+                    entry['evidence_rows'], entry['evidence'] = evidence_rows, ds.post_store.lookup(evidence_rows) # type: ignore
+                entry['retrieved_evidence'] = None
+                if preprocess:
+                    entry['rumor'] = cleaned_claims[i] # type: ignore
+                ds.rumors.append(entry)
+
+            datasets[(preprocess, add_author_name, add_author_bio)] = ds
+
+        return datasets
+
+    def format_post_text(self, post: AuthorityPost) -> str:
+        """build the (uncleaned) text of a single post, with the author info this dataset is configured to add"""
+        # use regex to verify if the account url is valid  
+        if re.match(r'(https:\/\/)?twitter.com/[\w+]{1,15}\b', post.url) and not self.add_author_name:
+            new_post_text = f'Statement from Authority Account "{post.url.split("/")[-1]}": "{post.text}"'
+        else:
+            # dont add author handle here if author name is added later
+            new_post_text = f'Statement: "{post.text}"'
+
+        if self.authority_store is not None:
+            name, bio = self.authority_store[post.url]
+            
+            if self.add_author_bio:
+                new_post_text = f'Authority Description: "{bio}"\n' + new_post_text
+            if self.add_author_name:
+                new_post_text = f'Authority Name: "{name}"\n' + new_post_text
+            
+            # if all info is added, evidence will look like this:
+            # 
+            # Authority Description: "{bio}"
+            # Authority Name: "{name}"
+            # Statement from {twitter handle}: "{post.text}"
+
+        return new_post_text
+
     def format_posts(self, post_list: List[AuthorityPost]):
-        new_post_list = []
-        author_info = {}
-        if self.add_author_bio or self.add_author_name:
-            with open(self.author_info_filepath, 'r') as file:
-                author_info = json.load(file)
+        new_post_texts = [self.format_post_text(post) for post in post_list]
 
-        for post in post_list:
-            # use regex to verify if the account url is valid  
-            if re.match(r'(https:\/\/)?twitter.com/[\w+]{1,15}\b', post.url) and not self.add_author_name:
-                new_post_text = f'Statement from Authority Account "{post.url.split("/")[-1]}": "{post.text}"'
-            else:
-                # dont add author handle here if author name is added later
-                new_post_text = f'Statement: "{post.text}"'
-
-            if author_info:
-                account = post.url.strip()
-                if not account.startswith('https://'):
-                    account = f'https://{account}'
-                name = author_info[account]["translated_name"]
-                bio = author_info[account]["translated_bio"]
-                
-                if self.add_author_bio:
-                    new_post_text = f'Authority Description: "{bio}"\n' + new_post_text
-                if self.add_author_name:
-                    new_post_text = f'Authority Name: "{name}"\n' + new_post_text
-                
-                # if all info is added, evidence will look like this:
-                # 
-                # Authority Description: "{bio}"
-                # Authority Name: "{name}"
-                # Statement from {twitter handle}: "{post.text}"
-
-            if self.preprocess:
-                new_post_text = clean_text_custom(new_post_text)
+        if self.preprocess:
+            new_post_texts = clean_many(new_post_texts)
             
-            new_post_list.append(AuthorityPost(post.url, post.post_id, new_post_text, None, None))
-        return new_post_list
-    
+        return [AuthorityPost(post.url, post.post_id, text, None, None) for post, text in zip(post_list, new_post_texts)]
+
     def add_trec_file_judgements(self, trec_judgements_path, sep=' ', normalize_scores=True):
         """
         create a list of RankedDocs objects in key retrieved_evidence from TREC-formatted file
@@ -147,70 +418,138 @@ class AuredDataset(object):
         Parameters:
             - trec_judgements_path: filepath to TREC-formatted file containing rank and score
             - sep: separator used in TREC file
+            - normalize_scores: min-max normalize the scores over the whole run
+
+        a binary sidecar written with write_trec_format_output(..., sidecar=True) is used instead of parsing, if present.
+        the run is kept under its filepath as name, see add_run and use_run to hold several runs at once.
 
         Returns:
         list of json-like rumors from dataset, with the key retrieved_evidence populated with a list of RankedDocs-like objects
         """
-        trec_by_id = {}
-        max_score = 0
-        min_score = 0
-        num_rows = 0
-
-        with open(trec_judgements_path, 'r') as file:
-            for line in file:
-                # handle edge case where dataset may contain field which contain an additional whitespace, ...
-                # which was then saved together with the field value as a string looking like 'id 0 "id " 1'
-                # (only seems to affect TERRIER trec files)
-                line = re.sub('"', '', line)
-                line = re.sub('  ', ' ', line)
-                rumor_id, _, evidence_id, rank, score, tag = line.split(sep)
-                score = float(score)
-                if rumor_id not in trec_by_id:
-                    trec_by_id[rumor_id] = {}
-                
-                # keep max,min score values to normalize later
-                # scores should always be positive, but still do this...
-                if score < min_score:
-                    min_score = score
-                if score > max_score:
-                    max_score = score
-
-                # add entry to dict for lookup later 
-                trec_by_id[rumor_id][evidence_id] = (rank, score)
-                num_rows += 1
+        name = os.fspath(trec_judgements_path)
+        run = self.add_run(name, trec_judgements_path, sep=sep)
+        self.use_run(name, normalize_scores=normalize_scores)
+        
+        logger.info(f'added {len(run)} scores from {trec_judgements_path} to the evidence entries')
+
+    def add_run(self, name: str, run: Union[str, os.PathLike, TrecRun], sep=' ') -> TrecRun:
+        """
+        load a retrieval run (TREC file or TrecRun) into the dataset under name, without changing retrieved_evidence
+
+        the run is kept in columnar form, its min-max normalized scores are computed once for the whole run
+        """
+        if not isinstance(run, TrecRun):
+            run = read_trec_run(run, sep)
+
+        # keep max,min score values to normalize
+        # scores should always be positive, but still do this...
+        max_score = max(0.0, float(run.scores.max())) if len(run) else 0.0
+        min_score = min(0.0, float(run.scores.min())) if len(run) else 0.0
         
         if (max_score-min_score) == 0:
             logger.error(f'encountered (max_score-min_score) == 0; max={max_score}; min={min_score}')
             raise ValueError()
 
-        for i, item in enumerate(self.rumors):
-            timeline: List[AuthorityPost] = item['timeline']
-            
-            item['retrieved_evidence'] = []
-
-            doc_ranks = trec_by_id[item['id']]
-
-            for post in timeline:
-                if post.post_id in doc_ranks:
-                    rank, score = doc_ranks[post.post_id]
-                    
-                    # normalize score to [0...1] using max,min scores from earlier
-                    if not normalize_scores: 
-                        score_norm = score
-                    else: 
-                        score_norm = (score-min_score) / (max_score-min_score)
-                    
-                    item['retrieved_evidence'].append(AuthorityPost(
-                        post.url, 
-                        post.post_id, 
-                        post.text,
-                        int(rank),
-                        float(score_norm),
-                    )) 
-            
-            self.rumors[i] = item
+        self.runs[name] = run
+        self.run_norm_scores[name] = (run.scores - min_score) / (max_score - min_score)
+        self.run_lookups.pop(name, None)
+        logger.info(f'loaded run "{name}" with {len(run)} rows')
+        return run
+
+    def use_run(self, name: str, normalize_scores: bool = True) -> None:
+        """
+        make the run loaded under name back the key retrieved_evidence of every rumor, with raw or normalized scores
+        """
+        if name not in self.runs:
+            raise KeyError(f'run "{name}" was not loaded, use add_run first')
+
+        if name not in self.run_lookups:
+            run = self.runs[name]
+            lookup: Dict[str, Dict[str, Tuple[int, float, float]]] = {}
+            for rumor_id, evidence_id, rank, score, score_norm in zip(run.qids.tolist(), run.docnos.tolist(), run.ranks.tolist(), run.scores.tolist(), self.run_norm_scores[name].tolist()):
+                lookup.setdefault(rumor_id, {})[evidence_id] = (rank, score, score_norm)
+            self.run_lookups[name] = lookup
+
+        self.active_run = name
+        self.trec_by_id = self.run_lookups[name]
+        self.trec_min_score = min(0.0, float(self.runs[name].scores.min()))
+        self.trec_max_score = max(0.0, float(self.runs[name].scores.max()))
+        self.trec_normalize_scores = normalize_scores
+
+        # in streaming mode the judgements are attached when the rumors are materialized (see prepare_rumor)
+        for item in self.rumors:
+            self.add_retrieved_evidence(item)
+
+    def run_score_matrix(self, names: Optional[List[str]] = None, normalize_scores: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        align several loaded runs on their (rumor, post) pairs
+
+        Returns:
+        tuple of (rumor ids, post ids, scores) where scores has one column per run, NaN where a run didn't retrieve the pair
+        """
+        names = names if names is not None else list(self.runs)
+        runs = [self.runs[name] for name in names]
+
+        pair_keys = np.concatenate([np.char.add(np.char.add(run.qids.astype(str), '\t'), run.docnos.astype(str)) for run in runs])
+        unique_keys, inverse = np.unique(pair_keys, return_inverse=True)
+
+        scores = np.full((len(unique_keys), len(runs)), np.nan)
+        offset = 0
+        for col, (name, run) in enumerate(zip(names, runs)):
+            scores[inverse[offset:offset+len(run)], col] = self.run_norm_scores[name] if normalize_scores else run.scores
+            offset += len(run)
+
+        split = np.char.partition(unique_keys, '\t')
+        return split[:, 0], split[:, 2], scores
+
+    def add_retrieved_evidence(self, item: RumorWithEvidence) -> RumorWithEvidence:
+        """
+        populate the key retrieved_evidence of a single rumor from the run selected with use_run (or add_trec_file_judgements)
+        """
+        timeline: List[AuthorityPost] = item['timeline']
         
-        logger.info(f'added {num_rows} scores from {trec_judgements_path} to the evidence entries')
+        item['retrieved_evidence'] = []
+
+        doc_ranks = self.trec_by_id[item['id']]
+
+        for post in timeline:
+            if post.post_id in doc_ranks:
+                rank, score, score_norm = doc_ranks[post.post_id]
+                
+                # scores normalized to [0...1] using the max,min scores of the run, see add_run
+                if not self.trec_normalize_scores: 
+                    score_norm = score
+                
+                item['retrieved_evidence'].append(AuthorityPost(
+                    post.url, 
+                    post.post_id, 
+                    post.text,
+                    int(rank),
+                    float(score_norm),
+                )) 
+        
+        return item
+
+# dataset files with fewer entries than this are always prepared serially, the process pool startup isn't worth it
+PARALLEL_MIN_RUMORS = 64
+
+# dataset whose formatting options the worker processes use, set once per worker by the pool initializer
+_worker_dataset: Optional[AuredDataset] = None
+
+def _init_prepare_worker(dataset: AuredDataset) -> None:
+    global _worker_dataset
+    _worker_dataset = dataset
+
+def _prepare_lines(lines: List[bytes]) -> Tuple[List[RumorWithEvidence], PostStore]:
+    # fresh store per chunk, so only the posts of this chunk are sent back
+    _worker_dataset.post_store = PostStore() # type: ignore
+    rumors = [_worker_dataset.prepare_rumor(json.loads(line)) for line in lines] # type: ignore
+    for entry in rumors:
+        # the post lists are rebuilt from the rows by the parent, don't pickle them twice
+        entry['timeline'] = []
+        if entry.get('evidence_rows') is not None:
+            entry['evidence'] = []
+    return rumors, _worker_dataset.post_store # type: ignore
 
 #
 # OLD STUFF
@@ -224,7 +563,7 @@ def load_rumors_from_jsonl(filepath: Union[str, os.PathLike]) -> List[RumorWithE
     return jsons
 
 
-def write_trec_format_output(filename: str, data: List[List[Union[str, int, float]]], tag: str = "NO_TAG_SPECIFIED") -> None:
+def write_trec_format_output(filename: str, data: List[List[Union[str, int, float]]], tag: str = "NO_TAG_SPECIFIED", sidecar: bool = False) -> None:
     """
     Writes data to a file in the TREC format.
 
@@ -236,16 +575,12 @@ def write_trec_format_output(filename: str, data: List[List[Union[str, int, floa
         - rank (int): The rank of the authority tweet ID for that given rumor_id.
         - score (float): The score given by the model for the authority tweet ID.
     - tag (str): The string identifier of the team/model.
+    - sidecar (bool): Also write a binary sidecar file (see clef.utils.trec) that add_trec_file_judgements loads without parsing.
     """
-    i = 0
     if data:
-        with open(filename, 'w') as file:
-            for rumor_id, authority_tweet_id, rank, score in data:
-                # use " " as separator, pyterrier uses " " as separator by default!! (stupid, please just use "\t")
-                line = f"{rumor_id} Q0 {authority_tweet_id} {rank} {score} {tag}\n"
-                file.write(line)
-                i += 1
-        logger.info(f'wrote {i} lines to {filename}')
+        run = run_from_rows(data, tag)
+        write_trec_run(filename, run, sidecar=sidecar)
+        logger.info(f'wrote {len(run)} lines to {filename}')
     else:
         logger.warn('data was empty, nothing was written to disk')
 
@@ -0,0 +1,80 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import hashlib
+import json
+import os
+import pickle
+
+import logging
+logger = logging.getLogger(__name__)
+
+# bump this whenever the format of prepared rumors changes (e.g. format_posts output), to invalidate old caches
+CACHE_VERSION = 2
+
+# file hashes are memoized per process by (path, size, mtime), so repeated constructions don't re-read the input
+_file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+def file_sha256(filepath: Union[str, os.PathLike]) -> str:
+    path = os.path.abspath(os.fspath(filepath))
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    if key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                sha.update(chunk)
+        _file_hashes[key] = sha.hexdigest()
+
+    return _file_hashes[key]
+
+
+def dataset_cache_key(filepath: Union[str, os.PathLike], preprocess: bool, add_author_name: bool, add_author_bio: bool, blind_run: bool, author_info_filepath: Optional[str] = None) -> str:
+    """
+    key of a prepared dataset: hash of the input file plus every option that changes the prepared rumors
+    """
+    options = {
+        'version': CACHE_VERSION,
+        'data': file_sha256(filepath),
+        'preprocess': bool(preprocess),
+        'add_author_name': bool(add_author_name),
+        'add_author_bio': bool(add_author_bio),
+        'blind_run': bool(blind_run),
+        # author info only matters if it is added to the posts
+        'author_info': file_sha256(author_info_filepath) if (add_author_name or add_author_bio) and author_info_filepath else None,
+    }
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def cache_path(cache_dir: Union[str, os.PathLike], key: str) -> str:
+    return os.path.join(cache_dir, f'aured-{key}.pkl')
+
+
+def load_prepared_dataset(cache_dir: Union[str, os.PathLike], key: str) -> Optional[Dict[str, Any]]:
+    """return the cached prepared dataset (rumors and post store) for key, or None if there is no (readable) cache entry"""
+    path = cache_path(cache_dir, key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as file:
+            prepared = pickle.load(file)
+    except (OSError, EOFError, pickle.UnpicklingError) as e:
+        logger.warning(f'could not read dataset cache {path}, ignoring it: {e}')
+        return None
+
+    logger.info(f'loaded {len(prepared["rumors"])} prepared rumors from cache {path}')
+    return prepared
+
+
+def save_prepared_dataset(cache_dir: Union[str, os.PathLike], key: str, rumors: List, post_store: Optional[Any] = None) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, key)
+
+    # write to a temp file and swap, so concurrent runs never read a half-written cache entry
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        # one pickle for both, so posts shared between rumors and the post store are stored only once
+        pickle.dump({'rumors': rumors, 'post_store': post_store}, file, protocol=5)
+    os.replace(tmp_path, path)
+
+    logger.info(f'wrote {len(rumors)} prepared rumors to cache {path}')
@@ -14,53 +14,92 @@ from openai import OpenAI
 import numpy as np
 import pandas as pd
 
+from clef.utils.embedding_store import EmbeddingStore
+# request packing lives in a module without import side effects (no OpenAI client), imported here for existing callers
+from clef.utils.tokens import MAX_INPUTS_PER_REQUEST, MAX_TOKENS_PER_REQUEST, count_tokens, pack_requests
+
 client = OpenAI(max_retries=5)
 
+# output dimensions of the OpenAI embedding models, needed to open their embedding store before the first request
+OPENAI_EMBEDDING_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
 
-def get_embedding(text: str, model="text-embedding-3-small", **kwargs) -> List[float]:
+def get_embedding(text: str, model="text-embedding-3-small", store: Optional[EmbeddingStore] = None, **kwargs) -> List[float]:
     # replace newlines, which can negatively affect performance.
     text = text.replace("\n", " ")
 
+    if store is not None:
+        return store.get_or_compute([text], lambda texts: get_embeddings(texts, model=model, **kwargs))[0].tolist()
+
     response = client.embeddings.create(input=[text], model=model, **kwargs)
 
     return response.data[0].embedding
 
 
-# async def aget_embedding(
-#     text: str, model="text-embedding-3-small", **kwargs
-# ) -> List[float]:
-#     # replace newlines, which can negatively affect performance.
-#     text = text.replace("\n", " ")
-
-#     return (await client.embeddings.create(input=[text], model=model, **kwargs))[
-#         "data"
-#     ][0]["embedding"]
+async def aget_embedding(
+    text: str, model="text-embedding-3-small", **kwargs
+) -> List[float]:
+    return (await aget_embeddings([text], model=model, **kwargs))[0]
 
 
 def get_embeddings(
-    list_of_text: List[str], model="text-embedding-3-small", **kwargs
+    list_of_text: List[str], model="text-embedding-3-small", store: Optional[EmbeddingStore] = None, **kwargs
 ) -> List[List[float]]:
     assert len(list_of_text) <= 2048, "The batch size should not be larger than 2048."
 
     # replace newlines, which can negatively affect performance.
     list_of_text = [text.replace("\n", " ") for text in list_of_text]
 
+    if store is not None:
+        # only texts that are not in the store yet are sent to the API
+        return store.get_or_compute(list_of_text, lambda texts: get_embeddings(texts, model=model, **kwargs)).tolist()
+
     data = client.embeddings.create(input=list_of_text, model=model, **kwargs).data
     return [d.embedding for d in data]
 
 
-# async def aget_embeddings(
-#     list_of_text: List[str], model="text-embedding-3-small", **kwargs
-# ) -> List[List[float]]:
-#     assert len(list_of_text) <= 2048, "The batch size should not be larger than 2048."
+def get_embeddings_packed(
+    list_of_text: List[str], model="text-embedding-3-small", store: Optional[EmbeddingStore] = None, embed_fn=None, **kwargs
+) -> List[List[float]]:
+    """
+    embed any number of texts with as few requests as possible: duplicates are sent once and
+    requests are packed up to the API limits (see pack_requests). results are returned in input order
+
+    embed_fn(texts) -> embeddings does a single request, get_embeddings by default
+    """
+    embed_fn = embed_fn or (lambda texts: get_embeddings(texts, model=model, **kwargs))
+
+    def embed_unique(texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        embeddings: List[List[float]] = [[] for _ in unique]
+        requests = pack_requests(unique, model)
+        for request in requests:
+            for i, embedding in zip(request, embed_fn([unique[i] for i in request])):
+                embeddings[i] = embedding
+        by_text = dict(zip(unique, embeddings))
+        return [by_text[text] for text in texts]
+
+    if store is not None:
+        return store.get_or_compute(list_of_text, embed_unique).tolist()
+    return embed_unique(list_of_text)
+
 
-#     # replace newlines, which can negatively affect performance.
-#     list_of_text = [text.replace("\n", " ") for text in list_of_text]
+async def aget_embeddings(
+    list_of_text: List[str], model="text-embedding-3-small", max_concurrency: int = 8, **kwargs
+) -> List[List[float]]:
+    """
+    embed any number of texts with concurrent, rate-limit aware requests (see AsyncEmbeddingClient for kwargs)
+    """
+    from clef.utils.embedding_client import AsyncEmbeddingClient
+
+    # replace newlines, which can negatively affect performance.
+    list_of_text = [text.replace("\n", " ") for text in list_of_text]
 
-#     data = (
-#         await client.embeddings.create(input=list_of_text, model=model, **kwargs)
-#     ).data
-#     return [d.embedding for d in data]
+    return await AsyncEmbeddingClient(model=model, max_concurrency=max_concurrency, **kwargs).aembed(list_of_text)
 
 
 def cosine_similarity(a, b):
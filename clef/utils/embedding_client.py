@@ -0,0 +1,204 @@
+from typing import Dict, List, Optional
+import asyncio
+import random
+import re
+import time
+
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+
+from clef.utils.tokens import count_tokens, pack_requests
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """parse the reset durations of OpenAI rate limit headers ('1s', '6m0s', '250ms') into seconds"""
+    if not value:
+        return None
+    units = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+    parts = re.findall(r'([0-9.]+)(ms|s|m|h)', value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+class TokenBucket(object):
+    """
+    token bucket refilled continuously at rate_per_minute, used for both requests (RPM) and tokens (TPM)
+
+    the bucket can also be drained from the rate limit headers of a response (see sync), so other
+    clients using the same key are accounted for. its state outlives event loops, the lock is per loop.
+    """
+    def __init__(self, rate_per_minute: Optional[float], capacity: Optional[float] = None) -> None:
+        self.rate = rate_per_minute / 60.0 if rate_per_minute else None
+        self.capacity = capacity or rate_per_minute or 0
+        self.available = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # asyncio locks are bound to one event loop, and every embed() call runs a new one
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        return self._lock
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate:
+            self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self.rate is None:
+            # no configured limit, only honour pauses from the response headers
+            delay = self.blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return
+
+        # requests larger than the bucket would wait forever, let them through once it is full
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                delay = max(self.blocked_until - time.monotonic(), 0.0)
+                if delay == 0 and self.available >= amount:
+                    self.available -= amount
+                    return
+                if delay == 0:
+                    delay = (amount - self.available) / self.rate
+                await asyncio.sleep(delay)
+
+    def sync(self, remaining: Optional[float], reset_seconds: Optional[float]) -> None:
+        """align the bucket with the server's view from x-ratelimit-remaining-* / x-ratelimit-reset-*"""
+        if remaining is None:
+            return
+        self._refill()
+        self.available = min(self.available, remaining)
+        if remaining <= 0 and reset_seconds:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + reset_seconds)
+
+
+class AsyncEmbeddingClient(object):
+    """
+    asyncio embeddings client with a bounded number of in-flight requests
+
+    requests wait for the RPM/TPM token buckets (refilled locally and synced from the rate limit headers)
+    and are retried with jittered exponential backoff on rate limits, timeouts, connection and server errors.
+    base_url can point to any OpenAI-compatible server, e.g. a local stub for tests.
+    """
+    def __init__(self, model: str = "text-embedding-3-small", max_concurrency: int = 8, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_retries: int = 6, base_delay: float = 0.5, max_delay: float = 60.0, api_key: Optional[str] = None, base_url: Optional[str] = None, client: Optional[AsyncOpenAI] = None) -> None:
+        """
+        Parameters:
+            - model: embedding model
+            - max_concurrency: maximum number of requests in flight
+            - rpm, tpm: requests and tokens per minute to stay under (only the response headers are used if None)
+            - max_retries: retries per request before giving up
+            - base_delay, max_delay: bounds of the exponential backoff in seconds
+            - api_key, base_url: passed to AsyncOpenAI, unless a client is given
+        """
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # shared by all calls of this client, so back-to-back calls stay under the same RPM/TPM budget
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        # retries are done here, so they respect the shared rate limit state
+        self.client = client
+        self.client_kwargs = dict(api_key=api_key, base_url=base_url, max_retries=0)
+        self.num_requests = 0
+        self.num_retries = 0
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _request(self, client: AsyncOpenAI, texts: List[str], semaphore: asyncio.Semaphore, requests_bucket: TokenBucket, tokens_bucket: TokenBucket) -> List[List[float]]:
+        tokens = sum(count_tokens(text, self.model) for text in texts)
+
+        for attempt in range(self.max_retries + 1):
+            await requests_bucket.acquire(1)
+            await tokens_bucket.acquire(tokens)
+
+            retry_after = None
+            async with semaphore:
+                try:
+                    self.num_requests += 1
+                    raw = await client.embeddings.with_raw_response.create(input=texts, model=self.model)
+                    self._sync_buckets(raw.headers, requests_bucket, tokens_bucket)
+                    return [d.embedding for d in raw.parse().data]
+                except (RateLimitError, APITimeoutError, APIConnectionError, APIStatusError) as e:
+                    status = getattr(e, 'status_code', None)
+                    if isinstance(e, APIStatusError) and not isinstance(e, RateLimitError) and status is not None and status < 500:
+                        raise
+                    response = getattr(e, 'response', None)
+                    if response is not None:
+                        self._sync_buckets(response.headers, requests_bucket, tokens_bucket)
+                        retry_after = parse_reset(response.headers.get('retry-after'))
+                    if attempt == self.max_retries:
+                        raise
+                    error = e
+
+            self.num_retries += 1
+            delay = self._backoff(attempt, retry_after)
+            logger.warning(f'embedding request of {len(texts)} texts failed ({error.__class__.__name__}), retry {attempt+1}/{self.max_retries} in {delay:.2f}s')
+            await asyncio.sleep(delay)
+
+        raise RuntimeError('unreachable')
+
+    def _sync_buckets(self, headers, requests_bucket: TokenBucket, tokens_bucket: TokenBucket) -> None:
+        def number(name: str) -> Optional[float]:
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        requests_bucket.sync(number('x-ratelimit-remaining-requests'), parse_reset(headers.get('x-ratelimit-reset-requests')))
+        tokens_bucket.sync(number('x-ratelimit-remaining-tokens'), parse_reset(headers.get('x-ratelimit-reset-tokens')))
+
+    async def aembed_requests(self, requests: List[List[str]]) -> List[List[List[float]]]:
+        """embed a list of requests (each a list of texts) concurrently, results in request order"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # the http connection pool is bound to the event loop, use a fresh client per loop unless one was given
+        client = self.client or AsyncOpenAI(**self.client_kwargs)
+        try:
+            return await asyncio.gather(*(self._request(client, texts, semaphore, self.requests_bucket, self.tokens_bucket) for texts in requests))
+        finally:
+            if self.client is None:
+                await client.close()
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        """embed any number of texts: duplicates are sent once, requests are packed up to the API limits and sent concurrently"""
+        unique = list(dict.fromkeys(texts))
+        packed = pack_requests(unique, self.model)
+
+        start = time.monotonic()
+        results = await self.aembed_requests([[unique[i] for i in request] for request in packed])
+        logger.info(f'embedded {len(unique)} texts with {len(packed)} requests in {time.monotonic() - start:.2f}s ({self.num_retries} retries so far)')
+
+        by_text: Dict[str, List[float]] = {}
+        for request, embeddings in zip(packed, results):
+            for i, embedding in zip(request, embeddings):
+                by_text[unique[i]] = embedding
+        return [by_text[text] for text in texts]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """blocking version of aembed, must not be called from a running event loop (use aembed there)"""
+        return asyncio.run(self.aembed(texts))
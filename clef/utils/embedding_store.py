@@ -0,0 +1,242 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode('utf-8')).digest()[:KEY_SIZE]
+
+
+class EmbeddingStore(object):
+    """
+    persistent, content-addressed embedding cache for one (model, dimension)
+
+    layout under <root_dir>/<model>-<dim>/ (<model>-<dim>-<dtype>/ for other dtypes than float32):
+        - CURRENT: name of the current generation directory
+        - <generation>/vectors.bin: append-only float matrix, one row per text
+        - <generation>/keys.bin: sha256 prefix of each row's text, same order
+
+    vectors are read through a read-only memory map, so any number of processes can share them without copies.
+    writers append under an exclusive file lock, vector first and key second, so a key on disk always has its row,
+    and first cut both files back to the rows with a key, dropping what a crashed writer left behind. readers
+    switch generations under a shared lock. when the vectors outgrow max_bytes the oldest rows are evicted by
+    writing a compacted generation.
+    """
+    def __init__(self, root_dir: Union[str, os.PathLike], model_name: str, dim: int, dtype=np.float32, max_bytes: Optional[int] = None, compact_ratio: float = 0.75) -> None:
+        """
+        Parameters:
+            - root_dir: directory holding the stores of all models
+            - model_name: name of the embedding model, part of the key
+            - dim: embedding dimension, part of the key
+            - dtype: storage dtype of the vectors
+            - max_bytes: evict the oldest rows once the vectors file is larger than this (no limit if None)
+            - compact_ratio: fraction of max_bytes to keep when compacting
+        """
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.compact_ratio = compact_ratio
+        suffix = '' if self.dtype == np.float32 else f'-{self.dtype.name}'
+        self.directory = os.path.join(os.fspath(root_dir), f"{re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)}-{self.dim}{suffix}")
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.generation: Optional[str] = None
+        self.rows: Dict[bytes, int] = {}
+        self.vectors = np.empty((0, self.dim), dtype=self.dtype)
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, text: str) -> bool:
+        return text_key(text) in self.rows
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _path(self, name: str, generation: Optional[str] = None) -> str:
+        return os.path.join(self.directory, generation or self.generation or '', name)
+
+    @contextmanager
+    def _lock(self, shared: bool = False):
+        # flock locks belong to the open file, never nest them in one process (a shared lock would wait for our own exclusive one)
+        with open(os.path.join(self.directory, 'lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _current_generation(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), 'r') as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> None:
+        """pick up rows appended (or a compaction done) by other processes"""
+        # shared lock: a compaction can not remove the generation between reading CURRENT and mapping its files
+        with self._lock(shared=True):
+            self._refresh()
+
+    def _refresh(self) -> None:
+        # must hold the lock
+        generation = self._current_generation()
+        remap = generation != self.generation
+        if remap:
+            self.generation = generation
+            self.rows = {}
+
+        if self.generation is None:
+            self.vectors = np.empty((0, self.dim), dtype=self.dtype)
+            return
+
+        with open(self._path('keys.bin'), 'rb') as file:
+            file.seek(len(self.rows) * KEY_SIZE)
+            new_keys = file.read()
+        # ignore a partially written key at the end
+        n_new = len(new_keys) // KEY_SIZE
+        for i in range(n_new):
+            self.rows[new_keys[i*KEY_SIZE:(i+1)*KEY_SIZE]] = len(self.rows)
+
+        if remap or len(self.rows) != len(self.vectors):
+            self.vectors = np.memmap(self._path('vectors.bin'), dtype=self.dtype, mode='r', shape=(len(self.rows), self.dim)) if self.rows else np.empty((0, self.dim), dtype=self.dtype)
+
+    def lookup(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Returns:
+        tuple of (rows in the store, -1 for unknown texts), (indices of the texts that are not in the store)
+        """
+        rows = np.array([self.rows.get(text_key(text), -1) for text in texts], dtype=np.int64)
+        return rows, np.flatnonzero(rows < 0).tolist()
+
+    def get(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        """embeddings of texts (a copy), or None if any of them is not in the store"""
+        rows, missing = self.lookup(texts)
+        if missing:
+            return None
+        return np.array(self.vectors[rows])
+
+    def add(self, texts: Sequence[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        if len(texts) != len(vectors):
+            raise ValueError(f'got {len(texts)} texts but {len(vectors)} vectors')
+
+        with self._lock():
+            self._refresh()
+            if self.generation is None:
+                self._new_generation(np.empty((0, self.dim), dtype=self.dtype), [])
+                self._refresh()
+
+            new_keys: Dict[bytes, int] = {}
+            for i, text in enumerate(texts):
+                key = text_key(text)
+                if key not in self.rows and key not in new_keys:
+                    new_keys[key] = i
+            if not new_keys:
+                return
+
+            # a writer that crashed between the two appends leaves vectors (or part of a key) without a key,
+            # cut them off so the new keys line up with their vectors again
+            os.truncate(self._path('vectors.bin'), len(self.rows) * self.row_bytes)
+            os.truncate(self._path('keys.bin'), len(self.rows) * KEY_SIZE)
+
+            with open(self._path('vectors.bin'), 'ab') as file:
+                file.write(np.ascontiguousarray(vectors[list(new_keys.values())]).tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            with open(self._path('keys.bin'), 'ab') as file:
+                file.write(b''.join(new_keys))
+
+            self._refresh()
+            logger.debug(f'added {len(new_keys)} embeddings to {self.directory}, {len(self.rows)} in total')
+
+            if self.max_bytes is not None and len(self.rows) * self.row_bytes > self.max_bytes:
+                self._compact(int(self.max_bytes * self.compact_ratio))
+
+    def get_or_compute(self, texts: Sequence[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        embeddings of texts in input order, computing (and storing) only those that are not in the store yet
+
+        compute gets the unique missing texts and returns one embedding per text
+        """
+        self.refresh()
+        rows, missing = self.lookup(texts)
+        if not missing:
+            return np.array(self.vectors[rows])
+
+        # copy the stored rows first, adding may compact the store and renumber its rows
+        result = np.empty((len(texts), self.dim), dtype=self.dtype)
+        found = rows >= 0
+        result[found] = self.vectors[rows[found]]
+
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        logger.info(f'{len(texts) - len(missing)}/{len(texts)} embeddings found in store, computing {len(missing_texts)}')
+        computed = np.asarray(compute(missing_texts), dtype=self.dtype).reshape(-1, self.dim)
+        self.add(missing_texts, computed)
+
+        by_text = {text: i for i, text in enumerate(missing_texts)}
+        result[missing] = computed[[by_text[texts[i]] for i in missing]]
+        return result
+
+    def compact(self, max_bytes: Optional[int] = None) -> None:
+        """evict the oldest rows until the vectors fit in max_bytes (default: max_bytes * compact_ratio), and drop unused generations"""
+        with self._lock():
+            self._refresh()
+            target = max_bytes if max_bytes is not None else int((self.max_bytes or len(self.rows) * self.row_bytes) * self.compact_ratio)
+            self._compact(target)
+
+    def _compact(self, max_bytes: int) -> None:
+        keep = min(len(self.rows), max_bytes // self.row_bytes)
+        keys = list(self.rows)[len(self.rows) - keep:]
+        vectors = np.array(self.vectors[len(self.rows) - keep:])
+        evicted = len(self.rows) - keep
+
+        old_generation = self.generation
+        self._new_generation(vectors, keys)
+        self._refresh()
+
+        # processes that still map the old generation keep their (unlinked) files until they refresh
+        if old_generation:
+            shutil.rmtree(os.path.join(self.directory, old_generation), ignore_errors=True)
+        logger.info(f'compacted {self.directory}: evicted {evicted} oldest embeddings, kept {keep}')
+
+    def _new_generation(self, vectors: np.ndarray, keys: List[bytes]) -> None:
+        # must hold the lock. write the generation completely, then switch CURRENT atomically
+        generation = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.directory, generation))
+        with open(self._path('vectors.bin', generation), 'wb') as file:
+            file.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        with open(self._path('keys.bin', generation), 'wb') as file:
+            file.write(b''.join(keys))
+
+        tmp_path = os.path.join(self.directory, f'CURRENT.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as file:
+            file.write(generation)
+        os.replace(tmp_path, os.path.join(self.directory, 'CURRENT'))
+
+
+# process-wide cache, so all retrievers of a process share one store (and one memory map) per model and settings
+_stores: Dict[Tuple, EmbeddingStore] = {}
+
+def get_embedding_store(root_dir: Union[str, os.PathLike], model_name: str, dim: int, dtype=np.float32, max_bytes: Optional[int] = None, compact_ratio: float = 0.75) -> EmbeddingStore:
+    """shared EmbeddingStore of the process for these arguments (see EmbeddingStore)"""
+    key = (os.path.abspath(os.fspath(root_dir)), model_name, int(dim), np.dtype(dtype).str, max_bytes, compact_ratio)
+    if key not in _stores:
+        _stores[key] = EmbeddingStore(root_dir, model_name, dim, dtype=dtype, max_bytes=max_bytes, compact_ratio=compact_ratio)
+    return _stores[key]
@@ -0,0 +1,108 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from array import array
+import sys
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class PostStore(object):
+    """
+    table of the unique authority posts of a dataset
+
+    every distinct (account url, post id, raw text) gets one row, holding the formatted post (an AuthorityPost
+    for AuredDataset) that all rumors containing it share. rumors refer to posts by row (see RumorWithEvidence
+    timeline_rows and evidence_rows), so downstream stages can work once per unique post instead of once per occurrence.
+    """
+    def __init__(self) -> None:
+        self.rows: Dict[Tuple[str, str, str], int] = {}
+        self.keys: List[Tuple[str, str, str]] = []
+        self.posts: List[Optional[Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.posts)
+
+    def __getitem__(self, row: int) -> Any:
+        post = self.posts[row]
+        if post is None:
+            raise KeyError(f'post in row {row} was not formatted yet')
+        return post
+
+    def __iter__(self):
+        return iter(self.posts)
+
+    def __getstate__(self):
+        # the key -> row dict is redundant with keys, rebuild it on load instead of pickling it
+        return {'keys': self.keys, 'posts': self.posts}
+
+    def __setstate__(self, state):
+        self.keys = state['keys']
+        self.posts = state['posts']
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+
+    @property
+    def post_ids(self) -> List[str]:
+        return [key[1] for key in self.keys]
+
+    def intern(self, url: str, post_id: str, text: str) -> int:
+        """return the row of a raw post, adding an (unformatted) row if the post wasn't seen before"""
+        key = (url, post_id, text)
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.posts)
+            # account urls and post ids repeat a lot, share one string object per value
+            key = (sys.intern(url), sys.intern(post_id), text)
+            self.rows[key] = row
+            self.keys.append(key)
+            self.posts.append(None)
+        return row
+
+    def intern_posts(self, raw_posts: Iterable[Sequence[str]], format_posts: Callable[[List[Tuple[str, str, str]]], List[Any]]) -> array:
+        """
+        intern a list of raw [url, post_id, text] posts, formatting only the posts that are new to the store
+
+        format_posts gets the new raw (url, post_id, text) tuples and returns one formatted post for each
+
+        Returns:
+        array of rows, one per raw post and in the same order
+        """
+        rows = array('l', [self.intern(*post) for post in raw_posts])
+
+        pending = list(dict.fromkeys(row for row in rows if self.posts[row] is None))
+        if pending:
+            for row, post in zip(pending, format_posts([self.keys[row] for row in pending])):
+                self.posts[row] = post
+
+        return rows
+
+    def lookup(self, rows: Iterable[int]) -> List[Any]:
+        return [self.posts[row] for row in rows] # type: ignore
+
+    def with_posts(self, posts: List[Any]) -> 'PostStore':
+        """
+        return a store with the same rows but other formatted posts (one per row), e.g. for another formatting variant
+
+        rows stay valid in both stores, so row arrays can be shared between them
+        """
+        if len(posts) != len(self.keys):
+            raise ValueError(f'expected {len(self.keys)} posts, got {len(posts)}')
+        store = PostStore()
+        store.keys = list(self.keys)
+        store.rows = dict(self.rows)
+        store.posts = list(posts)
+        return store
+
+    def merge(self, other: 'PostStore') -> array:
+        """
+        add the rows of another store (e.g. built by a worker process) to this one
+
+        Returns:
+        array mapping each row of other to its row in this store
+        """
+        mapping = array('l', [0] * len(other))
+        for other_row, (key, post) in enumerate(zip(other.keys, other.posts)):
+            row = self.intern(*key)
+            if self.posts[row] is None:
+                self.posts[row] = post
+            mapping[other_row] = row
+        return mapping
@@ -0,0 +1,158 @@
+from functools import lru_cache
+
+# Porter stemmer, following the reference implementation by Martin Porter (tartarus.org/martin/PorterStemmer)
+# that Terrier's PorterStemmer is based on, including its departures from the paper ('bli' -> 'ble', 'logi' -> 'log')
+
+STEM_CACHE_SIZE = 2**18
+
+
+def _cons(word: str, i: int) -> bool:
+    ch = word[i]
+    if ch in 'aeiou':
+        return False
+    if ch == 'y':
+        return i == 0 or not _cons(word, i - 1)
+    return True
+
+
+def _measure(stem: str) -> int:
+    """number of vowel-consonant sequences in stem, m in [C](VC){m}[V]"""
+    m = 0
+    prev_vowel = False
+    for i in range(len(stem)):
+        cons = _cons(stem, i)
+        if cons and prev_vowel:
+            m += 1
+        prev_vowel = not cons
+    return m
+
+
+def _vowel_in_stem(stem: str) -> bool:
+    return any(not _cons(stem, i) for i in range(len(stem)))
+
+
+def _double_cons(word: str) -> bool:
+    return len(word) >= 2 and word[-1] == word[-2] and _cons(word, len(word) - 1)
+
+
+def _cvc(word: str) -> bool:
+    i = len(word) - 1
+    if i < 2 or not _cons(word, i) or _cons(word, i - 1) or not _cons(word, i - 2):
+        return False
+    return word[i] not in 'wxy'
+
+
+def _replace(word: str, rules, min_measure: int) -> str:
+    # the first matching suffix decides, even if the measure condition then fails
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            stem = word[:len(word) - len(suffix)]
+            return stem + replacement if _measure(stem) > min_measure else word
+    return word
+
+
+STEP2_RULES = {
+    'a': (('ational', 'ate'), ('tional', 'tion')),
+    'c': (('enci', 'ence'), ('anci', 'ance')),
+    'e': (('izer', 'ize'),),
+    'l': (('bli', 'ble'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous')),
+    'o': (('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate')),
+    's': (('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous')),
+    't': (('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble')),
+    'g': (('logi', 'log'),),
+}
+
+STEP3_RULES = {
+    'e': (('icate', 'ic'), ('ative', ''), ('alize', 'al')),
+    'i': (('iciti', 'ic'),),
+    'l': (('ical', 'ic'), ('ful', '')),
+    's': (('ness', ''),),
+}
+
+STEP4_RULES = {
+    'a': ('al',),
+    'c': ('ance', 'ence'),
+    'e': ('er',),
+    'i': ('ic',),
+    'l': ('able', 'ible'),
+    'n': ('ant', 'ement', 'ment', 'ent'),
+    'o': ('ion', 'ou'),
+    's': ('ism',),
+    't': ('ate', 'iti'),
+    'u': ('ous',),
+    'v': ('ive',),
+    'z': ('ize',),
+}
+
+
+def _step1ab(word: str) -> str:
+    if word.endswith('s'):
+        if word.endswith('sses'):
+            word = word[:-2]
+        elif word.endswith('ies'):
+            word = word[:-2]
+        elif word[-2:-1] != 's':
+            word = word[:-1]
+
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+        return word
+
+    for suffix in ('ed', 'ing'):
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if not _vowel_in_stem(stem):
+                return word
+            word = stem
+            if word.endswith(('at', 'bl', 'iz')):
+                word += 'e'
+            elif _double_cons(word):
+                if word[-1] not in 'lsz':
+                    word = word[:-1]
+            elif _measure(word) == 1 and _cvc(word):
+                word += 'e'
+            return word
+
+    return word
+
+
+def _step1c(word: str) -> str:
+    if word.endswith('y') and _vowel_in_stem(word[:-1]):
+        return word[:-1] + 'i'
+    return word
+
+
+def _step4(word: str) -> str:
+    for suffix in STEP4_RULES.get(word[-2:-1], ()):
+        if word.endswith(suffix):
+            stem = word[:len(word) - len(suffix)]
+            if suffix == 'ion' and not stem.endswith(('s', 't')):
+                continue
+            return stem if _measure(stem) > 1 else word
+    return word
+
+
+def _step5(word: str) -> str:
+    if word.endswith('e'):
+        m = _measure(word[:-1])
+        if m > 1 or (m == 1 and not _cvc(word[:-1])):
+            word = word[:-1]
+    if word.endswith('l') and _double_cons(word) and _measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def porter_stem(word: str) -> str:
+    """stem a lowercase word, results are cached since the same words come up over and over"""
+    if len(word) <= 2:
+        return word
+
+    word = _step1ab(word)
+    word = _step1c(word)
+    word = _replace(word, STEP2_RULES.get(word[-2:-1], ()), 0)
+    word = _replace(word, STEP3_RULES.get(word[-1:], ()), 0)
+    word = _step4(word)
+    word = _step5(word)
+    return word
@@ -0,0 +1,186 @@
+from typing import IO, Generator, Optional, Union
+from array import array
+import gzip
+import io
+import os
+import struct
+
+import logging
+logger = logging.getLogger(__name__)
+
+# header of the persistent offset index: magic, format version, size and mtime of the indexed file, number of lines
+INDEX_MAGIC = b'AUREDIDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<8sIqqq')
+
+# chunk size of the forward seeks in zstd streams
+READ_AHEAD_SIZE = 2**20
+
+
+def open_binary(filepath: Union[str, os.PathLike]) -> IO[bytes]:
+    """
+    open a (possibly compressed) file for binary reading, the compression is inferred from the file extension
+
+    supported:
+        - .gz   (gzip, stdlib)
+        - .zst  (zstandard, needs the optional `zstandard` package)
+        - anything else is read as plain bytes
+    """
+    path = os.fspath(filepath)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst') or path.endswith('.zstd'):
+        return ZstdReader(path)
+    return open(path, 'rb')
+
+
+class ZstdReader(io.IOBase):
+    """
+    reader over the decompressed stream of a .zst file, closing it also closes the compressed file
+
+    the decompressed stream is not seekable, so the position is tracked here and seek only goes forward
+    (by reading ahead), which is all JsonlOffsetIndex.read_line needs
+    """
+    def __init__(self, path: Union[str, os.PathLike]) -> None:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(f'reading {os.fspath(path)} requires the zstandard package (pip install zstandard)') from e
+
+        self.compressed = open(path, 'rb')
+        try:
+            self.stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(self.compressed, closefd=False))
+        except Exception:
+            self.compressed.close()
+            raise
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.position += len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        line = self.stream.readline(size)
+        self.position += len(line)
+        return line
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        target = offset if whence == io.SEEK_SET else self.position + offset if whence == io.SEEK_CUR else -1
+        if target < self.position:
+            raise io.UnsupportedOperation('zstd streams can only seek forward')
+        while self.position < target and self.read(min(target - self.position, READ_AHEAD_SIZE)):
+            pass
+        return self.position
+
+    def close(self) -> None:
+        if not self.closed:
+            try:
+                self.stream.close()
+            finally:
+                self.compressed.close()
+        super().close()
+
+
+def is_compressed(filepath: Union[str, os.PathLike]) -> bool:
+    return os.fspath(filepath).endswith(('.gz', '.zst', '.zstd'))
+
+
+def iter_jsonl_lines(filepath: Union[str, os.PathLike]) -> Generator[bytes, None, None]:
+    """yield the raw (non-empty) lines of a jsonl file one by one, without loading the whole file"""
+    with open_binary(filepath) as file:
+        for line in file:
+            if line.strip():
+                yield line
+
+
+class JsonlOffsetIndex(object):
+    """
+    line-offset index for a jsonl file, so single lines can be read with a seek instead of a full scan
+
+    the offsets refer to the decompressed stream for compressed inputs. the index is persisted next to the
+    data file (or at index_path) and rebuilt automatically if the data file changed (size or mtime differ).
+    """
+    def __init__(self, filepath: Union[str, os.PathLike], index_path: Optional[Union[str, os.PathLike]] = None) -> None:
+        self.filepath = os.fspath(filepath)
+        self.index_path = os.fspath(index_path) if index_path else f'{self.filepath}.offsets'
+        self.offsets = array('q')
+        self._file: Optional[IO[bytes]] = None
+
+        if not self.load():
+            self.build()
+            self.save()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def _source_stat(self):
+        stat = os.stat(self.filepath)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load(self) -> bool:
+        """load the persisted index, returns False if it does not exist or is stale"""
+        if not os.path.exists(self.index_path):
+            return False
+
+        size, mtime_ns = self._source_stat()
+        with open(self.index_path, 'rb') as file:
+            header = file.read(INDEX_HEADER.size)
+            if len(header) != INDEX_HEADER.size:
+                return False
+            magic, version, idx_size, idx_mtime_ns, n = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION or idx_size != size or idx_mtime_ns != mtime_ns:
+                logger.info(f'offset index {self.index_path} is stale, rebuilding')
+                return False
+            offsets = array('q')
+            offsets.fromfile(file, n)
+
+        self.offsets = offsets
+        logger.debug(f'loaded offset index with {n} entries from {self.index_path}')
+        return True
+
+    def build(self) -> None:
+        offsets = array('q')
+        pos = 0
+        with open_binary(self.filepath) as file:
+            for line in file:
+                if line.strip():
+                    offsets.append(pos)
+                pos += len(line)
+        self.offsets = offsets
+        logger.info(f'built offset index with {len(offsets)} entries for {self.filepath}')
+
+    def save(self) -> None:
+        size, mtime_ns = self._source_stat()
+        try:
+            with open(self.index_path, 'wb') as file:
+                file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, size, mtime_ns, len(self.offsets)))
+                self.offsets.tofile(file)
+        except OSError as e:
+            # the index is only an optimization, keep it in memory if we can't write next to the data
+            logger.warning(f'could not persist offset index to {self.index_path}: {e}')
+
+    def read_line(self, idx: int) -> bytes:
+        """return the raw line number idx (0-based, negative indices count from the end)"""
+        pos = self.offsets[idx]
+
+        if self._file is None:
+            self._file = open_binary(self.filepath)
+        elif is_compressed(self.filepath) and pos < self._file.tell():
+            # compressed streams can't seek backwards cheaply, start over from the beginning
+            self._file.close()
+            self._file = open_binary(self.filepath)
+
+        self._file.seek(pos)
+        return self._file.readline()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
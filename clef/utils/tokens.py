@@ -0,0 +1,54 @@
+from typing import List
+
+# token counting and request packing for the embeddings endpoint, free of import side effects
+# (clef.utils.embedding creates an OpenAI client at import time), so clients pointed at other servers can use them
+
+# limits of the embeddings endpoint: inputs per request and total tokens per request
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+
+def count_tokens(text: str, model="text-embedding-3-small") -> int:
+    """number of tokens of text, with tiktoken if it is installed, otherwise a conservative estimate"""
+    try:
+        import tiktoken
+    except ImportError:
+        # english text averages ~4 chars per token, count 3 to stay on the safe side of the limit
+        return len(text) // 3 + 1
+    return len(_tiktoken_encoding(model).encode(text))
+
+
+_encodings = {}
+
+def _tiktoken_encoding(model: str):
+    import tiktoken
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model]
+
+
+def pack_requests(
+    list_of_text: List[str], model="text-embedding-3-small", max_inputs: int = MAX_INPUTS_PER_REQUEST, max_tokens: int = MAX_TOKENS_PER_REQUEST
+) -> List[List[int]]:
+    """
+    split texts into as few requests as possible, each staying under the input count and token limits
+
+    Returns:
+    list of requests, each a list of indices into list_of_text
+    """
+    requests: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(list_of_text):
+        tokens = count_tokens(text, model)
+        if current and (len(current) >= max_inputs or current_tokens + tokens > max_tokens):
+            requests.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        requests.append(current)
+    return requests
@@ -0,0 +1,129 @@
+from typing import Iterable, NamedTuple, Sequence, Union
+import os
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class TrecRun(NamedTuple):
+    """columnar retrieval run, one entry per (rumor, post) row of a TREC file"""
+    qids: np.ndarray     # rumor ids (str)
+    docnos: np.ndarray   # authority post ids (str)
+    ranks: np.ndarray    # int64
+    scores: np.ndarray   # float64
+    tags: np.ndarray     # run tag per row (str)
+
+    def __len__(self) -> int:
+        return len(self.qids)
+
+
+def sidecar_path(trec_path: Union[str, os.PathLike]) -> str:
+    return f'{os.fspath(trec_path)}.npz'
+
+
+def _source_stat(trec_path: Union[str, os.PathLike]) -> np.ndarray:
+    stat = os.stat(trec_path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def run_from_rows(data: Iterable[Sequence], tag: str = "NO_TAG_SPECIFIED") -> TrecRun:
+    """build a TrecRun from [rumor_id, authority_tweet_id, rank, score] rows, as returned by the retrievers"""
+    rows = list(data)
+    qids, docnos, ranks, scores = zip(*rows) if rows else ((), (), (), ())
+    return TrecRun(
+        np.array([str(q) for q in qids]),
+        np.array([str(d) for d in docnos]),
+        np.array(ranks, dtype=np.int64),
+        np.array(scores, dtype=np.float64),
+        np.full(len(rows), tag),
+    )
+
+
+def parse_trec_run(text: str, sep: str = ' ') -> TrecRun:
+    """
+    parse the content of a TREC run file (rumor_id Q0 authority_tweet_id rank score tag per line)
+    """
+    # handle edge case where dataset may contain field which contain an additional whitespace, ...
+    # which was then saved together with the field value as a string looking like 'id 0 "id " 1'
+    # (only seems to affect TERRIER trec files)
+    text = text.replace('"', '')
+
+    if sep.isspace():
+        # split all whitespace at once and reshape into columns, instead of splitting line by line
+        tokens = text.split()
+        if len(tokens) % 6 != 0:
+            raise ValueError(f'malformed TREC run: {len(tokens)} fields is not a multiple of 6')
+        columns = np.array(tokens).reshape(-1, 6)
+    else:
+        lines = [line for line in text.split('\n') if line.strip()]
+        columns = np.array([[field.strip() for field in line.split(sep)] for line in lines]).reshape(-1, 6)
+
+    return TrecRun(
+        columns[:, 0].copy(),
+        columns[:, 2].copy(),
+        columns[:, 3].astype(np.int64),
+        columns[:, 4].astype(np.float64),
+        columns[:, 5].copy(),
+    )
+
+
+def read_trec_run(trec_path: Union[str, os.PathLike], sep: str = ' ', use_sidecar: bool = True) -> TrecRun:
+    """
+    read a TREC run file, from its binary sidecar (see write_trec_run) if there is one that matches the file
+
+    Parameters:
+        - trec_path: filepath to TREC-formatted file
+        - sep: separator used in TREC file
+        - use_sidecar: load from <trec_path>.npz if it was written for the current version of the file
+    """
+    sidecar = sidecar_path(trec_path)
+    if use_sidecar and os.path.exists(sidecar):
+        with np.load(sidecar) as npz:
+            if np.array_equal(npz['source'], _source_stat(trec_path)):
+                run = TrecRun(npz['qids'], npz['docnos'], npz['ranks'], npz['scores'], npz['tags'])
+                logger.debug(f'read {len(run)} rows from sidecar {sidecar}')
+                return run
+        logger.info(f'sidecar {sidecar} does not match {trec_path}, parsing the text file instead')
+
+    with open(trec_path, 'r') as file:
+        run = parse_trec_run(file.read(), sep)
+    logger.debug(f'read {len(run)} rows from {trec_path}')
+    return run
+
+
+def format_trec_lines(run: TrecRun) -> str:
+    # use " " as separator, pyterrier uses " " as separator by default
+    # scores go through float() so they are written exactly like the python floats the retrievers return
+    return ''.join(
+        f"{qid} Q0 {docno} {rank} {score} {tag}\n"
+        for qid, docno, rank, score, tag in zip(run.qids.tolist(), run.docnos.tolist(), run.ranks.tolist(), run.scores.tolist(), run.tags.tolist())
+    )
+
+
+def write_trec_run(trec_path: Union[str, os.PathLike], run: TrecRun, sidecar: bool = False) -> None:
+    """
+    write a run as TREC text file in one go (compatible with the official scorer), optionally with a binary sidecar
+
+    the sidecar <trec_path>.npz holds the columns as arrays and is only used by read_trec_run while the text file is unchanged
+    """
+    with open(trec_path, 'w') as file:
+        file.write(format_trec_lines(run))
+
+    if sidecar:
+        write_trec_sidecar(trec_path, run)
+
+
+def write_trec_sidecar(trec_path: Union[str, os.PathLike], run: TrecRun) -> None:
+    # np.savez appends .npz to paths that don't end with it, write to a file object to control the name
+    with open(sidecar_path(trec_path), 'wb') as file:
+        np.savez(
+            file,
+            qids=run.qids.astype(str),
+            docnos=run.docnos.astype(str),
+            ranks=run.ranks,
+            scores=run.scores,
+            tags=run.tags.astype(str),
+            source=_source_stat(trec_path),
+        )
@@ -0,0 +1,54 @@
+"""small AuRED-style dataset and author info files for the data loading tests"""
+import json
+import os
+import random
+
+ACCOUNTS = ['https://twitter.com/MoHPGaza', 'https://twitter.com/EgyptMFA', 'https://twitter.com/WHO', 'https://twitter.com/IDF']
+WORDS = ['gaza', 'egypt', 'minister', 'health', 'denies', 'confirms', 'attack', 'official', 'statement', 'reports', 'fake', 'news', 'border', 'aid', '#Gaza', '@WHO', 'https://t.co/x1']
+
+
+def author_info(accounts=ACCOUNTS):
+    # the dataset files use both url forms for the same account
+    return {account.replace('https://', '') if i % 2 else account: {'translated_name': f'Name {i}', 'translated_bio': f'Bio of account {i}'} for i, account in enumerate(accounts)}
+
+
+def make_items(n_rumors=12, seed=0, blind_run=False):
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_rumors):
+        # post ids are shared between rumors, so the post store deduplicates them
+        timeline = [[rng.choice(ACCOUNTS), str(1000 + rng.randrange(40)), ' '.join(rng.choices(WORDS, k=rng.randrange(3, 10)))] for _ in range(rng.randrange(1, 8))]
+        timeline = list({post[1]: post for post in timeline}.values())
+        item = {'id': f'AuRED_{i:03d}', 'rumor': ' '.join(rng.choices(WORDS, k=6)), 'label': rng.choice(['SUPPORTS', 'REFUTES', 'NOT ENOUGH INFO']), 'timeline': timeline}
+        if not blind_run:
+            item['evidence'] = timeline[:rng.randrange(0, len(timeline) + 1)]
+        items.append(item)
+    return items
+
+
+def write_jsonl(path, items):
+    with open(path, 'w', encoding='utf-8') as file:
+        for item in items:
+            file.write(json.dumps(item) + '\n')
+    return os.fspath(path)
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+    return os.fspath(path)
+
+
+def touch(path):
+    # make sure size/mtime based fingerprints see the change, even on coarse clocks
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+def dataset_content(ds):
+    """comparable content of a dataset: every rumor with its posts as plain lists"""
+    return [
+        {key: [list(post) for post in value] if key in ('timeline', 'evidence', 'retrieved_evidence') and value is not None else value
+         for key, value in item.items() if key not in ('timeline_rows', 'evidence_rows')}
+        for item in ds
+    ]
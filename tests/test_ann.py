@@ -0,0 +1,49 @@
+import numpy as np
+
+from clef.retrieval.ann import IVFFlatIndex
+from clef.retrieval.dense import normalize_rows
+
+
+def make_index(n=2000, dim=16, nlist=32):
+    rng = np.random.default_rng(0)
+    vectors = normalize_rows(rng.normal(size=(n, dim)))
+    queries = normalize_rows(rng.normal(size=(20, dim)))
+    return IVFFlatIndex.build(vectors, nlist=nlist), queries, rng
+
+
+def test_row_lists_inverts_list_rows():
+    index, _, _ = make_index()
+    for c in range(index.nlist):
+        rows = index.list_rows[index.list_offsets[c]:index.list_offsets[c+1]]
+        assert (index.row_lists[rows] == c).all()
+
+
+def test_filtered_probe_stays_in_allowlist():
+    index, queries, rng = make_index()
+    # duplicates in an allowlist count once
+    allowed = [np.concatenate([rows, rows[:5]]) for rows in (rng.choice(len(index), 60, replace=False) for _ in queries)] + [[]]
+    queries = np.vstack([queries, queries[:1]])
+
+    found = index.search(queries, 10, nprobe=2, allowed=allowed, exact_threshold=0)
+    for results, rows in zip(found, allowed):
+        assert len(results) == min(10, len(set(rows)))
+        assert {row for row, _ in results} <= set(rows)
+
+    # probing every list is exact
+    exact = index.exact_search(queries, 10, allowed=allowed)
+    assert index.search(queries, 10, nprobe=index.nlist, allowed=allowed, exact_threshold=0) == exact
+
+
+def test_probe_returns_k_rows():
+    # 400 vectors in 80 lists, a single list rarely holds 20 rows
+    index, queries, _ = make_index(n=400, nlist=80)
+    for nprobe in (1, 2, 8):
+        assert all(len(results) == 20 for results in index.search(queries, 20, nprobe=nprobe))
+    assert all(len(results) == len(index) for results in index.search(queries, 500, nprobe=1))
+
+
+def test_empty_index():
+    index = IVFFlatIndex.build(np.empty((0, 16), dtype=np.float32))
+    assert len(index) == 0
+    assert index.search(np.ones((2, 16), dtype=np.float32), 5) == [[], []]
+    assert index.search(np.ones((1, 16), dtype=np.float32), 5, allowed=[[]]) == [[]]
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from clef.utils.authority_store import AuthorityInfo, InMemoryAuthorityStore, SQLiteAuthorityStore, get_authority_store
+from clef.utils.data_loading import AuredDataset
+
+from tests.aured import ACCOUNTS, author_info, dataset_content, make_items, touch, write_json, write_jsonl
+
+
+def test_sqlite_store_matches_memory_store(tmp_path):
+    path = write_json(tmp_path / 'authors.json', author_info())
+    memory, sqlite = InMemoryAuthorityStore(path), SQLiteAuthorityStore(path)
+
+    assert len(memory) == len(sqlite) == len(ACCOUNTS)
+    for account in ACCOUNTS + ['twitter.com/WHO/', ' https://twitter.com/IDF']:
+        assert sqlite[account] == memory[account]
+    assert sqlite.get('https://twitter.com/unknown') is None and 'twitter.com/unknown' not in sqlite
+    with pytest.raises(KeyError):
+        sqlite['twitter.com/unknown']
+
+
+def test_sqlite_store_is_rebuilt_when_the_source_changes(tmp_path):
+    path = write_json(tmp_path / 'authors.json', author_info())
+    store = SQLiteAuthorityStore(path)
+    assert not store.is_stale()
+    with sqlite3.connect(store.db_path) as conn:
+        fingerprint = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()[0]
+
+    # unchanged source: the sidecar is reused, not rebuilt
+    assert not SQLiteAuthorityStore(path).is_stale()
+
+    info = author_info(ACCOUNTS + ['https://twitter.com/UN'])
+    info['https://twitter.com/MoHPGaza']['translated_name'] = 'Renamed'
+    write_json(path, info)
+    touch(path)
+    assert store.is_stale()
+
+    rebuilt = SQLiteAuthorityStore(path)
+    assert not rebuilt.is_stale() and len(rebuilt) == len(ACCOUNTS) + 1
+    assert rebuilt['twitter.com/MoHPGaza'] == AuthorityInfo('Renamed', 'Bio of account 0')
+    with sqlite3.connect(rebuilt.db_path) as conn:
+        assert conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()[0] != fingerprint
+
+
+def test_corrupt_sidecar_is_rebuilt(tmp_path):
+    path = write_json(tmp_path / 'authors.json', author_info())
+    store = SQLiteAuthorityStore(path)
+    with open(store.db_path, 'wb') as file:
+        file.write(b'not a database')
+    assert SQLiteAuthorityStore(path)['https://twitter.com/WHO'] == InMemoryAuthorityStore(path)['https://twitter.com/WHO']
+
+
+def test_get_authority_store_reloads_changed_files(tmp_path):
+    path = write_json(tmp_path / 'authors.json', author_info())
+    store = get_authority_store(path, 'sqlite')
+    assert get_authority_store(path, 'sqlite') is store
+
+    write_json(path, author_info(ACCOUNTS[:2]))
+    touch(path)
+    assert len(get_authority_store(path, 'sqlite')) == 2 and len(get_authority_store(path, 'memory')) == 2
+
+    with pytest.raises(ValueError):
+        get_authority_store(path, 'redis')
+
+
+@pytest.mark.parametrize('preprocess', [False, True])
+def test_sqlite_and_memory_backends_give_the_same_dataset(tmp_path, preprocess):
+    authors = write_json(tmp_path / 'authors.json', author_info())
+    data = write_jsonl(tmp_path / 'data.jsonl', make_items())
+    options = dict(preprocess=preprocess, add_author_name=True, add_author_bio=True, blind_run=False, author_info_filepath=authors)
+
+    memory = AuredDataset(data, authority_store_backend='memory', **options)
+    sqlite = AuredDataset(data, authority_store_backend='sqlite', **options)
+
+    assert isinstance(sqlite.authority_store, SQLiteAuthorityStore)
+    assert dataset_content(sqlite) == dataset_content(memory)
+    # the author info made it into every post
+    assert all('Authority Name' in post.text and 'Bio of account' in post.text for item in sqlite for post in item['timeline'])
@@ -0,0 +1,60 @@
+from clef.retrieval.models.cascade import CascadeRetriever
+from clef.retrieval.retrieve import EvidenceRetriever, retrieve_evidence
+
+
+class FirstPosts(EvidenceRetriever):
+    """retrieves the first k timeline posts in timeline order"""
+    def retrieve(self, rumor_id, claim, timeline, **kwargs):
+        return [[rumor_id, post[1], i+1, 1.0 / (i+1)] for i, post in enumerate(timeline[:self.k])]
+
+
+def overlap(pairs):
+    # number of claim words in the post, so the test controls the rerank order and its ties
+    return [len(set(claim.split()) & set(text.split())) for claim, text in pairs]
+
+
+def post(post_id, text):
+    return ['acc', post_id, text]
+
+
+DATASET = [
+    {'id': 'AuRED_1', 'rumor': 'gaza aid border', 'timeline': [post('1', 'news'), post('2', 'aid'), post('3', 'gaza border aid'), post('4', 'border'), post('5', 'gaza aid')]},
+    {'id': 'AuRED_2', 'rumor': 'health minister', 'timeline': [post('6', 'minister'), post('7', 'fake'), post('8', 'health minister')]},
+]
+
+
+def post_ids(data, rumor_id):
+    return [row[1] for row in data if row[0] == rumor_id]
+
+
+def test_rerank_order_and_ties():
+    first_stage = FirstPosts(2)
+    retriever = CascadeRetriever(3, first_stage, candidate_k=4, scorer=overlap)
+    # the caller's retriever keeps its k
+    assert first_stage.k == 2 and retriever.first_stage.k == 4
+
+    data = retrieve_evidence(DATASET, retriever)
+    # candidates 1-4 of AuRED_1 score 0, 1, 3, 1: posts 2 and 4 tie and keep their first stage order
+    assert post_ids(data, 'AuRED_1') == ['3', '2', '4']
+    assert [row[2] for row in data if row[0] == 'AuRED_1'] == [1, 2, 3]
+    assert [row[3] for row in data if row[0] == 'AuRED_1'] == [3.0, 1.0, 1.0]
+    assert post_ids(data, 'AuRED_2') == ['8', '6', '7']
+    # retrieve and retrieve_many agree
+    assert retriever.retrieve('AuRED_1', 'gaza aid border', DATASET[0]['timeline']) == [row for row in data if row[0] == 'AuRED_1']
+
+
+def test_fewer_candidates_than_k():
+    data = retrieve_evidence(DATASET, CascadeRetriever(4, FirstPosts(4), candidate_k=2, scorer=overlap))
+    # only the first stage candidates are reranked, post 3 is never seen
+    assert post_ids(data, 'AuRED_1') == ['2', '1']
+    assert post_ids(data, 'AuRED_2') == ['6', '7']
+
+
+def test_candidates_are_not_reused_across_datasets():
+    retriever = CascadeRetriever(2, FirstPosts(2), candidate_k=3, scorer=overlap)
+    retriever.prepare(DATASET)
+
+    # same rumor id, another claim and timeline
+    other = [{'id': 'AuRED_1', 'rumor': 'fake news', 'timeline': [post('9', 'fake'), post('10', 'fake news')]}]
+    assert post_ids(retriever.retrieve('AuRED_1', 'fake news', other[0]['timeline']), 'AuRED_1') == ['10', '9']
+    assert post_ids(retrieve_evidence(other, retriever), 'AuRED_1') == ['10', '9']
@@ -0,0 +1,126 @@
+import copy
+
+import numpy as np
+import pytest
+
+from clef.utils.data_loading import AuredDataset, DatasetDelta, write_trec_format_output
+
+from tests.aured import author_info, dataset_content, make_items, write_json, write_jsonl
+
+
+@pytest.fixture
+def files(tmp_path):
+    items = make_items(20)
+    return tmp_path, items, write_jsonl(tmp_path / 'full.jsonl', items), write_json(tmp_path / 'authors.json', author_info())
+
+
+def load(path, authors, **options):
+    return AuredDataset(path, **{'preprocess': True, 'add_author_name': True, 'add_author_bio': False, 'blind_run': False, 'author_info_filepath': authors, **options})
+
+
+def assert_rows_match_posts(ds):
+    for item in ds:
+        assert item['timeline'] == ds.post_store.lookup(item['timeline_rows'])
+        assert item['evidence'] == ds.post_store.lookup(item['evidence_rows'])
+
+
+def test_incremental_ingestion_equals_full_load(files):
+    tmp_path, items, full_path, authors = files
+    # the first 14 rumors, some with only the start of their timeline and evidence
+    partial_items = copy.deepcopy(items[:14])
+    truncated = set()
+    for item in partial_items[::3]:
+        if len(item['timeline']) > 1:
+            item['timeline'] = item['timeline'][:1]
+            item['evidence'] = [post for post in item['evidence'] if post in item['timeline']]
+            truncated.add(item['id'])
+    assert truncated
+
+    ds = load(write_jsonl(tmp_path / 'partial.jsonl', partial_items), authors)
+    delta = ds.add_rumors_from_jsonl(full_path)
+
+    assert delta == DatasetDelta([item['id'] for item in items[14:]], [item['id'] for item in partial_items if item['id'] in truncated])
+    assert delta.changed == delta.added + delta.updated
+    assert dataset_content(ds) == dataset_content(load(full_path, authors))
+    assert_rows_match_posts(ds)
+
+    # ingesting the same rumors again changes nothing
+    assert ds.add_rumors(items) == DatasetDelta([], [])
+    assert [item['id'] for item in ds.get_rumors(delta.changed)] == delta.changed
+
+
+def test_add_timeline_posts(files):
+    _, items, full_path, authors = files
+    ds = load(full_path, authors)
+    new_post = ['https://twitter.com/WHO', '99999', 'aid convoy reached the border']
+    known_post = items[1]['timeline'][0]
+
+    delta = ds.add_timeline_posts({items[0]['id']: [new_post, new_post], items[1]['id']: [known_post]})
+
+    # only the rumor that got a post it didn't have is listed, the duplicate is added once
+    assert delta == DatasetDelta([], [items[0]['id']])
+    assert [post.post_id for post in ds[0]['timeline']] == [post[1] for post in items[0]['timeline']] + ['99999']
+    assert len(ds[1]['timeline']) == len(items[1]['timeline'])
+    assert_rows_match_posts(ds)
+
+    with pytest.raises(KeyError):
+        ds.add_timeline_posts({'AuRED_missing': [new_post]})
+
+
+def test_streaming_datasets_reject_ingestion(files):
+    _, items, full_path, authors = files
+    ds = load(full_path, authors, streaming=True)
+    with pytest.raises(TypeError):
+        ds.add_rumors(items)
+    with pytest.raises(TypeError):
+        ds.add_timeline_posts({})
+
+
+def write_runs(tmp_path, items):
+    # run a scores every timeline post, run b only some of them (so the matrix has gaps) on another scale
+    rows_a = [[item['id'], post[1], rank, 1.0 + 0.5 * len(post[2]) / (rank + 1)] for item in items for rank, post in enumerate(item['timeline'])]
+    rows_b = [[item['id'], post[1], rank, 20.0 - rank - 0.1 * i] for i, item in enumerate(items) for rank, post in enumerate(item['timeline'][::2])]
+    paths = tmp_path / 'a.trec.txt', tmp_path / 'b.trec.txt'
+    write_trec_format_output(str(paths[0]), rows_a, 'A')
+    write_trec_format_output(str(paths[1]), rows_b, 'B', sidecar=True)
+    return [str(path) for path in paths]
+
+
+def retrieved_scores(ds):
+    return {(item['id'], post.post_id): post.score for item in ds for post in item['retrieved_evidence']}
+
+
+@pytest.mark.parametrize('normalize_scores', [True, False])
+def test_run_score_matrix_matches_single_runs(files, normalize_scores):
+    tmp_path, items, full_path, authors = files
+    paths = write_runs(tmp_path, items)
+
+    multi = load(full_path, authors)
+    for name, path in zip('ab', paths):
+        multi.add_run(name, path)
+    rumor_ids, post_ids, scores = multi.run_score_matrix(['a', 'b'], normalize_scores=normalize_scores)
+    assert scores.shape == (len(rumor_ids), 2) and np.isnan(scores[:, 1]).any() and not np.isnan(scores[:, 0]).any()
+
+    for col, (name, path) in enumerate(zip('ab', paths)):
+        single = load(full_path, authors)
+        single.add_trec_file_judgements(path, normalize_scores=normalize_scores)
+        expected = retrieved_scores(single)
+
+        found = {(rumor_id, post_id): score for rumor_id, post_id, score in zip(rumor_ids.tolist(), post_ids.tolist(), scores[:, col].tolist()) if not np.isnan(score)}
+        assert found.keys() == expected.keys()
+        np.testing.assert_allclose([found[key] for key in expected], list(expected.values()), rtol=1e-12)
+
+        # switching the active run gives the same retrieved evidence as loading only that run
+        multi.use_run(name, normalize_scores=normalize_scores)
+        assert multi.active_run == name
+        assert dataset_content(multi) == dataset_content(single)
+
+    # normalized scores are min-max scaled per run
+    if normalize_scores:
+        assert np.nanmax(scores, axis=0).tolist() == [1.0, 1.0]
+
+
+def test_use_run_needs_add_run(files):
+    _, _, full_path, authors = files
+    with pytest.raises(KeyError):
+        load(full_path, authors).use_run('missing')
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from clef.utils.data_loading import AuredDataset
+from clef.utils.dataset_cache import cache_path, dataset_cache_key, load_prepared_dataset
+
+from tests.aured import author_info, dataset_content, make_items, touch, write_json, write_jsonl
+
+OPTIONS = {'preprocess': True, 'add_author_name': True, 'add_author_bio': False, 'blind_run': False}
+
+
+@pytest.fixture
+def files(tmp_path):
+    return tmp_path, write_jsonl(tmp_path / 'data.jsonl', make_items(15)), write_json(tmp_path / 'authors.json', author_info())
+
+
+def load(path, authors, cache_dir, **options):
+    return AuredDataset(path, **{**OPTIONS, 'author_info_filepath': authors, 'cache_dir': cache_dir, **options})
+
+
+def no_prepare(monkeypatch):
+    # a cache hit must not prepare a single rumor
+    def prepare_rumor(self, item):
+        raise AssertionError('dataset was prepared instead of loaded from the cache')
+    monkeypatch.setattr(AuredDataset, 'prepare_rumor', prepare_rumor)
+
+
+def cache_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.pkl'))
+
+
+def test_cache_miss_then_hit(files, monkeypatch):
+    tmp_path, path, authors = files
+    cache_dir = os.fspath(tmp_path / 'cache')
+
+    built = load(path, authors, cache_dir)
+    assert len(cache_files(cache_dir)) == 1
+
+    no_prepare(monkeypatch)
+    cached = load(path, authors, cache_dir)
+    assert dataset_content(cached) == dataset_content(built)
+    for item in cached:
+        assert item['timeline'] == cached.post_store.lookup(item['timeline_rows'])
+
+
+@pytest.mark.parametrize('option', ['preprocess', 'add_author_name', 'add_author_bio', 'blind_run'])
+def test_key_changes_with_each_option(files, option):
+    _, path, authors = files
+    options = {**OPTIONS, 'add_author_bio': True}
+    key = dataset_cache_key(path, author_info_filepath=authors, **options)
+    assert dataset_cache_key(path, author_info_filepath=authors, **{**options, option: not options[option]}) != key
+    # same inputs, same key
+    assert dataset_cache_key(path, author_info_filepath=authors, **options) == key
+
+
+def test_key_changes_with_the_data_file(files):
+    tmp_path, path, authors = files
+    key = dataset_cache_key(path, author_info_filepath=authors, **OPTIONS)
+    write_jsonl(path, make_items(15, seed=1))
+    touch(path)
+    assert dataset_cache_key(path, author_info_filepath=authors, **OPTIONS) != key
+
+
+@pytest.mark.parametrize('add_author_name, add_author_bio, changes', [(True, False, True), (False, True, True), (False, False, False)])
+def test_key_changes_with_the_author_info_only_if_it_is_used(files, add_author_name, add_author_bio, changes):
+    _, path, authors = files
+    options = {**OPTIONS, 'add_author_name': add_author_name, 'add_author_bio': add_author_bio}
+    key = dataset_cache_key(path, author_info_filepath=authors, **options)
+
+    info = author_info()
+    info[next(iter(info))]['translated_bio'] = 'a new bio'
+    write_json(authors, info)
+    touch(authors)
+
+    assert (dataset_cache_key(path, author_info_filepath=authors, **options) != key) == changes
+
+
+def test_changed_author_info_rebuilds_the_dataset(files):
+    tmp_path, path, authors = files
+    cache_dir = os.fspath(tmp_path / 'cache')
+    load(path, authors, cache_dir, add_author_bio=True)
+
+    write_json(authors, {account: {**info, 'translated_bio': 'a new bio'} for account, info in author_info().items()})
+    touch(authors)
+    rebuilt = load(path, authors, cache_dir, add_author_bio=True)
+
+    assert len(cache_files(cache_dir)) == 2
+    assert dataset_content(rebuilt) == dataset_content(load(path, authors, None, add_author_bio=True))
+
+
+@pytest.mark.parametrize('content', [b'', b'not a pickle', b'\x80\x05\x95'])
+def test_corrupt_cache_is_rebuilt(files, monkeypatch, content):
+    tmp_path, path, authors = files
+    cache_dir = os.fspath(tmp_path / 'cache')
+    built = load(path, authors, cache_dir)
+
+    key = dataset_cache_key(path, author_info_filepath=authors, **OPTIONS)
+    with open(cache_path(cache_dir, key), 'wb') as file:
+        file.write(content)
+    assert load_prepared_dataset(cache_dir, key) is None
+
+    # the corrupt entry is ignored, the dataset prepared again and the entry rewritten
+    rebuilt = load(path, authors, cache_dir)
+    assert dataset_content(rebuilt) == dataset_content(built)
+    assert load_prepared_dataset(cache_dir, key) is not None
+
+    no_prepare(monkeypatch)
+    assert dataset_content(load(path, authors, cache_dir)) == dataset_content(built)
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from clef.retrieval.dense import DenseRetriever
+
+from tests.test_retrieve import make_dataset
+
+
+class HashingRetriever(DenseRetriever):
+    """embeds texts as hashed bags of words, so the tests need no model"""
+    def __init__(self, k, dim=32, **kwargs):
+        super().__init__(k, 'hashing', **kwargs)
+        self.dim = dim
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[row, sum(map(ord, word)) % self.dim] += 1.0
+        return vectors
+
+
+def rows(data):
+    return [(row[0], row[1], row[2]) for row in data], np.array([row[3] for row in data])
+
+
+def test_prepared_batch_matches_per_rumor_embedding():
+    dataset = make_dataset(40)
+    prepared = HashingRetriever(4)
+    prepared.prepare(dataset)
+    on_the_fly = HashingRetriever(4, precompute=False)
+    on_the_fly.prepare(dataset)
+    assert on_the_fly.embedded == 0
+
+    batch = prepared.retrieve_many(dataset)
+    sequential = [row for item in dataset for row in on_the_fly.retrieve(item['id'], item['rumor'], item['timeline'])]
+
+    assert rows(batch)[0] == rows(sequential)[0]
+    np.testing.assert_allclose(rows(batch)[1], rows(sequential)[1], rtol=1e-6)
+    # texts shared by rumors were embedded once
+    assert prepared.embedded == len({text for item in dataset for text in [item['rumor']] + [post[2] for post in item['timeline']]})
+
+
+def test_unprepared_rumors_are_embedded_on_the_fly():
+    retriever = HashingRetriever(3)
+    retriever.prepare(make_dataset(5, seed=1))
+    other = make_dataset(5, seed=2)
+    assert retriever.retrieve_many(other) == [row for item in other for row in retriever.retrieve(item['id'], item['rumor'], item['timeline'])]
+
+
+def test_exhaustive_ann_matches_exact():
+    dataset = make_dataset(40)
+    exact = HashingRetriever(4)
+    exact.prepare(dataset)
+    ann = HashingRetriever(4, ann=True, ann_nlist=4, ann_nprobe=4)
+    ann.prepare(dataset)
+    assert rows(ann.retrieve_many(dataset))[0] == rows(exact.retrieve_many(dataset))[0]
+
+
+def test_ann_rejects_quantization():
+    with pytest.raises(ValueError):
+        HashingRetriever(4, ann=True, precision='int8')
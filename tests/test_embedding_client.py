@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from clef.utils.embedding_client import AsyncEmbeddingClient, parse_reset
+
+
+def stub_embedding(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 1000), 0.5]
+
+
+class StubServer(object):
+    """OpenAI-compatible /embeddings endpoint that rate limits every rate_limit_every-th request with a 429 and retry-after"""
+    def __init__(self, rate_limit_every=3, retry_after='0.05', delay=0.02):
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []          # (time, inputs, status) of every request
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub.lock:
+                    n = len(stub.requests) + 1
+                    status = 429 if n % stub.rate_limit_every == 0 else 200
+                    stub.requests.append((time.monotonic(), body['input'], status))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.in_flight -= 1
+
+                if status == 429:
+                    payload = {'error': {'message': 'rate limited', 'type': 'requests', 'code': 'rate_limit_exceeded'}}
+                    headers = {'retry-after': stub.retry_after}
+                else:
+                    data = [{'object': 'embedding', 'index': i, 'embedding': stub_embedding(text)} for i, text in enumerate(body['input'])]
+                    payload = {'object': 'list', 'data': data, 'model': body['model'], 'usage': {'prompt_tokens': 1, 'total_tokens': 1}}
+                    headers = {'x-ratelimit-remaining-requests': '100', 'x-ratelimit-remaining-tokens': '100000'}
+
+                out = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(out)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/v1'
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def test_parse_reset():
+    assert parse_reset('250ms') == 0.25
+    assert parse_reset('6m0s') == 360.0
+    assert parse_reset('1.5') == 1.5
+    assert parse_reset(None) is None and parse_reset('soon') is None
+
+
+def test_retries_429_after_retry_after_and_keeps_request_order(stub):
+    client = AsyncEmbeddingClient(max_concurrency=2, max_retries=3, base_delay=0.01, api_key='test', base_url=stub.base_url)
+    requests = [[f'text {i} {j}' for j in range(i % 3 + 1)] for i in range(8)]
+
+    results = asyncio.run(client.aembed_requests(requests))
+
+    assert results == [[stub_embedding(text) for text in texts] for texts in requests]
+    rate_limited = [request for request in stub.requests if request[2] == 429]
+    assert rate_limited and client.num_retries == len(rate_limited)
+    assert stub.max_in_flight <= 2
+
+    # every rate limited request was sent again, no earlier than retry-after
+    for sent, inputs, _ in rate_limited:
+        retried = [at for at, again, status in stub.requests if again == inputs and at > sent]
+        assert retried and retried[0] - sent >= 0.05
+
+
+def test_aembed_deduplicates_and_restores_input_order(stub):
+    client = AsyncEmbeddingClient(max_concurrency=4, base_delay=0.01, api_key='test', base_url=stub.base_url)
+    texts = ['b', 'a', 'b', 'ccc', 'a']
+
+    assert client.embed(texts) == [stub_embedding(text) for text in texts]
+    assert sorted(stub.requests[0][1]) == ['a', 'b', 'ccc']
+
+
+def test_import_needs_no_api_key():
+    env = {name: value for name, value in os.environ.items() if name != 'OPENAI_API_KEY'}
+    subprocess.run([sys.executable, '-c', 'import clef.utils.embedding_client'], env=env, check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+
+def test_rate_limit_holds_across_calls(stub):
+    # 1200 requests per minute = one every 0.05s, the bucket starts with 1200 so drain it first
+    client = AsyncEmbeddingClient(rpm=1200, api_key='test', base_url=stub.base_url, base_delay=0.01)
+    client.requests_bucket.available = 0.0
+    stub.rate_limit_every = 10**9
+
+    start = time.monotonic()
+    for i in range(4):
+        assert client.embed([f'call {i}']) == [stub_embedding(f'call {i}')]
+    # a fresh bucket per call would send all four at once
+    assert time.monotonic() - start >= 4 * 0.05 - 0.01
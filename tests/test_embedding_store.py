@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+
+from clef.utils.embedding_store import EmbeddingStore, get_embedding_store
+
+
+def vectors_for(texts, dim=4):
+    return np.array([[len(text) + i for i in range(dim)] for text in texts], dtype=np.float32)
+
+
+def test_get_or_compute_only_computes_missing(tmp_path):
+    store = EmbeddingStore(tmp_path, 'model', 4)
+    computed = []
+
+    def compute(texts):
+        computed.extend(texts)
+        return vectors_for(texts)
+
+    np.testing.assert_array_equal(store.get_or_compute(['a', 'bb', 'a'], compute), vectors_for(['a', 'bb', 'a']))
+    np.testing.assert_array_equal(store.get_or_compute(['ccc', 'bb'], compute), vectors_for(['ccc', 'bb']))
+    assert computed == ['a', 'bb', 'ccc']
+    np.testing.assert_array_equal(EmbeddingStore(tmp_path, 'model', 4).get(['a', 'bb', 'ccc']), vectors_for(['a', 'bb', 'ccc']))
+
+
+def test_add_drops_rows_of_a_crashed_writer(tmp_path):
+    store = EmbeddingStore(tmp_path, 'model', 4)
+    store.add(['a', 'bb'], vectors_for(['a', 'bb']))
+
+    # a writer that died after appending its vectors (and half a key), but before the keys were complete
+    with open(store._path('vectors.bin'), 'ab') as file:
+        file.write(vectors_for(['orphan', 'rows']).tobytes())
+    with open(store._path('keys.bin'), 'ab') as file:
+        file.write(b'\x00' * 7)
+
+    other = EmbeddingStore(tmp_path, 'model', 4)
+    other.add(['ccc'], vectors_for(['ccc']))
+
+    reopened = EmbeddingStore(tmp_path, 'model', 4)
+    assert len(reopened) == 3
+    np.testing.assert_array_equal(reopened.get(['a', 'bb', 'ccc']), vectors_for(['a', 'bb', 'ccc']))
+    assert os.path.getsize(reopened._path('vectors.bin')) == 3 * reopened.row_bytes
+
+
+def test_eviction_keeps_newest_rows(tmp_path):
+    store = EmbeddingStore(tmp_path, 'model', 4, max_bytes=10 * 16, compact_ratio=0.5)
+    texts = [f'text {i}' for i in range(12)]
+    for text in texts:
+        store.add([text], vectors_for([text]))
+
+    assert len(store) <= 10
+    assert texts[-1] in store and texts[0] not in store
+    reader = EmbeddingStore(tmp_path, 'model', 4)
+    np.testing.assert_array_equal(reader.get(texts[-3:]), vectors_for(texts[-3:]))
+    assert len(os.listdir(tmp_path / 'model-4')) == 3  # lock, CURRENT and one generation
+
+
+def test_store_cache_keyed_by_settings(tmp_path):
+    default = get_embedding_store(tmp_path, 'cached', 4)
+    assert get_embedding_store(tmp_path, 'cached', 4) is default
+
+    limited = get_embedding_store(tmp_path, 'cached', 4, max_bytes=1024)
+    assert limited is not default and limited.max_bytes == 1024
+
+    half = get_embedding_store(tmp_path, 'cached', 4, dtype=np.float16)
+    assert half.dtype == np.float16 and half.directory != default.directory
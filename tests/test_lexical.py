@@ -0,0 +1,129 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from clef.retrieval.lexical import TOKEN_PATTERN, LexicalIndex, analyze, rank_bm25_pl2
+from clef.utils.stemming import porter_stem
+
+# words exercising every step of the algorithm, from Porter's paper and the reference vocabulary
+WORDS = '''
+caresses ponies ties caress cats feed agreed plastered bled motoring sing conflated troubled sized hopping tanned
+falling hissing fizzed failing filing happy sky relational conditional rational valenci hesitanci digitizer
+conformabli radicalli differentli vileli analogousli vietnamization predication operator feudalism decisiveness
+hopefulness callousness formaliti sensitiviti sensibiliti triplicate formative formalize electriciti electrical
+hopeful goodness revival allowance inference airliner gyroscopic adjustable defensible irritant replacement
+adjustment dependent adoption homologou communism activate angulariti homologous effective bowdlerize probate
+rate cease controll roll generalizations oscillators abli logi archaeology sly ly dying lying eyed yelled united
+officials minister denies confirms reported reports attacks statement statements news border crossing hospitals
+authorities spokesperson announced announcement rumors rumoured verification evidence retrieval timeline posts
+a is as us ss sses ies eed ing ed y at bl iz
+'''.split()
+
+
+def random_words(n, seed=0):
+    rng = random.Random(seed)
+    suffixes = ['', 's', 'es', 'ies', 'ed', 'ing', 'ational', 'tional', 'izer', 'bli', 'alli', 'entli', 'eli', 'ousli', 'ization', 'ation', 'ator',
+                'alism', 'iveness', 'fulness', 'ousness', 'aliti', 'iviti', 'biliti', 'logi', 'icate', 'ative', 'alize', 'iciti', 'ical', 'ful',
+                'ness', 'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ion', 'ou', 'ism', 'ate', 'iti',
+                'ous', 'ive', 'ize', 'e', 'll', 'y', 'eed', 'sion', 'tion']
+    return [''.join(rng.choices('abcdefghijklmnoprstuvwy', k=rng.randrange(1, 7))) + rng.choice(suffixes) for _ in range(n)]
+
+
+def test_porter_stem_matches_nltk():
+    nltk_porter = pytest.importorskip('nltk.stem.porter')
+    # MARTIN_EXTENSIONS is the reference implementation Terrier's stemmer follows
+    stemmer = nltk_porter.PorterStemmer(mode=nltk_porter.PorterStemmer.MARTIN_EXTENSIONS)
+    for word in WORDS + random_words(5000):
+        assert porter_stem(word) == stemmer.stem(word), word
+
+
+DOCS = [
+    'Health minister denies reports of an attack on the Gaza border crossing',
+    'The ministry of health confirms the statement, no attack was reported today',
+    'Official statement: the border crossing is open, aid trucks are crossing',
+    'Fake news about the health minister spread on social media',
+    'Egypt denies the reports and confirms the crossing stays open for aid',
+    'minister minister minister statement',
+    'Nothing relevant in this post at all',
+]
+QUERIES = ['health minister denies attack reports', 'border crossing open for aid trucks', 'minister statement minister', 'unrelated words only']
+
+
+def reference_scores(docs, query, k_1=1.2, b=0.75, k_3=8.0, c=1.0):
+    # Terrier's BM25 and PL2 (org.terrier.matching.models), summed over the query terms in the collection
+    N = len(docs)
+    avg_dl = sum(len(doc) for doc in docs) / N
+    bm25, pl2 = [0.0] * N, [0.0] * N
+    for term in set(query):
+        qtf = query.count(term)
+        df = sum(term in doc for doc in docs)
+        F = sum(doc.count(term) for doc in docs)
+        if df == 0:
+            continue
+        for d, doc in enumerate(docs):
+            tf = doc.count(term)
+            if tf == 0:
+                continue
+            dl = len(doc)
+            K = k_1 * ((1 - b) + b * dl / avg_dl)
+            bm25[d] += math.log2((N - df + 0.5) / (df + 0.5)) * ((k_1 + 1) * tf / (K + tf)) * ((k_3 + 1) * qtf / (k_3 + qtf))
+
+            TF = tf * math.log2(1 + c * avg_dl / dl)
+            f = F / N
+            pl2[d] += qtf / (TF + 1) * (TF * math.log2(1 / f) + f * math.log2(math.e) + 0.5 * math.log2(2 * math.pi * TF) + TF * (math.log2(TF) - math.log2(math.e)))
+    return bm25, pl2
+
+
+def test_weights_match_reference_formulas():
+    docs = [analyze(doc) for doc in DOCS]
+    queries = [analyze(query) for query in QUERIES]
+    index = LexicalIndex(docs)
+    bm25, pl2, matched = index.score(queries)
+
+    for i, query in enumerate(queries):
+        expected_bm25, expected_pl2 = reference_scores(docs, query)
+        np.testing.assert_allclose(bm25[i].toarray().ravel(), expected_bm25, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(pl2[i].toarray().ravel(), expected_pl2, rtol=1e-12, atol=1e-12)
+        assert matched[i].toarray().ravel().tolist() == [float(len(set(query) & set(doc))) for doc in docs]
+
+
+def test_rank_bm25_pl2_reranks_the_bm25_top():
+    docs = [analyze(doc) for doc in DOCS]
+    queries = [analyze(query) for query in QUERIES]
+    allowed = [range(len(docs)), [0, 2, 4], [5, 6], range(len(docs))]
+    results = rank_bm25_pl2(LexicalIndex(docs), queries, allowed=allowed, first_stage_k=3, k=2)
+
+    for query, rows, found in zip(queries, allowed, results):
+        bm25, pl2 = reference_scores(docs, query)
+        candidates = [d for d in rows if set(query) & set(docs[d])]
+        first_stage = sorted(candidates, key=lambda d: (-bm25[d], d))[:3]
+        expected = sorted(first_stage, key=lambda d: (-pl2[d], d))[:2]
+        assert [row for row, _ in found] == expected
+        np.testing.assert_allclose([score for _, score in found], [pl2[d] for d in expected], rtol=1e-12)
+
+
+TIMELINE = [['acc', str(100 + i), text] for i, text in enumerate(DOCS + [
+    'Aid trucks wait at the crossing, officials say the border stays closed',
+    'The minister will give a statement about the attack tomorrow',
+    'Reports of an attack near the crossing are fake, says the health ministry',
+])]
+
+
+def test_native_rankings_match_pyterrier():
+    # the native BM25 >> PL2 pipeline against TerrierRetriever on one timeline, with Terrier's own stopword list
+    pt = pytest.importorskip('pyterrier')
+    from clef.retrieval.models.native import NativeRetriever
+    from clef.retrieval.models.terrier import TerrierRetriever
+
+    terrier = TerrierRetriever(5)
+    stopper = pt.autoclass('org.terrier.terms.Stopwords')(None)
+    vocabulary = {token.lower() for text in DOCS + QUERIES + [post[2] for post in TIMELINE] for token in TOKEN_PATTERN.findall(text)}
+    native = NativeRetriever(5, stopwords=frozenset(word for word in vocabulary if stopper.isStopword(word)))
+
+    for i, query in enumerate(QUERIES):
+        expected = terrier.retrieve(f'AuRED_{i}', query, TIMELINE)
+        found = native.retrieve(f'AuRED_{i}', query, TIMELINE)
+        assert [row[1] for row in found] == [row[1] for row in expected]
+        np.testing.assert_allclose([row[3] for row in found], [row[3] for row in expected], rtol=1e-5)
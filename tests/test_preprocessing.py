@@ -0,0 +1,39 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from clef.utils.preprocessing import clean_many, clean_text_custom, clean_tweet, clean_tweet_aggressive, clear_clean_cache
+
+CLEANERS = {'clean_tweet': clean_tweet, 'clean_tweet_aggressive': clean_tweet_aggressive, 'clean_text_custom': clean_text_custom}
+
+# outputs of the cleaning functions before they were precompiled and memoized, for real-looking tweets and random
+# mixes of urls, handles, hashtags, quotes, emoji sequences and arabic text
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), 'data', 'preprocessing_golden.jsonl')
+
+
+def load_golden():
+    with open(GOLDEN_FILE, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.mark.parametrize('name', CLEANERS)
+def test_cleaners_match_previous_output(name):
+    clear_clean_cache()
+    for case in load_golden():
+        assert CLEANERS[name](case['text']).encode('utf-8') == case[name].encode('utf-8'), repr(case['text'])
+        # memoized call returns the same
+        assert CLEANERS[name](case['text']) == case[name]
+
+
+@pytest.mark.parametrize('name', CLEANERS)
+def test_clean_many_matches_single_calls(name):
+    texts = [case['text'] for case in load_golden()] + [None, np.nan, '']
+    texts = texts + texts[::3]
+    assert clean_many(texts, CLEANERS[name]) == [CLEANERS[name](text) for text in texts]
+
+
+@pytest.mark.parametrize('cleaner', CLEANERS.values())
+def test_missing_texts_clean_to_empty(cleaner):
+    assert cleaner(None) == '' and cleaner(np.nan) == '' and cleaner('') == ''
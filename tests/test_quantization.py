@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from clef.retrieval.dense import normalize_rows
+from clef.retrieval.quantization import POPCOUNT, QuantizedIndex, binary_codes, hamming_distances
+
+from tests.test_dense import HashingRetriever
+from tests.test_retrieve import make_dataset
+
+
+def seeded(n=2000, dim=64, num_queries=50, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = normalize_rows(rng.normal(size=(n, dim)))
+    # queries close to the first vectors, so each has a clear nearest neighbour
+    queries = normalize_rows(vectors[:num_queries] + 0.05 * rng.normal(size=(num_queries, dim)))
+    return vectors, queries
+
+
+@pytest.mark.parametrize('precision, tolerance, min_recall', [('float32', 1e-6, 1.0), ('float16', 1e-3, 0.99), ('int8', 1e-2, 0.95)])
+def test_scores_match_exact(precision, tolerance, min_recall):
+    vectors, queries = seeded()
+    index = QuantizedIndex(vectors, precision, binary_prefilter=False)
+    allowed = [np.arange(i, len(vectors), 7) for i in range(len(queries))]
+
+    for query, results, rows in zip(queries, index.search(queries, 10, allowed=allowed), allowed):
+        assert len(results) == 10 and {row for row, _ in results} <= set(rows.tolist())
+        exact = vectors @ query
+        np.testing.assert_allclose([score for _, score in results], exact[[row for row, _ in results]], atol=tolerance)
+    assert index.evaluate(queries, vectors, 10).recall >= min_recall
+
+
+def test_hamming_distances():
+    rng = np.random.default_rng(1)
+    codes = binary_codes(rng.normal(size=(100, 72)))
+    expected = POPCOUNT[np.bitwise_xor(codes, codes[3])].sum(axis=1)
+    assert hamming_distances(codes, codes[3]).tolist() == expected.tolist()
+    assert hamming_distances(codes[:, :8], codes[3, :8]).tolist() == POPCOUNT[np.bitwise_xor(codes[:, :8], codes[3, :8])].sum(axis=1).tolist()
+
+
+def test_binary_prefilter_recall():
+    vectors, queries = seeded()
+    recalls = [QuantizedIndex(vectors, 'float32', True, rescore_factor).evaluate(queries, vectors, 10).recall for rescore_factor in (2, 10, 200)]
+    # a longer shortlist never hurts, and a shortlist of the whole index is exact
+    assert recalls == sorted(recalls) and recalls[-1] == 1.0
+    # the nearest neighbour survives the prefilter
+    found = QuantizedIndex(vectors, 'int8', True, 2).search(queries, 1)
+    assert [results[0][0] for results in found] == list(range(len(queries)))
+
+
+def test_dense_retriever_keeps_only_the_quantized_copy():
+    dataset = make_dataset(40)
+    exact = HashingRetriever(4)
+    exact.prepare(dataset)
+    quantized = HashingRetriever(4, precision='float16')
+    quantized.prepare(dataset)
+
+    assert isinstance(quantized.embeddings, QuantizedIndex)
+    assert [row[:3] for row in quantized.retrieve_many(dataset)] == [row[:3] for row in exact.retrieve_many(dataset)]
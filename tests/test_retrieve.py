@@ -0,0 +1,79 @@
+import random
+import time
+
+import pytest
+
+from clef.retrieval.models.hybrid import HybridRetriever
+from clef.retrieval.models.native import NativeRetriever
+from clef.retrieval.models.tfidf import TFIDFRetriever
+from clef.retrieval.retrieve import EvidenceRetriever, group_by_rumor, order_by_rumors, retrieve_evidence
+
+WORDS = ['gaza', 'egypt', 'minister', 'health', 'denies', 'confirms', 'attack', 'official', 'statement', 'reports', 'fake', 'news', 'border', 'aid']
+
+
+def make_dataset(n_rumors=30, seed=1):
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f'AuRED_{i}',
+            'rumor': ' '.join(rng.choices(WORDS, k=5)),
+            'timeline': [[f'acc{j}', str(1000 + 40*i + j), ' '.join(rng.choices(WORDS, k=rng.randrange(2, 9)))] for j in range(rng.randrange(0, 12))],
+        }
+        for i in range(n_rumors)
+    ]
+
+
+class SlowRetriever(EvidenceRetriever):
+    """retrieves the first k timeline posts, after a random delay so workers finish out of order"""
+    def retrieve(self, rumor_id, claim, timeline, **kwargs):
+        time.sleep(random.uniform(0, 0.01))
+        return [[rumor_id, post[1], i+1, float(len(post[2]) + kwargs.get('offset', 0))] for i, post in enumerate(timeline[:self.k])]
+
+
+def sequential(retriever, dataset, **kwargs):
+    return [row for item in dataset for row in retriever.retrieve(item['id'], item['rumor'], item['timeline'], **kwargs)]
+
+
+@pytest.mark.parametrize('num_workers, executor', [(1, 'thread'), (4, 'thread'), (4, 'process')])
+def test_default_retrieve_many_keeps_dataset_order(num_workers, executor):
+    dataset = make_dataset()
+    retriever = SlowRetriever(3)
+
+    data = retriever.retrieve_many(dataset, num_workers=num_workers, executor=executor, offset=1)
+
+    assert data == sequential(retriever, dataset, offset=1)
+    assert list(group_by_rumor(data)) == [item['id'] for item in dataset if item['timeline']]
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        SlowRetriever(3).retrieve_many(make_dataset(), num_workers=2, executor='fiber')
+
+
+@pytest.mark.parametrize('make_retriever', [
+    lambda: TFIDFRetriever(5, global_index=True),
+    lambda: NativeRetriever(5, global_index=True),
+    lambda: NativeRetriever(5),
+    lambda: HybridRetriever(5, NativeRetriever(5, global_index=True), TFIDFRetriever(5, global_index=True), candidate_k=8),
+])
+@pytest.mark.parametrize('num_workers, executor', [(1, 'thread'), (3, 'thread'), (3, 'process')])
+def test_backends_match_per_rumor_retrieve(make_retriever, num_workers, executor):
+    dataset = make_dataset()
+    retriever = make_retriever()
+
+    data = retrieve_evidence(dataset, retriever, num_workers=num_workers, executor=executor)
+
+    assert data == sequential(retriever, dataset)
+
+
+def test_order_by_rumors_keeps_order_within_rumors():
+    rumors = [('AuRED_2 ', '', []), ('AuRED_1', '', [])]
+    data = [['AuRED_1', 'a', 1, 0.5], ['AuRED_2', 'b', 1, 0.9], ['AuRED_1', 'c', 2, 0.1], ['AuRED_2', 'd', 2, 0.2]]
+    assert [row[1] for row in order_by_rumors(rumors, data)] == ['b', 'd', 'a', 'c']
+
+
+def test_hybrid_keeps_component_k():
+    lexical, dense = NativeRetriever(5, global_index=True), TFIDFRetriever(5, global_index=True)
+    retriever = HybridRetriever(3, lexical, dense, candidate_k=8)
+    assert lexical.k == 5 and dense.k == 5
+    assert [component.k for component in retriever.components] == [8, 8]
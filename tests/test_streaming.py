@@ -0,0 +1,73 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from clef.utils.streaming import JsonlOffsetIndex, iter_jsonl_lines, open_binary
+
+LINES = [json.dumps({'id': f'AuRED_{i}', 'rumor': 'x' * i, 'timeline': []}).encode('utf-8') + b'\n' for i in range(120)]
+# blank lines are skipped by the index
+CONTENT = b''.join(LINES[:50]) + b'\n' + b''.join(LINES[50:])
+
+
+def write_plain(path):
+    path.write_bytes(CONTENT)
+
+
+def write_gzip(path):
+    with gzip.open(path, 'wb') as file:
+        file.write(CONTENT)
+
+
+def write_zstd(path):
+    zstandard = pytest.importorskip('zstandard')
+    path.write_bytes(zstandard.ZstdCompressor().compress(CONTENT))
+
+
+@pytest.mark.parametrize('name, write', [('data.jsonl', write_plain), ('data.jsonl.gz', write_gzip), ('data.jsonl.zst', write_zstd)])
+def test_offset_round_trip(tmp_path, name, write):
+    path = tmp_path / name
+    write(path)
+
+    assert list(iter_jsonl_lines(path)) == LINES
+
+    index = JsonlOffsetIndex(path)
+    assert len(index) == len(LINES)
+    # forward, backward (reopens compressed streams), repeated and negative indices
+    for idx in [0, 7, 3, 119, 60, 60, 49, 50, -1, -120]:
+        assert index.read_line(idx) == LINES[idx]
+    index.close()
+
+    # the persisted index is reused as long as the file is unchanged
+    assert os.path.exists(f'{path}.offsets')
+    reloaded = JsonlOffsetIndex(path)
+    assert reloaded.offsets == index.offsets
+    assert reloaded.read_line(100) == LINES[100]
+    reloaded.close()
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = tmp_path / 'data.jsonl'
+    write_plain(path)
+    JsonlOffsetIndex(path).close()
+
+    path.write_bytes(b''.join(LINES[10:]))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    index = JsonlOffsetIndex(path)
+    assert len(index) == len(LINES) - 10 and index.read_line(0) == LINES[10]
+    index.close()
+
+
+def test_zstd_reader_closes_compressed_file(tmp_path):
+    path = tmp_path / 'data.jsonl.zst'
+    write_zstd(path)
+
+    with open_binary(path) as file:
+        file.seek(len(LINES[0]))
+        assert file.tell() == len(LINES[0]) and file.readline() == LINES[1]
+        with pytest.raises(OSError):
+            file.seek(0)
+        compressed = file.compressed
+    assert file.closed and compressed.closed
@@ -0,0 +1,76 @@
+import random
+
+import numpy as np
+
+from clef.retrieval.models.tfidf import TFIDFRetriever, retrieve_relevant_documents_tfidf
+
+WORDS = ['gaza', 'egypt', 'minister', 'health', 'denies', 'confirms', 'attack', 'official', 'statement', 'reports', 'fake', 'news', 'today', 'border', 'aid']
+
+
+def make_dataset(n_rumors=12, seed=0):
+    rng = random.Random(seed)
+    dataset = []
+    for i in range(n_rumors):
+        timeline = [
+            [f'https://twitter.com/acc{rng.randrange(5)}', str(1000 + 50*i + j), ' '.join(rng.choices(WORDS, k=rng.randrange(3, 12)))]
+            for j in range(rng.randrange(0, 25))
+        ]
+        dataset.append({'id': f'AuRED_{i}', 'rumor': ' '.join(rng.choices(WORDS, k=6)), 'timeline': timeline})
+    return dataset
+
+
+def reference_global(retriever, rumor_id, claim, timeline):
+    # the per-rumor global scoring before retrieve_batch: score the timeline rows, argsort()[::-1]
+    # (with a stable sort, numpy's default sort does not fix the order of ties)
+    rows, tweet_ids = [], []
+    for post in timeline:
+        if retriever.doc_rows[post[1]] not in rows:
+            rows.append(retriever.doc_rows[post[1]])
+            tweet_ids.append(post[1])
+    query = retriever.vectorizer.transform([claim])
+    scores = (retriever.doc_matrix[rows] @ query.T).toarray().ravel()
+    return [[rumor_id, tweet_ids[idx], i, scores[idx]] for i, idx in enumerate(scores.argsort(kind='stable')[::-1][:retriever.k])]
+
+
+def test_per_rumor_matches_baseline_function():
+    for item in make_dataset():
+        if not item['timeline']:
+            continue
+        for k in (1, 5, 20):
+            expected = retrieve_relevant_documents_tfidf(item['id'], item['rumor'], item['timeline'], k=k)
+            assert TFIDFRetriever(k).retrieve(item['id'], item['rumor'], item['timeline']) == expected
+
+
+def test_global_batch_matches_per_rumor():
+    dataset = make_dataset()
+    for k in (1, 5, 20):
+        retriever = TFIDFRetriever(k, global_index=True)
+        retriever.prepare(dataset)
+
+        batched = retriever.retrieve_many(dataset)
+        single = [row for item in dataset for row in retriever.retrieve(item['id'], item['rumor'], item['timeline'])]
+        reference = [row for item in dataset for row in reference_global(retriever, item['id'], item['rumor'], item['timeline'])]
+
+        assert batched == single
+        assert [row[:3] for row in batched] == [row[:3] for row in reference]
+        np.testing.assert_allclose([row[3] for row in batched], [row[3] for row in reference], rtol=0, atol=1e-12)
+
+
+def test_global_ties_rank_later_post_first():
+    timeline = [['a', '1', 'gaza aid'], ['b', '2', 'border news'], ['c', '3', 'gaza aid']]
+    dataset = [{'id': 'AuRED_0', 'rumor': 'gaza aid today', 'timeline': timeline}]
+    retriever = TFIDFRetriever(3, global_index=True)
+    retriever.prepare(dataset)
+
+    assert [row[1] for row in retriever.retrieve_many(dataset)] == ['3', '1', '2']
+
+
+def test_global_index_persisted(tmp_path):
+    dataset = make_dataset()
+    built = TFIDFRetriever(5, global_index=True, index_dir=str(tmp_path))
+    built.prepare(dataset)
+    loaded = TFIDFRetriever(5, global_index=True, index_dir=str(tmp_path))
+    loaded.prepare(dataset)
+
+    assert len(list(tmp_path.glob('tfidf-*.pkl'))) == 1
+    assert loaded.retrieve_many(dataset) == built.retrieve_many(dataset)
@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+
+from clef.utils.data_loading import write_trec_format_output
+from clef.utils.trec import parse_trec_run, read_trec_run, run_from_rows, sidecar_path, write_trec_run
+
+ROWS = [
+    ['AuRED_0', '1151', 1, 0.8125],
+    ['AuRED_0', '1174', 2, 0.1 + 0.2],
+    ['AuRED_0', '1140', 3, np.float64(0.25)],
+    ['AuRED_12', '99', 1, 12.5],
+    ['AuRED_12', '1151', 2, -3.0],
+]
+
+
+def assert_runs_equal(run, expected):
+    for column in ('qids', 'docnos', 'ranks', 'scores', 'tags'):
+        np.testing.assert_array_equal(getattr(run, column), getattr(expected, column))
+
+
+def baseline_lines(data, tag):
+    # the line by line writer write_trec_format_output used before
+    return ''.join(f"{rumor_id} Q0 {authority_tweet_id} {rank} {score} {tag}\n" for rumor_id, authority_tweet_id, rank, score in data)
+
+
+def test_written_file_matches_previous_writer(tmp_path):
+    path = tmp_path / 'run.trec.txt'
+    write_trec_format_output(str(path), ROWS, 'TAG')
+    assert path.read_text() == baseline_lines(ROWS, 'TAG')
+
+
+def test_round_trip_with_and_without_sidecar(tmp_path):
+    path = tmp_path / 'run.trec.txt'
+    run = run_from_rows(ROWS, 'TAG')
+    write_trec_run(path, run, sidecar=True)
+
+    assert os.path.exists(sidecar_path(path))
+    assert_runs_equal(read_trec_run(path), run)
+    assert_runs_equal(read_trec_run(path, use_sidecar=False), run)
+    assert_runs_equal(parse_trec_run(path.read_text()), run)
+
+
+def test_sidecar_ignored_after_the_file_changed(tmp_path):
+    path = tmp_path / 'run.trec.txt'
+    write_trec_run(path, run_from_rows(ROWS, 'TAG'), sidecar=True)
+
+    # rewritten by another tool without a sidecar: different content and size
+    changed = run_from_rows(ROWS[:2], 'OTHER')
+    write_trec_run(path, changed)
+    assert_runs_equal(read_trec_run(path), changed)
+
+    # same size, only the modification time differs
+    write_trec_run(path, run_from_rows(ROWS, 'TAG'), sidecar=True)
+    edited = path.read_text().replace('1151', '1152', 1)
+    path.write_text(edited)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert read_trec_run(path).docnos[0] == '1152'
+
+
+def test_quoted_fields_and_other_separators():
+    run = parse_trec_run('AuRED_1 Q0 "55 " 1 0.5 TERRIER\nAuRED_1 Q0 56 2 0.25 TERRIER\n')
+    assert run.docnos.tolist() == ['55', '56']
+
+    tabbed = parse_trec_run('AuRED_1\tQ0\t55\t1\t0.5\tTAG\n\nAuRED_2\tQ0\t7\t1\t1.5\tTAG\n', sep='\t')
+    assert tabbed.qids.tolist() == ['AuRED_1', 'AuRED_2'] and tabbed.scores.tolist() == [0.5, 1.5]